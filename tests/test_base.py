@@ -22,7 +22,11 @@ import unittest
 import utils_tests
 import trappy
 import warnings
-from trappy.base import trace_parser_explode_array, Base
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from trappy.base import trace_parser_explode_array, get_code_md5, Base
+from trappy.ftrace import GenericFTrace
 from trappy import TrappyParseError
 
 sys.path.append(os.path.join(utils_tests.TESTS_DIRECTORY, "..", "trappy"))
@@ -73,6 +77,35 @@ class TestBaseMethods(unittest.TestCase):
         result = trace_parser_explode_array(line, array_lengths)
         self.assertEqual(result, expected)
 
+    def test_get_code_md5_ignores_docs(self):
+        """Test that comments, docstrings and line numbers don't change the md5sum of a function"""
+        def compile_func(source):
+            namespace = {}
+            exec(source, namespace)
+            return namespace["func"]
+
+        func = compile_func("def func(x):\n    return [y + 1 for y in x]\n")
+        documented = compile_func(
+            "\n\ndef func(x):\n    \"\"\"Add 1\"\"\"\n"
+            "    # To each of them\n    return [y + 1 for y in x]\n")
+        changed = compile_func("def func(x):\n    return [y + 2 for y in x]\n")
+
+        self.assertEqual(get_code_md5(func), get_code_md5(documented))
+        self.assertNotEqual(get_code_md5(func), get_code_md5(changed))
+
+    def test_cache_fingerprint_parse_methods(self):
+        """Test that only the methods that parse the events change the cache fingerprint"""
+        class Event(Base):
+            unique_word = "event:"
+
+        fingerprint = Event().cache_fingerprint()
+
+        Event.get_pids = lambda self: []
+        self.assertEqual(Event().cache_fingerprint(), fingerprint)
+
+        Event.finalize_object = lambda self: None
+        self.assertNotEqual(Event().cache_fingerprint(), fingerprint)
+
 class TestBase(utils_tests.SetupDirectory):
     """Incomplete tests for the Base class"""
 
@@ -180,6 +213,41 @@ class TestBase(utils_tests.SetupDirectory):
 
         trappy.unregister_dynamic_ftrace(ftrace_parser)
 
+    def test_parse_fields_differing_from_first_event(self):
+        """TestBase: Events whose fields differ from the first one are parsed like the rest"""
+
+        data = ["a=1 b=foo c=0x10",
+                "a=2 b=bar c=0x20",
+                "b=baz a=3 c=0x30",
+                "a=4 b=Space separated c=0x40",
+                "a=5 c=0x50",
+                "a=06 b=qux c=0x60 d=7",
+                "a=7 b= c=0x70"]
+        in_data = ""
+        for (idx, data_str) in enumerate(data):
+            in_data += "     rcu_preempt-7     [000]    {}: my_event:   {}\n".\
+                       format(73.604532 + idx, data_str)
+
+        with open("trace.txt", "w") as fout:
+            fout.write(in_data)
+
+        ftrace_parser = trappy.register_dynamic_ftrace("MyEvent", "my_event")
+        trace = trappy.FTrace(normalize_time=False)
+        dfr = trace.my_event.data_frame
+        trappy.unregister_dynamic_ftrace(ftrace_parser)
+
+        expected = pd.DataFrame([trace.my_event.generate_data_dict(data_str)
+                                 for data_str in data], index=dfr.index)
+        expected.insert(0, "__line", list(range(len(data))))
+        expected.insert(0, "__cpu", 0)
+        expected.insert(0, "__pid", 7)
+        expected.insert(0, "__comm", "rcu_preempt")
+
+        assert_frame_equal(dfr, expected)
+        self.assertEqual(dfr["b"].iloc[3], "Space separated")
+        self.assertEqual(dfr["a"].iloc[5], "06")
+        self.assertEqual(dfr["c"].dtype, np.int64)
+
     def test_get_dataframe(self):
         """TestBase: Thermal.data_frame["thermal_zone"] exists and
            it contains a known value"""
@@ -188,6 +256,73 @@ class TestBase(utils_tests.SetupDirectory):
         self.assertTrue("thermal_zone" in dfr.columns)
         self.assertEqual(dfr["temp"].iloc[0], 68786)
 
+    def test_parse_arrays_of_different_lengths(self):
+        """TestBase: Arrays are split in columns padded to the longest one"""
+
+        data = ["cpus=000000f0 load={1 2} power=10",
+                "cpus=000000f0 load={3} power=20",
+                "cpus=0000000f load={4 5 6} power=30 extra=1",
+                "cpus=0000000f load={0x7 8} power=40"]
+        in_data = ""
+        for (idx, data_str) in enumerate(data):
+            in_data += "     rcu_preempt-7     [000]    {}: my_event:   {}\n".\
+                       format(73.604532 + idx, data_str)
+
+        with open("trace.txt", "w") as fout:
+            fout.write(in_data)
+
+        ftrace_parser = trappy.register_dynamic_ftrace("MyEvent", "my_event")
+        trace = trappy.FTrace(normalize_time=False)
+        dfr = trace.my_event.data_frame
+        trappy.unregister_dynamic_ftrace(ftrace_parser)
+
+        self.assertListEqual(
+            list(dfr.columns),
+            ["__comm", "__pid", "__cpu", "__line", "cpus", "load0", "load1",
+             "load2", "power", "extra"])
+        self.assertListEqual(dfr["load0"].tolist(), [1, 3, 4, 7])
+        self.assertListEqual(dfr["load1"].tolist(), [2, 0, 5, 8])
+        self.assertListEqual(dfr["load2"].tolist(), [0, 0, 6, 0])
+        self.assertEqual(dfr["load2"].dtype, np.int64)
+
+    def test_parse_in_chunks(self):
+        """TestBase: Parsing the events in chunks creates the same DataFrame"""
+
+        data = ["cpus=000000f0 load={1 2} power=10",
+                "cpus=000000f0 load={3} power=20 name=a",
+                "cpus=0000000f load={4 5 6} power=30 extra=1",
+                "cpus=0000000f load={0x7 8} power=40",
+                "cpus=0000000f power=x"]
+        in_data = ""
+        for (idx, data_str) in enumerate(data):
+            in_data += "     rcu_preempt-7     [000]    {}: my_event:   {}\n".\
+                       format(73.604532 + idx, data_str)
+
+        with open("trace.txt", "w") as fout:
+            fout.write(in_data)
+
+        ftrace_parser = trappy.register_dynamic_ftrace("MyEvent", "my_event")
+        disable_cache = GenericFTrace.disable_cache
+        GenericFTrace.disable_cache = True
+        try:
+            expected = trappy.FTrace(normalize_time=False).my_event.data_frame
+            ftrace_parser.chunk_size = 2
+            trace = trappy.FTrace(normalize_time=False)
+        finally:
+            GenericFTrace.disable_cache = disable_cache
+            trappy.unregister_dynamic_ftrace(ftrace_parser)
+
+        self.assertEqual(trace.my_event.parsed_chunks, [])
+        assert_frame_equal(trace.my_event.data_frame, expected)
+
+    def test_comm_symbols(self):
+        """TestBase: Task names are shared by all the parsers of a trace"""
+        trace = trappy.FTrace()
+
+        self.assertIs(trace.thermal.comm_symbols, trace.cpu_in_power.comm_symbols)
+        self.assertEqual(trace.thermal.data_frame["__comm"].iloc[0],
+                         "kworker/4:1")
+
     def test_write_csv(self):
         """TestBase: Base::write_csv() creates a valid csv"""
         from csv import DictReader
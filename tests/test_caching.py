@@ -21,9 +21,13 @@ import os
 import json
 import shutil
 import sys
+import threading
 import unittest
 import utils_tests
+import numpy as np
+from pandas.testing import assert_frame_equal
 import trappy
+import trappy.cache
 from trappy.ftrace import GenericFTrace
 from trappy.systrace import SysTrace
 
@@ -109,6 +113,356 @@ class TestCaching(utils_tests.SetupDirectory):
         self.assertTrue([r[1].prio for r in cached_dfr.iterrows()] ==
                         [r[1].prio for r in uncached_dfr.iterrows()])
 
+    def test_cache_keeps_dtypes(self):
+        """Test that the cache keeps the exact timestamps and dtypes"""
+        GenericFTrace.disable_cache = False
+        uncached_trace = trappy.FTrace(normalize_time=False)
+        cached_trace = trappy.FTrace(normalize_time=False)
+
+        for name in uncached_trace.class_definitions:
+            self.assertTrue(getattr(cached_trace, name).cached)
+            assert_frame_equal(getattr(cached_trace, name).data_frame,
+                               getattr(uncached_trace, name).data_frame)
+
+    def test_cache_format_changed(self):
+        """Test that a cache in another format is written again"""
+        GenericFTrace.disable_cache = False
+        metadata_path = os.path.join(".trace.txt.cache", "metadata.json")
+
+        try:
+            GenericFTrace.cache_format = "csv"
+            trappy.FTrace()
+            self.assertTrue(os.path.isfile(
+                os.path.join(".trace.txt.cache", "SchedWakeup.csv")))
+        finally:
+            GenericFTrace.cache_format = "mmap"
+
+        trace = trappy.FTrace()
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+        with open(metadata_path) as f:
+            self.assertEqual(json.load(f)["format"], "mmap")
+        self.assertTrue(os.path.isfile(os.path.join(
+            ".trace.txt.cache", "SchedWakeup", "schema.json")))
+
+    def test_cache_mmap(self):
+        """Test that the columns of a cached trace are mapped from the cache"""
+        GenericFTrace.disable_cache = False
+        uncached_dfr = trappy.FTrace().sched_wakeup.data_frame
+        cached_dfr = trappy.FTrace().sched_wakeup.data_frame
+
+        values = cached_dfr["pid"].values
+        self.assertIsInstance(values, np.memmap)
+
+        # Strings are saved as codes in the cache
+        path = os.path.join(".trace.txt.cache", "SchedWakeup")
+        with open(os.path.join(path, "schema.json")) as f:
+            schema = json.load(f)
+        comm = [desc for desc in schema["columns"] if desc["name"] == "comm"]
+        self.assertEqual(comm[0]["type"], "strings")
+
+        # Modifying the DataFrame doesn't modify the cache
+        cached_dfr.iloc[0, cached_dfr.columns.get_loc("pid")] = -1
+        cached_dfr = trappy.FTrace().sched_wakeup.data_frame
+        assert_frame_equal(cached_dfr, uncached_dfr)
+
+    def test_cache_write_interrupted(self):
+        """Test that a cache whose writing failed is not used"""
+        GenericFTrace.disable_cache = False
+        cache_format = trappy.cache.MmapCacheFormat
+        write = cache_format.write
+
+        def failing_write(self, trace_class, path):
+            if trace_class.__class__.__name__ == "SchedWakeup":
+                raise OSError("No space left on device")
+            write(self, trace_class, path)
+
+        cache_format.write = failing_write
+        try:
+            trappy.FTrace()
+        finally:
+            cache_format.write = write
+
+        # Neither the cache nor the temporary files are left behind
+        self.assertEqual([f for f in os.listdir(".") if f.startswith(".")], [])
+
+        trace = trappy.FTrace()
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+        trace = trappy.FTrace()
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+    def _split_trace(self):
+        """Truncate the trace in the middle and return the rest of it"""
+        with open("trace.txt", "rb") as f:
+            trace = f.read()
+        cut = trace.index(b"\n", len(trace) // 2) + 1
+
+        with open("trace.txt", "wb") as f:
+            f.write(trace[:cut])
+
+        return trace[cut:]
+
+    def test_cache_extended(self):
+        """Test that only the lines appended to a cached trace are parsed"""
+        GenericFTrace.disable_cache = True
+        expected = trappy.FTrace(normalize_time=False)
+
+        GenericFTrace.disable_cache = False
+        end = self._split_trace()
+        trace = trappy.FTrace(normalize_time=False)
+        index_path = os.path.join(
+            trace._get_class_cache_path(trace.sched_wakeup_new), "index.npy")
+        index_stat = os.stat(index_path)
+        with open("trace.txt", "ab") as f:
+            f.write(end)
+
+        trace = trappy.FTrace(normalize_time=False)
+        self.assertTrue(trace._cache_extension)
+        self.assertEqual(trace.endtime, expected.endtime)
+        for name in expected.class_definitions:
+            assert_frame_equal(getattr(trace, name).data_frame,
+                               getattr(expected, name).data_frame)
+
+        # The new events were appended to the files of the cache
+        self.assertEqual(os.stat(index_path).st_ino, index_stat.st_ino)
+        self.assertGreater(os.stat(index_path).st_size, index_stat.st_size)
+
+        # The extended cache is used as is afterwards
+        trace = trappy.FTrace(normalize_time=False)
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+        for name in expected.class_definitions:
+            assert_frame_equal(getattr(trace, name).data_frame,
+                               getattr(expected, name).data_frame)
+
+    def test_cache_extended_full_validation(self):
+        """Test that the md5sum of an extended trace is recorded in its cache"""
+        GenericFTrace.disable_cache = False
+        end = self._split_trace()
+        self._parse_with_validation("full")
+        with open("trace.txt", "ab") as f:
+            f.write(end)
+
+        trace = self._parse_with_validation("full")
+        self.assertTrue(trace._cache_extension)
+        with open(os.path.join(".trace.txt.cache", "metadata.json")) as f:
+            self.assertEqual(json.load(f)["md5sum"],
+                             trappy.cache.file_md5("trace.txt"))
+
+        trace = self._parse_with_validation("full")
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+    def test_cache_not_extended_if_modified(self):
+        """Test that a trace modified before growing is parsed again"""
+        GenericFTrace.disable_cache = False
+        end = self._split_trace()
+        trappy.FTrace()
+
+        with open("trace.txt", "r+b") as f:
+            f.seek(os.path.getsize("trace.txt") // 2)
+            f.write(b"X")
+        with open("trace.txt", "ab") as f:
+            f.write(end)
+
+        trace = trappy.FTrace()
+        self.assertFalse(trace._cache_extension)
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+
+    def _parse_with_validation(self, cache_validation):
+        """Parse the trace with a cache validation policy"""
+        try:
+            GenericFTrace.cache_validation = cache_validation
+            return trappy.FTrace()
+        finally:
+            GenericFTrace.cache_validation = "sampled"
+
+    def test_cache_validation_recorded(self):
+        """Test that the cache records how the trace can be validated"""
+        GenericFTrace.disable_cache = False
+        self._parse_with_validation("stat")
+
+        with open(os.path.join(".trace.txt.cache", "metadata.json")) as f:
+            metadata = json.load(f)
+
+        self.assertEqual(metadata["validation"], "stat")
+        self.assertEqual(metadata["size"], os.path.getsize("trace.txt"))
+        for key in ["mtime_ns", "inode", "sampled_md5"]:
+            self.assertIn(key, metadata)
+        # The whole trace is only hashed for the "full" policy
+        self.assertNotIn("md5sum", metadata)
+
+    def test_cache_validation_full(self):
+        """Test that a cache written without the md5sum of the trace is parsed again with a full validation"""
+        GenericFTrace.disable_cache = False
+        trappy.FTrace()
+
+        trace = self._parse_with_validation("full")
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+
+        with open(os.path.join(".trace.txt.cache", "metadata.json")) as f:
+            self.assertIn("md5sum", json.load(f))
+
+        trace = self._parse_with_validation("full")
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+    def test_cache_validation_stat(self):
+        """Test that a change that keeps the size and mtime is only found with a full hash"""
+        GenericFTrace.disable_cache = False
+        trappy.FTrace()
+
+        stat = os.stat("trace.txt")
+        with open("trace.txt", "r+b") as f:
+            f.seek(stat.st_size // 2)
+            f.write(b"X")
+        os.utime("trace.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        trace = self._parse_with_validation("stat")
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+        trace = self._parse_with_validation("full")
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+
+    def test_cache_validation_copied_trace(self):
+        """Test that a copied trace is validated with a sampled hash"""
+        GenericFTrace.disable_cache = False
+        trappy.FTrace()
+
+        shutil.copy("trace.txt", "trace_copy.txt")
+        os.utime("trace_copy.txt", (0, 0))
+        os.rename("trace_copy.txt", "trace.txt")
+
+        trace = self._parse_with_validation("sampled")
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+        # The stat of the trace is still the one of the original file
+        trace = self._parse_with_validation("stat")
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+
+    def test_cache_dir(self):
+        """Test that the cache can be kept in a central directory"""
+        GenericFTrace.disable_cache = False
+        os.mkdir("trace_copy")
+        shutil.copy("trace.txt", os.path.join("trace_copy", "trace.txt"))
+
+        trace = trappy.FTrace(cache_dir="cache")
+        self.assertFalse(os.path.exists(".trace.txt.cache"))
+        self.assertEqual(self._list_cache_entries("cache"),
+                         [os.path.basename(trace._trace_cache_path())])
+
+        # A copy of the trace uses the same cache
+        trace = trappy.FTrace("trace_copy", cache_dir="cache")
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+        self.assertEqual(len(self._list_cache_entries("cache")), 1)
+
+    def test_cache_dir_same_sampled_md5(self):
+        """Test that traces with the same sampled hash don't share their cache"""
+        GenericFTrace.disable_cache = False
+        os.mkdir("trace_copy")
+        copy_path = os.path.join("trace_copy", "trace.txt")
+        with open("trace.txt", "rb") as fin:
+            content = bytearray(fin.read())
+        # Change a digit of a value in the middle of the trace
+        pos = content.index(b"=", len(content) // 2) + 1
+        content[pos] = ord(b"1") if content[pos] != ord(b"1") else ord(b"2")
+        with open(copy_path, "wb") as fout:
+            fout.write(content)
+
+        sample_sizes = (trappy.cache.SAMPLE_EDGE_SIZE,
+                        trappy.cache.SAMPLE_BLOCK_SIZE)
+        trappy.cache.SAMPLE_EDGE_SIZE = trappy.cache.SAMPLE_BLOCK_SIZE = 16
+        try:
+            self.assertEqual(trappy.cache.sampled_md5("trace.txt"),
+                             trappy.cache.sampled_md5(copy_path))
+
+            trappy.FTrace(cache_dir="cache")
+            trace = trappy.FTrace("trace_copy", cache_dir="cache")
+        finally:
+            (trappy.cache.SAMPLE_EDGE_SIZE,
+             trappy.cache.SAMPLE_BLOCK_SIZE) = sample_sizes
+
+        self.assertFalse(any(c.cached for c in trace.trace_classes))
+        self.assertEqual(len(self._list_cache_entries("cache")), 2)
+
+    @staticmethod
+    def _list_cache_entries(cache_dir):
+        """Return the traces cached in a central cache directory"""
+        return [name for name in os.listdir(cache_dir)
+                if not name.startswith(".")]
+
+    def test_cache_replaced_under_lock(self):
+        """Test that a cache is only replaced once the processes adding events to it are done"""
+        GenericFTrace.disable_cache = False
+        trace = trappy.FTrace()
+        cache_path = trace._trace_cache_path()
+        old_inode = os.stat(cache_path).st_ino
+
+        GenericFTrace.disable_cache = True
+        trace = trappy.FTrace()
+        GenericFTrace.disable_cache = False
+
+        writer = threading.Thread(target=trace._update_cache)
+        with trappy.cache.lock_cache_dir(cache_path):
+            writer.start()
+            writer.join(0.5)
+            self.assertTrue(writer.is_alive())
+            self.assertEqual(os.stat(cache_path).st_ino, old_inode)
+        writer.join()
+
+        self.assertNotEqual(os.stat(cache_path).st_ino, old_inode)
+        self.assertEqual([name for name in os.listdir(".")
+                          if name.startswith(".trace.txt.cache")],
+                         [".trace.txt.cache"])
+        trace = trappy.FTrace()
+        self.assertTrue(all(c.cached for c in trace.trace_classes))
+
+    def test_cache_lazy(self):
+        """Test that a lazy trace caches the events that are accessed"""
+        GenericFTrace.disable_cache = False
+        trace = trappy.FTrace(lazy=True)
+        metadata_path = os.path.join(trace._trace_cache_path(), "metadata.json")
+
+        with open(metadata_path) as fin:
+            self.assertEqual(json.load(fin)["events"], {})
+
+        dfr = trace.sched_wakeup.data_frame
+        with open(metadata_path) as fin:
+            self.assertEqual(list(json.load(fin)["events"]), ["SchedWakeup"])
+
+        trace = trappy.FTrace(lazy=True)
+        self.assertTrue(trace.sched_wakeup.cached)
+        self.assertFalse(trace.sched_switch.cached)
+        assert_frame_equal(trace.sched_wakeup.data_frame, dfr)
+
+    def test_cache_dir_env(self):
+        """Test that the central cache can be set in the environment"""
+        GenericFTrace.disable_cache = False
+        os.environ["TRAPPY_CACHE_DIR"] = "cache"
+        try:
+            trace = trappy.FTrace()
+        finally:
+            del os.environ["TRAPPY_CACHE_DIR"]
+
+        self.assertEqual(trace.cache_dir, "cache")
+        self.assertFalse(os.path.exists(".trace.txt.cache"))
+        self.assertEqual(len(self._list_cache_entries("cache")), 1)
+
+    def test_cache_dir_eviction(self):
+        """Test that the least recently used traces are evicted"""
+        GenericFTrace.disable_cache = False
+        trace = trappy.FTrace(cache_dir="cache")
+        old_path = trace._trace_cache_path()
+        os.utime(old_path, (0, 0))
+
+        size_limit = GenericFTrace.cache_size_limit
+        GenericFTrace.cache_size_limit = 1
+        try:
+            trace = trappy.SysTrace("trace.html", cache_dir="cache")
+        finally:
+            GenericFTrace.cache_size_limit = size_limit
+
+        # The cache that was just written is always kept
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(self._list_cache_entries("cache"),
+                         [os.path.basename(trace._trace_cache_path())])
+
     def test_invalid_cache_overwritten(self):
         """Test a cache with a bad checksum is overwritten"""
         # This is a directory so we can't use the files_to_copy arg of
@@ -140,7 +494,10 @@ class TestCaching(utils_tests.SetupDirectory):
         trace = trappy.FTrace()
 
         # Check that the modified md5sum was overwritten
-        self.assertNotEqual(read_metadata()["md5sum"], md5sum_inc,
+        metadata = read_metadata()
+        self.assertIn("validation", metadata,
+                      "The invalid ftrace cache wasn't overwritten")
+        self.assertNotEqual(metadata.get("md5sum"), md5sum_inc,
                             "The invalid ftrace cache wasn't overwritten")
 
     def test_cache_dynamic_events(self):
@@ -165,6 +522,49 @@ class TestCaching(utils_tests.SetupDirectory):
 
         trappy.unregister_dynamic_ftrace(parse_class)
 
+    def test_cache_parser_changed(self):
+        """Test that only the events whose parser changed are parsed again"""
+        GenericFTrace.disable_cache = False
+        trappy.FTrace()
+
+        sched_wakeup_class = trappy.sched.SchedWakeup
+        create_dataframe = sched_wakeup_class.create_dataframe
+        def new_create_dataframe(self):
+            create_dataframe(self)
+        try:
+            sched_wakeup_class.create_dataframe = new_create_dataframe
+            trace = trappy.FTrace()
+        finally:
+            sched_wakeup_class.create_dataframe = create_dataframe
+
+        for trace_class in trace.trace_classes:
+            self.assertEqual(trace_class.cached,
+                             not isinstance(trace_class, sched_wakeup_class))
+
+        # The cache now has the events of the changed parser, so they are
+        # parsed again with the original one
+        trace = trappy.FTrace()
+        self.assertFalse(trace.sched_wakeup.cached)
+        self.assertEqual(len(trace.sched_wakeup.data_frame), 2)
+
+    def test_cache_parse_raw_changed(self):
+        """Test that changing parse_raw invalidates the cache of an event"""
+        GenericFTrace.disable_cache = False
+
+        parse_class = trappy.register_dynamic_ftrace("DynamicEvent",
+                                                     "dynamic_test_key")
+        trappy.FTrace()
+        trappy.unregister_dynamic_ftrace(parse_class)
+
+        parse_class = trappy.register_dynamic_ftrace("DynamicEvent",
+                                                     "dynamic_test_key",
+                                                     parse_raw=True)
+        trace = trappy.FTrace()
+        trappy.unregister_dynamic_ftrace(parse_class)
+
+        self.assertFalse(trace.dynamic_event.cached)
+        self.assertTrue(trace.sched_wakeup.cached)
+
     def test_cache_normalize_time(self):
         """Test that caching doesn't break normalize_time"""
         GenericFTrace.disable_cache = False
@@ -255,7 +655,7 @@ class TestCaching(utils_tests.SetupDirectory):
         number_of_trace_categories = 36
         self.assertEqual(len(os.listdir(cache_dir)), number_of_trace_categories)
 
-        os.remove(os.path.join(cache_dir, 'SchedWakeup.csv'))
+        shutil.rmtree(trace._get_class_cache_path(trace.sched_wakeup))
         self.assertEqual(len(os.listdir(cache_dir)), number_of_trace_categories - 1)
 
         # Generate trace again, should regenerate only the missing item
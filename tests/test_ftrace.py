@@ -17,6 +17,7 @@ from __future__ import division
 from __future__ import print_function
 
 from builtins import str
+import json
 import matplotlib
 import os
 import pandas as pd
@@ -272,6 +273,27 @@ class TestFTrace(BaseTestThermal):
         self.assertEqual(counts["cpu_in_power"], 134)
         self.assertEqual(counts["cpu_out_power"], 134)
 
+    def test_apply_callbacks_batch(self):
+        """Test apply_callbacks() with runs of events"""
+
+        rows = []
+        def row_fn(data):
+            rows.append(data["__line"])
+
+        runs = []
+        def run_fn(data):
+            self.assertEqual(len(data["Index"]), len(data["__line"]))
+            runs.append(data["__line"])
+
+        trace = trappy.FTrace()
+        trace.apply_callbacks({"cpu_in_power": row_fn, "thermal": row_fn})
+        trace.apply_callbacks({"cpu_in_power": run_fn, "thermal": run_fn},
+                              batch=True)
+
+        self.assertTrue(len(runs) < len(rows))
+        self.assertEqual([line for run in runs for line in run], rows)
+        self.assertEqual(rows, sorted(rows))
+
     def test_plot_freq_hists(self):
         """Test that plot_freq_hists() doesn't bomb"""
 
@@ -489,6 +511,338 @@ class TestFTraceSched(utils_tests.SetupDirectory):
 
         self.assertEqual(trace.thermal.data_frame.index[0], 473.527906)
 
+    def test_ftrace_unparsed_lines_set_time_limits(self):
+        """Lines that no parser consumes still set the start and end of the trace"""
+        trace = trappy.FTrace(scope="custom", events=["sched_stat_sleep"],
+                              normalize_time=False)
+
+        self.assertEqual(trace.basetime, 34.896920)
+        self.assertEqual(trace.endtime, 34.901511)
+        self.assertEqual(trace.sched_stat_sleep.data_frame["__line"].iloc[0], 1)
+
+class TestFTraceParallel(utils_tests.SetupDirectory):
+    """Tests for parsing a trace with a pool of processes"""
+
+    def __init__(self, *args, **kwargs):
+        super(TestFTraceParallel, self).__init__(
+             [("trace_sched.txt", "trace.txt"),
+              ("trace_systrace.html", "trace.html")],
+             *args,
+             **kwargs)
+
+    def setUp(self):
+        super(TestFTraceParallel, self).setUp()
+        # Compare against a fresh parse, not the cache of the first trace
+        trappy.ftrace.GenericFTrace.disable_cache = True
+
+    def assert_same_trace(self, trace1, trace2):
+        self.assertEqual(trace1.basetime, trace2.basetime)
+        self.assertEqual(trace1.endtime, trace2.endtime)
+
+        for name in trace1.class_definitions:
+            dfr1 = getattr(trace1, name).data_frame
+            dfr2 = getattr(trace2, name).data_frame
+            pd.testing.assert_frame_equal(dfr1, dfr2, check_exact=True)
+
+    def test_parallel_ftrace(self):
+        """FTrace gives the same result when parsed in parallel"""
+        trace = trappy.FTrace(normalize_time=False)
+
+        for parallel in (2, 7):
+            par_trace = trappy.FTrace(normalize_time=False, parallel=parallel)
+            self.assert_same_trace(trace, par_trace)
+
+    def test_parallel_systrace(self):
+        """SysTrace gives the same result when parsed in parallel"""
+        trace = trappy.SysTrace("trace.html")
+        par_trace = trappy.SysTrace("trace.html", parallel=3)
+
+        self.assert_same_trace(trace, par_trace)
+
+class TestLoadTraces(utils_tests.SetupDirectory):
+    """Tests for trappy.load_traces()"""
+
+    def __init__(self, *args, **kwargs):
+        super(TestLoadTraces, self).__init__(
+             [("trace_sched.txt", "trace.txt"),
+              ("../doc/trace.txt", "trace_thermal.txt")],
+             *args,
+             **kwargs)
+
+    def setUp(self):
+        super(TestLoadTraces, self).setUp()
+        trappy.ftrace.GenericFTrace.disable_cache = False
+
+    def assert_same_traces(self, traces, expected):
+        self.assertEqual(len(traces), len(expected))
+        for (trace, expected_trace) in zip(traces, expected):
+            self.assertEqual(trace.trace_path, expected_trace.trace_path)
+            for name in expected_trace.class_definitions:
+                pd.testing.assert_frame_equal(
+                    getattr(trace, name).data_frame,
+                    getattr(expected_trace, name).data_frame)
+
+    def test_load_traces(self):
+        """load_traces() gives the traces in order, read from their cache"""
+        paths = ["trace_thermal.txt", "trace.txt", "trace_thermal.txt"]
+        traces = trappy.load_traces(paths, workers=2, scope="sched")
+
+        self.assertTrue(all(c.cached for trace in traces
+                            for c in trace.trace_classes))
+
+        trappy.ftrace.GenericFTrace.disable_cache = True
+        self.assert_same_traces(traces, [trappy.FTrace(path, scope="sched")
+                                         for path in paths])
+
+    def test_load_traces_window(self):
+        """load_traces() applies the window to the cached traces"""
+        paths = ["trace.txt", "trace_thermal.txt"]
+        traces = trappy.load_traces(paths, workers=2, window=(0.5, 1))
+
+        self.assertEqual(len(traces[1].thermal.data_frame), 4)
+        self.assertTrue(all(c.cached for trace in traces
+                            for c in trace.trace_classes))
+
+        trappy.ftrace.GenericFTrace.disable_cache = True
+        self.assert_same_traces(traces, [trappy.FTrace(path, window=(0.5, 1))
+                                         for path in paths])
+
+class TestFTraceWindowParsing(BaseTestThermal):
+    """Tests for parsing only the window of a trace"""
+
+    def setUp(self):
+        super(TestFTraceWindowParsing, self).setUp()
+        trappy.ftrace.GenericFTrace.disable_cache = True
+        self.index_interval = trappy.ftrace.TIME_INDEX_INTERVAL
+        # Make the index dense enough to seek in a small trace
+        trappy.ftrace.TIME_INDEX_INTERVAL = 4096
+
+    def tearDown(self):
+        trappy.ftrace.TIME_INDEX_INTERVAL = self.index_interval
+        super(TestFTraceWindowParsing, self).tearDown()
+
+    def assert_window_of(self, trace, win_trace):
+        lower, upper = win_trace.max_window
+
+        for name in trace.class_definitions:
+            dfr = getattr(trace, name).data_frame
+            in_window = dfr.index >= lower
+            if upper is not None:
+                in_window &= dfr.index <= upper
+            pd.testing.assert_frame_equal(getattr(win_trace, name).data_frame,
+                                          dfr[in_window], check_exact=True)
+
+        self.assertEqual(win_trace.basetime, trace.basetime)
+        self.assertEqual(win_trace.endtime, trace.endtime)
+
+    def test_window_parsing(self):
+        """Parsing the window of a trace gives the same events as the whole trace"""
+        trace = trappy.FTrace(normalize_time=False)
+
+        for parallel in (None, 3):
+            win_trace = trappy.FTrace(normalize_time=False, window=(1, 1.5),
+                                      parallel=parallel)
+            self.assertTrue(win_trace._parsed_partially)
+            self.assert_window_of(trace, win_trace)
+
+            win_trace = trappy.FTrace(normalize_time=False, parallel=parallel,
+                                      abs_window=(1585, 1589.1))
+            self.assertTrue(win_trace._parsed_partially)
+            self.assert_window_of(trace, win_trace)
+
+    def test_window_parsing_empty(self):
+        """Events outside of the window parsed keep their columns"""
+        trace = trappy.FTrace(normalize_time=False)
+
+        for window in [(0, 0.0001), (1.5, 1.5001)]:
+            win_trace = trappy.FTrace(normalize_time=False, window=window)
+            self.assertTrue(win_trace._parsed_partially)
+            self.assertTrue(any(len(getattr(trace, name).data_frame) and
+                                not len(getattr(win_trace, name).data_frame)
+                                for name in trace.class_definitions))
+            self.assert_window_of(trace, win_trace)
+
+    def test_window_parsing_reads_part_of_trace(self):
+        """The lines outside of a window near the start of a trace are only sampled"""
+        with open("trace.txt") as fin:
+            lines = fin.readlines()
+        tail_line = lines[len(lines) * 3 // 4]
+
+        sampled = []
+        sample_lines = trappy.ftrace._sample_lines
+        def record_lines(lines, size=None):
+            lines = list(lines)
+            sampled.extend(lines)
+            return sample_lines(lines, size)
+
+        sample_sizes = (trappy.ftrace.WINDOW_SAMPLE_SIZE,
+                        trappy.ftrace.WINDOW_SAMPLE_BLOCKS)
+        try:
+            trappy.ftrace.WINDOW_SAMPLE_SIZE = 1024
+            trappy.ftrace.WINDOW_SAMPLE_BLOCKS = 2
+            trappy.ftrace._sample_lines = record_lines
+            win_trace = trappy.FTrace(window=(0, 0.1))
+        finally:
+            (trappy.ftrace.WINDOW_SAMPLE_SIZE,
+             trappy.ftrace.WINDOW_SAMPLE_BLOCKS) = sample_sizes
+            trappy.ftrace._sample_lines = sample_lines
+
+        self.assertTrue(win_trace._parsed_partially)
+        self.assertTrue(sampled)
+        self.assertLess(sum(len(line) for line in sampled),
+                        os.path.getsize("trace.txt") // 10)
+        self.assertNotIn(tail_line, sampled)
+
+    def test_window_not_cached(self):
+        """Traces parsed partially are not cached"""
+        trappy.ftrace.GenericFTrace.disable_cache = False
+
+        win_trace = trappy.FTrace(window=(1, 1.5))
+        self.assertFalse(os.path.exists(".trace.txt.cache"))
+
+        trappy.FTrace()
+        with open(os.path.join(".trace.txt.cache", "metadata.json")) as fin:
+            self.assertTrue(len(json.load(fin)["time_index"]) > 1)
+
+        trace = trappy.FTrace(window=(1, 1.5))
+        pd.testing.assert_series_equal(trace.thermal.data_frame["temp"],
+                                       win_trace.thermal.data_frame["temp"])
+
+class TestFTraceIterEvents(BaseTestThermal):
+    """Tests for GenericFTrace.iter_events()"""
+
+    def setUp(self):
+        super(TestFTraceIterEvents, self).setUp()
+        trappy.ftrace.GenericFTrace.disable_cache = True
+        self.trace = trappy.FTrace()
+
+    def assert_events_of(self, events, name, dfr):
+        events = [event for event in events if event.name == name]
+        self.assertEqual(len(events), len(dfr))
+
+        self.assertEqual([event.time for event in events], dfr.index.tolist())
+        self.assertEqual([event.line for event in events],
+                         dfr["__line"].tolist())
+        self.assertEqual([event.comm for event in events],
+                         dfr["__comm"].tolist())
+        for col in ["temp", "id"]:
+            self.assertEqual([event.fields[col] for event in events],
+                             dfr[col].tolist())
+
+    def test_iter_events(self):
+        """iter_events() yields the events of the DataFrames in trace order"""
+        events = list(self.trace.iter_events(events=["thermal", "cpu_in_power"]))
+
+        self.assertEqual(set(event.name for event in events),
+                         set(["thermal", "cpu_in_power"]))
+        self.assertEqual([event.line for event in events],
+                         sorted(event.line for event in events))
+        self.assert_events_of(events, "thermal", self.trace.thermal.data_frame)
+
+    def test_iter_events_window(self):
+        """iter_events() only yields the events in the window"""
+        events = list(self.trace.iter_events(events="thermal", window=(1, 1.5)))
+
+        self.assertTrue(len(events) > 0)
+        self.assert_events_of(events, "thermal",
+                              self.trace.thermal.data_frame[1:1.5])
+
+    def test_iter_events_batch_fields(self):
+        """iter_events() yields the same fields whichever batch the events are in"""
+        in_data = """     kworker/4:1-397   [004]   720.741349: my_event: a=1 load={1 2}
+     kworker/4:1-397   [004]   720.741350: my_event: a=2 load={3 4}
+     kworker/4:1-397   [004]   720.741351: my_event: a=3 load={5 6}
+     kworker/4:1-397   [004]   720.741352: my_event: a=4 b=7 load={7 8 9}
+     kworker/4:1-397   [004]   720.741353: my_event: a=5 b=8 load={10 11 12}
+"""
+        with open("trace.txt", "w") as fout:
+            fout.write(in_data)
+
+        parser = trappy.register_dynamic_ftrace("MyEvent", "my_event")
+        batch_lines = trappy.ftrace.ITER_BATCH_LINES
+        try:
+            trappy.ftrace.ITER_BATCH_LINES = 2
+            trace = trappy.FTrace(normalize_time=False)
+            events = list(trace.iter_events(events="my_event"))
+        finally:
+            trappy.ftrace.ITER_BATCH_LINES = batch_lines
+            trappy.unregister_dynamic_ftrace(parser)
+
+        dfr = trace.my_event.data_frame
+        columns = [col for col in dfr.columns if not col.startswith("__")]
+        self.assertEqual(len(events), len(dfr))
+        self.assertEqual([event.time for event in events], dfr.index.tolist())
+        for (event, (_, row)) in zip(events, dfr.iterrows()):
+            self.assertEqual(list(event.fields), columns)
+            pd.testing.assert_series_equal(
+                pd.Series(event.fields, dtype=float), row[columns].astype(float),
+                check_names=False)
+
+        self.assertEqual(events[0].fields["load2"], 0)
+        self.assertTrue(pd.isnull(events[0].fields["b"]))
+
+class TestFTraceTimeline(BaseTestThermal):
+    """Tests for GenericFTrace.timeline()"""
+
+    def test_timeline(self):
+        """timeline() merges the events in the order of the trace"""
+        trace = trappy.FTrace()
+        timeline = trace.timeline(["thermal", "cpu_in_power"])
+        thermal = trace.thermal.data_frame
+        cpu_in_power = trace.cpu_in_power.data_frame
+
+        self.assertEqual(len(timeline), len(thermal) + len(cpu_in_power))
+        self.assertEqual(timeline["__line"].tolist(),
+                         sorted(timeline["__line"].tolist()))
+        self.assertEqual(list(timeline["__event"].cat.categories),
+                         ["thermal", "cpu_in_power"])
+        self.assertIn("temp", timeline.columns)
+        self.assertIn("load0", timeline.columns)
+
+        thermal_rows = timeline[timeline["__event"] == "thermal"]
+        # Columns that the other events don't have can hold NaN
+        pd.testing.assert_frame_equal(
+            thermal_rows[thermal.columns], thermal, check_dtype=False)
+        self.assertTrue(thermal_rows["load0"].isnull().all())
+
+        self.assertIs(trace.timeline(["thermal", "cpu_in_power"]), timeline)
+
+    def test_timeline_unknown_event(self):
+        """timeline() fails with events that are not in the trace"""
+        trace = trappy.FTrace()
+        with self.assertRaises(ValueError):
+            trace.timeline(["thermal", "not_an_event"])
+
+class TestFTraceLazy(BaseTestThermal):
+    """Tests for the lazy parse of a trace"""
+
+    def setUp(self):
+        super(TestFTraceLazy, self).setUp()
+        trappy.ftrace.GenericFTrace.disable_cache = True
+
+    def test_lazy_ftrace(self):
+        """A lazy FTrace creates the DataFrame of an event when it's accessed"""
+        trace = trappy.FTrace()
+        lazy_trace = trappy.FTrace(lazy=True)
+
+        self.assertEqual(len(lazy_trace.thermal.time_array),
+                         len(trace.thermal.data_frame))
+        self.assertEqual(lazy_trace.basetime, trace.basetime)
+        self.assertEqual(lazy_trace.endtime, trace.endtime)
+
+        for name in trace.class_definitions:
+            pd.testing.assert_frame_equal(getattr(lazy_trace, name).data_frame,
+                                          getattr(trace, name).data_frame)
+        self.assertEqual(len(lazy_trace.thermal.time_array), 0)
+
+    def test_lazy_ftrace_window(self):
+        """The window is applied to the events of a lazy FTrace"""
+        trace = trappy.FTrace(window=(1, 1.5))
+        lazy_trace = trappy.FTrace(window=(1, 1.5), lazy=True)
+
+        pd.testing.assert_frame_equal(lazy_trace.thermal.data_frame,
+                                      trace.thermal.data_frame)
+
 @unittest.skipUnless(utils_tests.trace_cmd_installed(),
                      "trace-cmd not installed")
 class TestTraceDat(utils_tests.SetupDirectory):
@@ -532,6 +886,113 @@ class TestTraceDat(utils_tests.SetupDirectory):
         self.assertTrue(len(dfr) > 0)
         self.assertFalse(os.path.exists("trace.dat"))
 
+    def test_pipe_reader(self):
+        """FTrace() can parse the output of trace-cmd report from a pipe"""
+        trappy.ftrace.GenericFTrace.disable_cache = True
+
+        trace = trappy.FTrace()
+        piped_trace = trappy.FTrace(dat_reader="pipe")
+
+        self.assertEqual(piped_trace.metadata, trace.metadata)
+        self.assertEqual(piped_trace.basetime, trace.basetime)
+        pd.testing.assert_frame_equal(piped_trace.thermal.data_frame,
+                                      trace.thermal.data_frame)
+        self.assertFalse(os.path.isfile("trace.txt"))
+
+    def test_pipe_reader_not_parallel(self):
+        """A trace can't be read from a pipe in parallel"""
+        with self.assertRaises(ValueError):
+            trappy.FTrace(dat_reader="pipe", parallel=2)
+
+class TestTraceDatNative(utils_tests.SetupDirectory):
+    """Test reading trace.dat files without trace-cmd"""
+    def __init__(self, *args, **kwargs):
+        super(TestTraceDatNative, self).__init__(
+            [("trace.dat", "trace.dat"),
+             ("trace_idle.dat", "trace_idle.dat"),
+             ("raw_trace.dat", "raw_trace.dat")],
+            *args, **kwargs)
+
+    def setUp(self):
+        super(TestTraceDatNative, self).setUp()
+        trappy.ftrace.GenericFTrace.disable_cache = True
+
+    def test_cpu_idle(self):
+        """The native reader decodes the fields of the events"""
+        trace = trappy.FTrace("trace_idle.dat", normalize_time=False,
+                              dat_reader="native")
+        dfr = trace.cpu_idle.data_frame
+
+        self.assertEqual(len(dfr), 17)
+        self.assertEqual(dfr.index[0], 162534.2157642)
+        self.assertEqual(dfr.index[-1], 162534.22094704)
+        self.assertEqual(dfr["state"].tolist()[:4], [2, -1, 2, -1])
+        self.assertEqual(dfr["cpu_id"].tolist()[:4], [5, 2, 2, 1])
+        self.assertEqual(dfr["__comm"].iloc[0], "<idle>")
+        self.assertEqual(trace.basetime, 162534.2157418)
+        self.assertEqual(trace._cpus, "6")
+
+    def test_raw_event(self):
+        """Events parsed raw get the fields of the event"""
+        trace = trappy.FTrace("raw_trace.dat", normalize_time=False,
+                              dat_reader="native")
+        dfr = trace.sched_switch.data_frame
+
+        self.assertEqual(dfr.index[0], 106439.67559134)
+        self.assertEqual(dfr["__comm"].iloc[0], "ls")
+        self.assertEqual(dfr["__pid"].iloc[0], 4734)
+        self.assertEqual(dfr["__cpu"].iloc[0], 2)
+        self.assertEqual(dfr["prev_comm"].iloc[0], "trace-cmd")
+        self.assertEqual(dfr["prev_state"].iloc[0], 1024)
+        self.assertEqual(dfr["next_comm"].iloc[0], "migration/2")
+        self.assertEqual(dfr["next_prio"].iloc[0], 0)
+
+    def test_constant_keyval_text(self):
+        """Print fmts with constant key=value text are decoded as text"""
+        trace_dat = trappy.tracedat.TraceDat("trace_idle.dat")
+        event_format = trace_dat.get_format("cpu_idle")
+        event_format.print_fmt = "type=0 " + event_format.print_fmt
+        records = trace_dat.read_records()
+        sel = records["id"] == event_format.id
+        event_records = {key: values[sel] for (key, values) in records.items()}
+
+        columns, data = trace_dat.decode_event(event_format, event_records)
+        trace_dat.close()
+
+        self.assertIsNone(columns)
+        self.assertEqual(data[0], "type=0 state=2 cpu_id=5")
+        parser = trappy.idle.CpuIdle()
+        self.assertEqual(parser.generate_data_dict(data[0]),
+                         {"type": 0, "state": 2, "cpu_id": 5})
+
+    def test_do_not_txt(self):
+        """The native reader doesn't need trace-cmd or a trace.txt"""
+        dfr = trappy.FTrace(dat_reader="native").thermal.data_frame
+
+        self.assertEqual(len(dfr), 6)
+        self.assertEqual(dfr["thermal_zone"].iloc[0], "exynos-therm")
+        self.assertEqual(dfr["temp"].iloc[0], 53875)
+        self.assertFalse(os.path.isfile("trace.txt"))
+
+    def test_cache(self):
+        """Traces read natively are cached"""
+        expected = trappy.FTrace("trace_idle.dat", dat_reader="native")
+
+        trappy.ftrace.GenericFTrace.disable_cache = False
+        trappy.FTrace("trace_idle.dat", dat_reader="native")
+        with open(os.path.join(".trace_idle.dat.cache", "metadata.json")) as fin:
+            self.assertFalse("time_index" in json.load(fin))
+
+        trace = trappy.FTrace("trace_idle.dat", dat_reader="native")
+        self.assertTrue(trace.cpu_idle.cached)
+        pd.testing.assert_frame_equal(trace.cpu_idle.data_frame,
+                                      expected.cpu_idle.data_frame)
+
+    def test_unknown_dat_reader(self):
+        """FTrace() rejects unknown dat readers"""
+        with self.assertRaises(ValueError):
+            trappy.FTrace(dat_reader="foo")
+
 class TestTraceTxtNoTrailingLine(utils_tests.SetupDirectory):
     """Test that we don't produce garbage when trace.txt has no trailing line"""
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,106 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os
+import utils_tests
+from pandas.testing import assert_frame_equal
+
+import trappy
+from trappy.ftrace import GenericFTrace
+
+class TestLiveTrace(utils_tests.SetupDirectory):
+
+    def __init__(self, *args, **kwargs):
+        super(TestLiveTrace, self).__init__(
+            [("trace_sched.txt", "trace.txt")],
+            *args,
+            **kwargs)
+
+    def setUp(self):
+        super(TestLiveTrace, self).setUp()
+
+        with open("trace.txt", "rb") as fin:
+            self.trace = fin.read()
+        GenericFTrace.disable_cache = True
+        self.expected = trappy.FTrace()
+
+    def _write(self, begin, end):
+        """Append the bytes of the trace between begin and end"""
+        with open("trace.txt", "ab") as fout:
+            fout.write(self.trace[begin:end])
+
+    def test_live_trace_poll(self):
+        """Test that a LiveTrace parses the lines appended to the trace"""
+        middle = self.trace.index(b"\n", len(self.trace) // 2) + 1
+        os.remove("trace.txt")
+        self._write(0, middle + 10)
+
+        with trappy.LiveTrace("trace.txt") as trace:
+            num_events = len(trace.sched_wakeup.data_frame)
+            self.assertEqual(trace.offset, middle)
+
+            self._write(middle + 10, None)
+            new_events = trace.poll()
+
+            self.assertEqual(trace.offset, len(self.trace))
+            self.assertEqual(len(new_events["sched_wakeup"]),
+                             len(trace.sched_wakeup.data_frame) - num_events)
+            self.assertEqual(trace.poll(), {})
+
+            for name in self.expected.class_definitions:
+                assert_frame_equal(getattr(trace, name).data_frame,
+                                   getattr(self.expected, name).data_frame)
+            self.assertEqual(trace.endtime, self.expected.endtime)
+
+    def test_live_trace_retention(self):
+        """Test that a LiveTrace only keeps the events of its retention window"""
+        with trappy.LiveTrace("trace.txt", retention=1) as trace:
+            dfr = trace.sched_wakeup.data_frame
+            self.assertTrue(len(dfr) > 0)
+            self.assertTrue(all(dfr.index >= trace.endtime - trace.basetime - 1))
+
+            expected_dfr = self.expected.sched_wakeup.data_frame
+            self.assertTrue(len(dfr) < len(expected_dfr))
+            assert_frame_equal(dfr, expected_dfr.iloc[-len(dfr):])
+
+    def test_live_trace_retention_polls(self):
+        """Test that the retention window applies to the events of all the polls"""
+        os.remove("trace.txt")
+        ends = [self.trace.index(b"\n", len(self.trace) * part // 4) + 1
+                for part in range(1, 4)] + [len(self.trace)]
+
+        self._write(0, ends[0])
+        with trappy.LiveTrace("trace.txt", retention=1) as trace:
+            for (begin, end) in zip(ends, ends[1:]):
+                self._write(begin, end)
+                trace.poll()
+
+            dfr = trace.sched_wakeup.data_frame
+            self.assertTrue(all(dfr.index >= trace.endtime - trace.basetime - 1))
+
+            expected_dfr = self.expected.sched_wakeup.data_frame
+            assert_frame_equal(dfr, expected_dfr.iloc[-len(dfr):])
+
+    def test_live_trace_iter(self):
+        """Test that iterating over a LiveTrace polls it"""
+        with trappy.LiveTrace("trace.txt", poll_interval=0) as trace:
+            self._write(None, None)
+            events = next(iter(trace))
+
+            self.assertEqual(len(events["sched_wakeup"]),
+                             len(self.expected.sched_wakeup.data_frame))
@@ -296,6 +296,22 @@ class TestPlotter(BaseTestThermal):
         self.assertEqual(procs, expected_procs)
         self.assertEqual(window, [1, 5])
 
+    def test_event_plot_array_data(self):
+        """EventPlot accepts numpy arrays of events"""
+        import json
+        from trappy.plotter.EventPlot import EventPlot
+
+        data = {"task1": [[1, 2, 0], [4, 5, 1], [5, 6, 0]],
+                "task2": [[2, 3, 1]]}
+        array_data = {name: np.array(events, dtype=float)
+                      for (name, events) in data.items()}
+
+        expected = json.loads(EventPlot(data, list(data), [1, 6],
+                                        num_lanes=2)._data)
+        graph = json.loads(EventPlot(array_data, list(data), [1, 6],
+                                     num_lanes=2)._data)
+        self.assertEqual(graph, expected)
+
 class TestILinePlotter(unittest.TestCase):
     def test_simple_dfr(self):
         """ILinePlot doesn't barf when plotting DataFrames"""
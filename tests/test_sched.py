@@ -18,9 +18,15 @@ from __future__ import print_function
 
 import os
 import sys
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
 
 import utils_tests
 import trappy
+from trappy.sched import get_task_intervals
 
 sys.path.append(os.path.join(utils_tests.TESTS_DIRECTORY, "..", "trappy"))
 
@@ -128,6 +134,59 @@ class TestSchedWakeupNew(BaseTestSched):
         self.assertEqual(dfr["target_cpu"].iloc[0], 2)
 
 
+class TestTaskIntervals(unittest.TestCase):
+
+    def setUp(self):
+        # 1 task1 runs on cpu 0
+        # 2 task2 runs on cpu 1
+        # 3 task1 -> migration/0 on cpu 0
+        # 4 task1 runs on cpu 1 (task2 -> task1)
+        # 5 task1 runs on cpu 0 (switch from task1 dropped)
+        # 6 task1 -> idle on cpu 0
+        self.dfr = pd.DataFrame({
+            "__cpu": [0, 1, 0, 1, 0, 0],
+            "prev_pid": [0, 0, 11, 12, 10, 11],
+            "next_pid": [11, 12, 10, 11, 11, 0],
+            "next_comm": ["task1", "task2", "migration/0", "task1", "task1",
+                          "swapper/0"]},
+            index=pd.Series([1., 2., 3., 4., 5., 6.], name="Time"))
+
+    def test_task_intervals(self):
+        """Test that get_task_intervals() builds the intervals of the tasks"""
+        with warnings.catch_warnings(record=True) as warn:
+            warnings.simplefilter("always")
+            intervals = get_task_intervals(self.dfr)
+
+        self.assertEqual(len(warn), 1)
+        self.assertTrue("PID 11 at time 5.0" in str(warn[0].message))
+
+        self.assertEqual(intervals.columns.tolist(),
+                         ["start", "end", "cpu", "pid", "comm"])
+        self.assertEqual(intervals["start"].tolist(), [1., 2., 4., 5.])
+        np.testing.assert_array_equal(intervals["end"], [3., 4., np.nan, 6.])
+        self.assertEqual(intervals["cpu"].tolist(), [0, 1, 1, 0])
+        self.assertEqual(intervals["pid"].tolist(), [11, 12, 11, 11])
+        self.assertEqual(intervals["comm"].tolist(),
+                         ["task1", "task2", "task1", "task1"])
+
+    def test_task_intervals_filters(self):
+        """Test the execnames and pids filters of get_task_intervals()"""
+        with warnings.catch_warnings(record=True):
+            intervals = get_task_intervals(self.dfr, execnames="task2")
+        self.assertEqual(intervals["pid"].tolist(), [12])
+        self.assertEqual(intervals["end"].tolist(), [4.])
+
+        with warnings.catch_warnings(record=True):
+            intervals = get_task_intervals(self.dfr, pids=[11])
+        self.assertEqual(intervals["start"].tolist(), [1., 4., 5.])
+
+    def test_task_intervals_empty(self):
+        """Test get_task_intervals() without sched_switch events"""
+        intervals = get_task_intervals(self.dfr.iloc[:0])
+        self.assertEqual(len(intervals), 0)
+        self.assertEqual(intervals.columns.tolist(),
+                         ["start", "end", "cpu", "pid", "comm"])
+
 class TestGetFilters(BaseTestSched):
 
     def test_get_filters(self):
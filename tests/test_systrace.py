@@ -19,6 +19,7 @@ from __future__ import print_function
 import utils_tests
 import trappy
 import numpy as np
+import pandas as pd
 
 class TestSystrace(utils_tests.SetupDirectory):
 
@@ -55,6 +56,20 @@ class TestSystrace(utils_tests.SetupDirectory):
         self.assertTrue(hasattr(trace, "_cpus"))
         self.assertEqual(trace._cpus, 3)
 
+    def test_systrace_window(self):
+        """Parsing the window of a systrace gives the events of the whole trace"""
+        trace = trappy.SysTrace("trace_sf.html", normalize_time=False)
+
+        for window in [(0, 0.0001), (0.2, 0.3)]:
+            win_trace = trappy.SysTrace("trace_sf.html", normalize_time=False,
+                                        window=window)
+            (lower, upper) = win_trace.max_window
+            for name in trace.class_definitions:
+                dfr = getattr(trace, name).data_frame
+                dfr = dfr[(dfr.index >= lower) & (dfr.index <= upper)]
+                pd.testing.assert_frame_equal(
+                    getattr(win_trace, name).data_frame, dfr)
+
     def test_systrace_userspace(self):
         """Test parsing of userspace events"""
 
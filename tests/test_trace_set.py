@@ -0,0 +1,85 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import utils_tests
+from pandas.testing import assert_frame_equal
+
+import trappy
+from trappy.ftrace import GenericFTrace
+
+class TestTraceSet(utils_tests.SetupDirectory):
+
+    def __init__(self, *args, **kwargs):
+        super(TestTraceSet, self).__init__(
+            [("../doc/trace.txt", "trace1.txt"),
+             ("trace_sched.txt", "trace2.txt")],
+            *args,
+            **kwargs)
+
+    def setUp(self):
+        super(TestTraceSet, self).setUp()
+        GenericFTrace.disable_cache = False
+        self.traces = trappy.TraceSet([("run1", "trace1.txt"),
+                                       ("run2", "trace2.txt")],
+                                      workers=2, max_loaded=1)
+
+    def test_trace_set_lazy(self):
+        """Test that the traces of a TraceSet are loaded when they are used"""
+        self.assertEqual(self.traces.names, ["run1", "run2"])
+        self.assertFalse(self.traces.is_loaded("run1"))
+
+        trace = self.traces["run1"]
+        self.assertEqual(trace.name, "run1")
+        self.assertTrue(self.traces.is_loaded("run1"))
+        self.assertIs(self.traces["run1"], trace)
+
+        self.traces["run2"]
+        self.assertFalse(self.traces.is_loaded("run1"))
+
+    def test_trace_set_concat(self):
+        """Test that TraceSet.concat() gives the events of all the traces"""
+        dfr = self.traces.concat("sched_wakeup", columns=["pid"])
+
+        self.assertEqual(dfr.index.names, ["trace", "Time"])
+        # run1 has no sched_wakeup events
+        self.assertEqual(dfr.index.get_level_values("trace").unique().tolist(),
+                         ["run2"])
+        assert_frame_equal(
+            dfr.loc["run2"],
+            trappy.FTrace("trace2.txt").sched_wakeup.data_frame[["pid"]])
+
+    def test_trace_set_map(self):
+        """Test that TraceSet.map() applies a function to each trace"""
+        result = self.traces.map(lambda trace: len(trace.thermal.data_frame))
+
+        self.assertEqual(list(result.items()), [("run1", 67), ("run2", 0)])
+        self.assertFalse(self.traces.is_loaded("run1"))
+
+    def test_trace_set_drops_used_traces(self):
+        """Test that TraceSet.concat() and map() only keep the traces already loaded"""
+        traces = trappy.TraceSet([("run1", "trace1.txt"),
+                                  ("run2", "trace2.txt")], workers=1)
+        trace = traces["run1"]
+
+        traces.concat("sched_wakeup")
+        self.assertFalse(traces.is_loaded("run2"))
+
+        result = traces.map(lambda trace: len(trace.thermal.data_frame))
+        self.assertEqual(list(result.items()), [("run1", 67), ("run2", 0)])
+        self.assertFalse(traces.is_loaded("run2"))
+        self.assertIs(traces["run1"], trace)
@@ -59,3 +59,28 @@ class TestUtils(unittest.TestCase):
 
         series = utils.handle_duplicate_index(series, max_delta)
         assert_series_equal(series, expected_series)
+
+    def test_handle_duplicate_index_burst(self):
+        """handle_duplicate_index spreads a burst of duplicates up to the next value"""
+
+        values = [0, 1, 2, 3, 4, 5]
+        index = [0.0, 1.0, 1.0, 1.0, 2.0, 2.0]
+        delta = 1 / 3
+        expected_index = [0.0, 1.0, 1.0 + delta, 1.0 + 2 * delta, 2.0, 2.5]
+        series = pandas.Series(values, index=index)
+        expected_series = pandas.Series(values, index=expected_index)
+
+        series = utils.handle_duplicate_index(series, max_delta=0.5)
+        assert_series_equal(series, expected_series)
+
+    def test_symbol_table(self):
+        """SymbolTable gives the same code to equal strings"""
+
+        table = utils.SymbolTable()
+        codes = [table.intern(comm) for comm in
+                 ["swapper/0", "sh", "swapper/0", "kworker/0:1", "sh"]]
+
+        self.assertEqual(codes, [0, 1, 0, 2, 1])
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.lookup(codes).tolist(),
+                         ["swapper/0", "sh", "swapper/0", "kworker/0:1", "sh"])
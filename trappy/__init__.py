@@ -21,8 +21,10 @@ import warnings
 from trappy.bare_trace import BareTrace
 from trappy.compare_runs import summary_plots, compare_runs
 from trappy.exception import TrappyParseError
-from trappy.ftrace import FTrace
+from trappy.ftrace import FTrace, load_traces
+from trappy.live import LiveTrace
 from trappy.systrace import SysTrace
+from trappy.trace_set import TraceSet
 try:
     from trappy.plotter.LinePlot import LinePlot
 except ImportError as exc:
@@ -22,14 +22,21 @@ from builtins import zip
 from builtins import range
 from builtins import object
 from past.builtins import basestring
+from array import array
+from collections import OrderedDict
+import hashlib
+import inspect
+import json
+import marshal
 import re
+import numpy as np
 import pandas as pd
 import warnings
 
 from resource import getrusage, RUSAGE_SELF
 
 from trappy.exception import TrappyParseError
-from trappy.utils import handle_duplicate_index
+from trappy.utils import handle_duplicate_index, SymbolTable
 
 def _get_free_memory_kb():
     try:
@@ -92,6 +99,57 @@ def trace_parser_explode_array(string, array_lengths):
 
     return string
 
+# A field in the data of an event, whose value can be an array like {1 2}
+FIELD_RE = re.compile(r"\s*([^\s=]*)=(\{[^}]+\}|[^\s{]*)(?=\s|\Z)")
+ARRAY_RE = re.compile(r"([A-Za-z0-9_]+)={([^}]+)}")
+ARRAY_NAME_RE = re.compile(r"[A-Za-z0-9_]+\Z")
+
+# md5sum of the code of the functions, see get_code_md5()
+_code_md5 = {}
+
+def _code_key(code, doc=None):
+    """Return what tells apart the behavior of a code object
+
+    That is its bytecode and the names and constants it uses.  Line
+    numbers, comments and the docstring doc are left out.
+    """
+    consts = list(code.co_consts)
+    if doc is not None and consts and consts[0] == doc:
+        # Where functions without docstring have None
+        consts[0] = None
+    consts = [_code_key(const) if inspect.iscode(const) else const
+              for const in consts]
+
+    return (code.co_code, tuple(consts), code.co_names, code.co_varnames)
+
+def get_code_md5(func):
+    """Return the md5sum of the bytecode and constants of a function
+
+    Editing the comments or the docstring of the function, or moving
+    it in its file, doesn't change it.
+    """
+    code = func.__code__
+    if code not in _code_md5:
+        code_bytes = marshal.dumps(_code_key(code, func.__doc__))
+        _code_md5[code] = hashlib.md5(code_bytes).hexdigest()
+
+    return _code_md5[code]
+
+def cast_int_column(values):
+    """Apply :meth:`Base.string_cast_int` to an array of strings
+
+    Each distinct string is converted only once.  The dtype of the
+    result is the one pandas would infer for the list of converted
+    values.
+
+    :param values: The strings to convert
+    :type values: :mod:`numpy.ndarray`
+    """
+
+    (codes, uniques) = pd.factorize(np.asarray(values, dtype=object))
+    cast = pd.Series([Base.string_cast_int(value) for value in uniques])
+    return cast.to_numpy()[codes]
+
 class Base(object):
     """Base class to parse trace.dat dumps.
 
@@ -113,19 +171,88 @@ class Base(object):
 
     """
 
+    PARSE_METHODS = ("generate_data_dict", "create_dataframe",
+                     "finalize_object")
+    """The methods of the parsers that create the DataFrame of the events,
+    see :meth:`cache_fingerprint`"""
+
+    # Number of events whose text is kept before it is parsed into a
+    # chunk of typed columns, see :meth:`append_data`.  If None, the
+    # text of all the events is parsed when the DataFrame is created.
+    chunk_size = None
+
     def __init__(self, parse_raw=False, fallback=False):
         self.fallback = fallback
         self.tracer = None
+        self.__create_dataframe = None
         self.data_frame = pd.DataFrame()
-        self.line_array = []
-        self.data_array = []
-        self.time_array = []
-        self.comm_array = []
-        self.pid_array = []
-        self.cpu_array = []
+        self.comm_symbols = SymbolTable()
+        self.__parsing_chunk = False
+        self.__parsing_fields = None
+        self.__parsed_fields = []
+        self.__reset_arrays()
         self.parse_raw = parse_raw
         self.cached = False
 
+    @property
+    def data_frame(self):
+        """The :mod:`pandas.DataFrame` of the events
+
+        If its creation has been deferred with :meth:`defer_dataframe`,
+        it is created the first time it is accessed.
+        """
+        if self.__create_dataframe is not None:
+            (create, self.__create_dataframe) = (self.__create_dataframe, None)
+            create(self)
+        return self.__data_frame
+
+    @data_frame.setter
+    def data_frame(self, dfr):
+        self.__create_dataframe = None
+        self.__data_frame = dfr
+
+    def defer_dataframe(self, create):
+        """Create the :mod:`pandas.DataFrame` only when it is accessed
+
+        :param create: Function that is called with this object as
+            argument the first time :attr:`data_frame` is accessed, and
+            which sets it
+        :type create: callable
+        """
+        self.__create_dataframe = create
+
+    def cache_fingerprint(self):
+        """Return a string that identifies how this parser creates its DataFrame
+
+        The events of a trace are taken from the cache only if they were
+        cached with the same fingerprint.  It covers the name of the
+        class, its unique word, :code:`parse_raw` and the code of the
+        methods that turn the lines of the event into its DataFrame
+        (:attr:`PARSE_METHODS`), wherever they are defined in the class
+        and its base classes.  Changing how an event class parses its
+        data only invalidates the cache of the events of that class,
+        changing these methods in :class:`Base` invalidates all of them.
+        Other methods, comments and docstrings are not taken into
+        account.
+        """
+        cls = type(self)
+        methods = []
+        for klass in cls.__mro__[:-1]:
+            for name in self.PARSE_METHODS:
+                func = vars(klass).get(name)
+                func = getattr(func, "__func__", func)
+                if inspect.isfunction(func):
+                    methods.append([klass.__name__, name, get_code_md5(func)])
+
+        fingerprint = {
+            "class": cls.__module__ + "." + cls.__name__,
+            "unique_word": getattr(self, "unique_word", None),
+            "parse_raw": self.parse_raw,
+            "methods": methods,
+        }
+        return hashlib.md5(json.dumps(fingerprint, sort_keys=True)
+                           .encode("utf-8")).hexdigest()
+
     def finalize_object(self):
         pass
 
@@ -138,13 +265,11 @@ class Base(object):
         """
         from collections import defaultdict
 
-        pat_array = re.compile(r"([A-Za-z0-9_]+)={([^}]+)}")
-
         ret = defaultdict(int)
 
         for line in self.data_array:
             while True:
-                match = re.search(pat_array, line)
+                match = re.search(ARRAY_RE, line)
                 if not match:
                     break
 
@@ -163,11 +288,36 @@ class Base(object):
 
         return ret
 
+    def __reset_arrays(self):
+        """Create empty arrays for the events of the trace
+
+        Numbers are kept in typed arrays rather than lists of Python
+        objects, and comm in :attr:`comm_array` is the code of the task
+        name in :attr:`comm_symbols`, which the trace shares among all its
+        parsers.
+        """
+        self.time_array = array("d")
+        self.comm_array = array("i")
+        self.pid_array = array("q")
+        self.cpu_array = array("q")
+        self.line_array = array("q")
+        self.data_array = []
+        self.column_chunks = []
+        self.parsed_chunks = []
+        self.__array_lengths = {}
+
+    def __get_comms(self):
+        """Return the task names of the events, from :attr:`comm_array`"""
+        return self.comm_symbols.lookup(self.comm_array)
+
     def append_data(self, time, comm, pid, cpu, line, data):
         """Append data parsed from a line to the corresponding arrays
 
         The :mod:`DataFrame` will be created from this when the whole trace
-        has been parsed.
+        has been parsed.  If :attr:`chunk_size` is set, the text of the
+        events is parsed every :attr:`chunk_size` events and only the
+        resulting columns are kept, so that the text of a big trace isn't
+        all in memory at the same time.
 
         :param time: The time for the line that was printed in the trace
         :type time: float
@@ -185,12 +335,188 @@ class Base(object):
         """
 
         self.time_array.append(time)
-        self.comm_array.append(comm)
+        self.comm_array.append(self.comm_symbols.intern(comm))
         self.pid_array.append(pid)
         self.cpu_array.append(cpu)
         self.line_array.append(line)
         self.data_array.append(data)
 
+        if self.chunk_size and len(self.data_array) >= self.chunk_size:
+            self.__parse_chunk()
+
+    def extend_data(self, times, comms, pids, cpus, lines, data):
+        """Append data parsed from several lines to the corresponding arrays
+
+        This is the same as calling :meth:`append_data` for each line, the
+        parameters are sequences of the values it receives.
+        """
+
+        self.__extend_arrays(times, comms, pids, cpus, lines)
+        self.data_array.extend(data)
+
+        if self.chunk_size and len(self.data_array) >= self.chunk_size:
+            self.__parse_chunk()
+
+    def __parse_chunk(self):
+        """Parse the text of the events appended so far into columns
+
+        This goes through :meth:`create_dataframe`, so that the text is
+        preprocessed by the parsers that override it before it is parsed,
+        but only the columns of the data of the events are created.  They
+        are added to :attr:`parsed_chunks`.
+        """
+        self.__parsing_chunk = True
+        try:
+            self.create_dataframe()
+        finally:
+            self.__parsing_chunk = False
+
+    def parse_fields(self, array_lengths):
+        """Parse the events appended so far into dictionaries of fields
+
+        This is what :meth:`create_dataframe` does for the events that are
+        handed out one at a time, without creating a
+        :mod:`pandas.DataFrame`.  It goes through :meth:`create_dataframe`,
+        so that the text is preprocessed by the parsers that override it
+        before it is parsed.  The events are removed from the parser.
+
+        :param array_lengths: The number of elements of the arrays of the
+            events, like :code:`load={1 2}`.  Shorter arrays are padded
+            with zeros and the lengths are updated with the longer arrays
+            found.
+        :type array_lengths: dict
+
+        :return: A list with a :code:`(time, comm, pid, cpu, line, fields)`
+            tuple per event, where fields is the dictionary of its data
+        """
+        self.__parsing_fields = array_lengths
+        try:
+            self.create_dataframe()
+        finally:
+            self.__parsing_fields = None
+
+        (events, self.__parsed_fields) = (self.__parsed_fields, [])
+        return events
+
+    def __generate_fields(self, array_lengths):
+        """Return the events of the parser for :meth:`parse_fields`"""
+        if self.column_chunks:
+            fields = []
+            for columns in self.column_chunks:
+                names = list(columns)
+                fields.extend(dict(zip(names, row)) for row in
+                              zip(*[columns[name] for name in names]))
+            if not fields:
+                # Events without fields
+                fields = [{} for _ in self.time_array]
+        else:
+            for data_str in self.data_array:
+                if "{" not in data_str:
+                    continue
+                for (name, elements) in ARRAY_RE.findall(data_str):
+                    array_lengths[name] = max(array_lengths.get(name, 0),
+                                              len(elements.split(" ")))
+            data = self.data_array
+            if array_lengths:
+                data = [trace_parser_explode_array(data_str, array_lengths)
+                        for data_str in data]
+
+            if type(self).generate_data_dict is Base.generate_data_dict:
+                fields = self.__split_fields(data)
+            else:
+                fields = [dict(self.generate_data_dict(data_str))
+                          for data_str in data]
+
+        return list(zip(self.time_array, self.__get_comms(), self.pid_array,
+                        self.cpu_array, self.line_array, fields))
+
+    def __split_fields(self, data):
+        """Call :meth:`generate_data_dict` on data, casting each value once
+
+        The values of the fields repeat a lot in a trace, the ones already
+        cast are reused.  Events with text that isn't :code:`key=value`
+        go through :meth:`generate_data_dict`.
+        """
+        values = {}
+        fields = []
+        for data_str in data:
+            try:
+                pairs = dict(field.split("=", 1) for field in data_str.split())
+            except ValueError:
+                fields.append(self.generate_data_dict(data_str))
+                continue
+
+            data_dict = {}
+            for (key, value) in pairs.items():
+                try:
+                    data_dict[key] = values[value]
+                except KeyError:
+                    data_dict[key] = values[value] = \
+                        self.string_cast_int(value)
+            fields.append(data_dict)
+
+        return fields
+
+    def supports_columns(self):
+        """Whether the data of this parser can be passed as columns
+
+        Parsers that override :meth:`generate_data_dict` or
+        :meth:`create_dataframe` need the text of each event, so they
+        can't use :meth:`append_columns`.
+        """
+        cls = type(self)
+        return cls.generate_data_dict is Base.generate_data_dict and \
+            cls.create_dataframe is Base.create_dataframe
+
+    def append_columns(self, times, comms, pids, cpus, lines, columns):
+        """Append events whose data has already been split in columns
+
+        This is an alternative to :meth:`extend_data` for trace readers
+        that don't go through the text of the trace.  It can only be used
+        if :meth:`supports_columns` returns True.
+
+        :param columns: The data of the events.  The keys are the names of
+            the columns and the values are sequences with one element per
+            event.
+        :type columns: :mod:`collections.OrderedDict`
+        """
+
+        self.__extend_arrays(times, comms, pids, cpus, lines)
+        self.column_chunks.append(columns)
+
+    def __extend_arrays(self, times, comms, pids, cpus, lines):
+        """Append the fields common to all the events"""
+        for (arr, values) in ((self.time_array, times), (self.pid_array, pids),
+                              (self.cpu_array, cpus), (self.line_array, lines)):
+            if isinstance(values, np.ndarray):
+                # Avoid creating a Python object per element
+                arr.frombytes(values.astype(arr.typecode).tobytes())
+            else:
+                arr.extend(values)
+
+        self.comm_array.extend(self.comm_symbols.intern(comm)
+                               for comm in comms)
+
+    def __get_column_data(self):
+        """Merge the columns passed to :meth:`append_columns`"""
+        data = self.__get_meta_columns()
+
+        if len(self.column_chunks) == 1:
+            data.update(self.column_chunks[0])
+            return data
+
+        names = []
+        for columns in self.column_chunks:
+            names.extend(name for name in columns if name not in names)
+
+        for name in names:
+            data[name] = []
+            for columns in self.column_chunks:
+                num_rows = len(next(iter(columns.values()))) if columns else 0
+                data[name].extend(columns.get(name, [None] * num_rows))
+
+        return data
+
     @classmethod
     def string_cast_int(cls, string):
         """
@@ -243,7 +569,7 @@ class Base(object):
         check_memory_usage = True
         check_memory_count = 1
 
-        for (comm, pid, cpu, line, data_str) in zip(self.comm_array, self.pid_array,
+        for (comm, pid, cpu, line, data_str) in zip(self.__get_comms(), self.pid_array,
                                               self.cpu_array, self.line_array,
                                               self.data_array):
             data_dict = {"__comm": comm, "__pid": pid, "__cpu": cpu, "__line": line}
@@ -265,16 +591,198 @@ class Base(object):
 
             yield data_dict
 
+    def __generate_parsed_dataframe(self):
+        """Create the :mod:`pandas.DataFrame` by splitting all the events at once
+
+        This produces the same :mod:`pandas.DataFrame` as
+        :meth:`generate_parsed_data` but, instead of calling
+        :meth:`generate_data_dict` for every event, the fields of the first
+        event are turned into a regular expression that splits the data
+        of all the events that have the same fields.  Arrays like
+        :code:`load={1 2}` are split straight into the :code:`load0`,
+        :code:`load1`... columns, without going through
+        :func:`trace_parser_explode_array`.  The events that don't follow
+        the pattern are parsed with :meth:`generate_data_dict`.
+
+        :return: The :mod:`pandas.DataFrame` of the data of the events,
+            without the fields common to all the events, with a positional
+            index, or None if the first event can't be used as a pattern.
+        """
+
+        first = self.data_array[0]
+        (keys, arrays, patterns) = ([], set(), [])
+        (pos, end) = (0, len(first.rstrip()))
+        while pos < end:
+            match = FIELD_RE.match(first, pos)
+            if not match:
+                return None
+
+            (key, value) = match.groups()
+            if value.startswith("{"):
+                if not ARRAY_NAME_RE.match(key):
+                    return None
+                arrays.add(key)
+                patterns.append(re.escape(key) + r"=\{([^}]+)\}")
+            else:
+                patterns.append(re.escape(key) + r"=([^\s{]*)")
+            keys.append(key)
+            pos = match.end()
+
+        meta_columns = ["__comm", "__pid", "__cpu", "__line"]
+        if not keys or len(set(keys)) != len(keys) or \
+           set(keys) & set(meta_columns):
+            return None
+
+        regex = re.compile(r"\s*" + r"\s+".join(patterns) + r"\s*\Z")
+        matches = list(map(regex.match, self.data_array))
+        matched = [idx for (idx, match) in enumerate(matches) if match]
+        unmatched = [idx for (idx, match) in enumerate(matches) if not match]
+
+        values = np.array([matches[idx].groups() for idx in matched],
+                          dtype=object).reshape(len(matched), len(keys))
+
+        # Arrays are padded with zeros up to the longest one in the trace
+        elements = {}
+        lengths = {}
+        for (col, key) in enumerate(keys):
+            if key in arrays:
+                elements[key] = pd.Series(values[:, col]).str.split(" ",
+                                                                    expand=True)
+                lengths[key] = elements[key].shape[1]
+
+        rest_data = [self.data_array[idx] for idx in unmatched]
+        if arrays:
+            for data_str in rest_data:
+                for (name, array_elements) in ARRAY_RE.findall(data_str):
+                    lengths[name] = max(lengths.get(name, 0),
+                                        len(array_elements.split(" ")))
+            rest_data = [trace_parser_explode_array(data_str, lengths)
+                         for data_str in rest_data]
+
+        columns = OrderedDict()
+        for (col, key) in enumerate(keys):
+            if key not in arrays:
+                columns[key] = cast_int_column(values[:, col])
+                continue
+
+            block = elements[key].reindex(columns=range(lengths[key]))
+            block = block.to_numpy(dtype=object)
+            block[pd.isnull(block)] = "0"
+            for idx in range(lengths[key]):
+                columns["{}{}".format(key, idx)] = cast_int_column(block[:, idx])
+
+        if len(columns) != sum(lengths.get(key, 1) for key in keys):
+            return None
+
+        parsed = pd.DataFrame(columns, index=matched)
+
+        if unmatched:
+            rest = pd.DataFrame([self.generate_data_dict(data_str)
+                                 for data_str in rest_data], index=unmatched)
+            parsed = pd.concat([parsed, rest], sort=False).sort_index()
+
+        self.__update_array_lengths(lengths)
+        return parsed
+
+    def __update_array_lengths(self, lengths):
+        """Keep the longest length of each array among the chunks"""
+        for (name, length) in lengths.items():
+            self.__array_lengths[name] = max(self.__array_lengths.get(name, 0),
+                                             length)
+
+    def __parse_data_array(self):
+        """Parse the text of the events in :attr:`data_array`
+
+        :return: A :mod:`pandas.DataFrame` with the data of the events and
+            a positional index
+        """
+        data_frame = None
+        if type(self).generate_data_dict is Base.generate_data_dict:
+            data_frame = self.__generate_parsed_dataframe()
+
+        if data_frame is None:
+            trace_arr_lengths = self.__get_trace_array_lengths()
+            self.__update_array_lengths(trace_arr_lengths)
+            data = self.data_array
+            if trace_arr_lengths:
+                data = [trace_parser_explode_array(val, trace_arr_lengths)
+                        for val in data]
+
+            # generate_data_dict() may return a sequence of pairs.  The
+            # types of the columns are inferred when the chunks are merged,
+            # from the values of all the events.
+            data_frame = pd.DataFrame([dict(self.generate_data_dict(data_str))
+                                       for data_str in data],
+                                      index=pd.RangeIndex(len(data)),
+                                      dtype=object)
+
+        return data_frame
+
+    def __pad_arrays(self, data_frame):
+        """Add the elements of the arrays that are longer in other chunks
+
+        Like :func:`trace_parser_explode_array` does, the missing elements
+        are 0 for the events that have the array.
+        """
+        for (name, length) in self.__array_lengths.items():
+            first = "{}0".format(name)
+            if first not in data_frame.columns:
+                continue
+
+            padding = data_frame[first].where(data_frame[first].isnull(), 0)
+            for idx in range(1, length):
+                col = "{}{}".format(name, idx)
+                if col not in data_frame.columns:
+                    prev = data_frame.columns.get_loc("{}{}".format(name, idx - 1))
+                    data_frame.insert(prev + 1, col, padding)
+
+        return data_frame
+
+    def __get_parsed_chunks(self):
+        """Merge :attr:`parsed_chunks` and the events parsed after them"""
+        if self.data_array:
+            self.parsed_chunks.append(self.__parse_data_array())
+            self.data_array = []
+
+        chunks = [self.__pad_arrays(chunk) for chunk in self.parsed_chunks]
+        self.parsed_chunks = []
+
+        names = []
+        for chunk in chunks:
+            names.extend(name for name in chunk.columns if name not in names)
+
+        # pd.concat() would turn the None of a chunk into NaN, merge the
+        # columns so that their values are the ones of a DataFrame
+        # created from all the events at once
+        columns = OrderedDict()
+        for name in names:
+            values = [chunk[name].to_numpy() if name in chunk.columns
+                      else np.full(len(chunk), np.nan, dtype=object)
+                      for chunk in chunks]
+            dtypes = set(value.dtype for value in values)
+            if len(dtypes) == 1 and dtypes != {np.dtype(object)}:
+                columns[name] = np.concatenate(values)
+            else:
+                values = np.concatenate([value.astype(object)
+                                         for value in values])
+                columns[name] = pd.Series(values).infer_objects().to_numpy()
+
+        return pd.DataFrame(columns)
+
+    def __get_meta_columns(self):
+        """Return the columns with the fields common to all the events"""
+        return OrderedDict([("__comm", self.__get_comms()),
+                            ("__pid", np.array(self.pid_array)),
+                            ("__cpu", np.array(self.cpu_array)),
+                            ("__line", np.array(self.line_array))])
+
     def optimize_dataframe(self):
         """Optimize memory footprint by setting minimal data types required by
            each column"""
         for col in self.data_frame.columns:
-            if self.data_frame[col].dtype.kind == 'i':
-                self.data_frame[col].apply(pd.to_numeric, downcast='signed')
-                continue
-            if self.data_frame[col].dtype.kind == 'f':
-                self.data_frame[col].apply(pd.to_numeric, downcast='float')
-                continue
+            # Numeric columns are left with their dtype: downcasting them
+            # element by element costs more than the whole parse and the
+            # result was never stored
             if self.data_frame[col].dtype.kind == 'S':
                 # Convert string objects (pointer) to categories, only when we have
                 # a relatively limited number of unique values (50% of the rows)
@@ -291,24 +799,51 @@ class Base(object):
         if not self.time_array:
             return
 
-        trace_arr_lengths = self.__get_trace_array_lengths()
+        if self.__parsing_chunk:
+            self.parsed_chunks.append(self.__parse_data_array())
+            self.data_array = []
+            return
 
-        if trace_arr_lengths:
-            for (idx, val) in enumerate(self.data_array):
-                expl_val = trace_parser_explode_array(val, trace_arr_lengths)
-                self.data_array[idx] = expl_val
+        if self.__parsing_fields is not None:
+            self.__parsed_fields = self.__generate_fields(self.__parsing_fields)
+            self.__reset_arrays()
+            return
+
+        time_idx = pd.Index(np.array(self.time_array), name="Time")
+
+        if self.column_chunks:
+            self.data_frame = pd.DataFrame(self.__get_column_data(),
+                                           index=time_idx)
+        elif self.parsed_chunks:
+            data_frame = pd.DataFrame(self.__get_meta_columns())
+            self.data_frame = data_frame.join(self.__get_parsed_chunks())
+            self.data_frame.index = time_idx
+        else:
+            data_frame = None
+            if type(self).generate_data_dict is Base.generate_data_dict:
+                data_frame = self.__generate_parsed_dataframe()
+                if data_frame is not None:
+                    data_frame = pd.DataFrame(
+                        self.__get_meta_columns()).join(data_frame)
+
+            if data_frame is None:
+                trace_arr_lengths = self.__get_trace_array_lengths()
+
+                if trace_arr_lengths:
+                    for (idx, val) in enumerate(self.data_array):
+                        expl_val = trace_parser_explode_array(val, trace_arr_lengths)
+                        self.data_array[idx] = expl_val
+
+                self.data_frame = pd.DataFrame(self.generate_parsed_data(),
+                                               index=time_idx)
+            else:
+                data_frame.index = time_idx
+                self.data_frame = data_frame
 
-        time_idx = pd.Index(self.time_array, name="Time")
-        self.data_frame = pd.DataFrame(self.generate_parsed_data(), index=time_idx)
         self.data_frame = handle_duplicate_index(self.data_frame)
         self.optimize_dataframe()
 
-        self.time_array = []
-        self.line_array = []
-        self.comm_array = []
-        self.pid_array = []
-        self.cpu_array = []
-        self.data_array = []
+        self.__reset_arrays()
 
     def write_csv(self, fname):
         """Write the csv info into a CSV file
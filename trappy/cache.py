@@ -0,0 +1,534 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Helpers for the cache of the parsed events of a trace
+
+Each cache format writes the :mod:`pandas.DataFrame` of a parser to a
+path in the cache directory and reads it back.  The name and version of
+the format are recorded in the metadata of the cache, a cache written
+with another format or version is parsed again.
+
+The metadata also records a description of the trace file, which is
+used to check that the cache still matches the trace.
+"""
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+from builtins import object
+from builtins import range
+from collections import OrderedDict
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# numpy parses the header of .npy files with the ast module, which some
+# versions of CPython can't use in several threads at once
+_NPY_LOAD_LOCK = threading.Lock()
+
+def _load_npy(fname, mmap_mode=None, length=None):
+    """Load a .npy file, or only the first length values of it
+
+    The values of the rows appended to a cache are written after the
+    ones of the file without updating its header, so the number of
+    values that belong to the cache is given by length.
+    """
+    if length is None:
+        with _NPY_LOAD_LOCK:
+            return np.load(fname, mmap_mode=mmap_mode, allow_pickle=False)
+
+    with open(fname, "rb") as fin:
+        (dtype, offset) = _read_npy_header(fin)
+        if not length:
+            return np.empty(0, dtype=dtype)
+        if mmap_mode:
+            return np.memmap(fname, dtype=dtype, mode=mmap_mode,
+                             offset=offset, shape=(length,))
+
+        values = np.fromfile(fin, dtype=dtype, count=length)
+
+    if len(values) != length:
+        raise ValueError("{} is truncated".format(fname))
+    return values
+
+def _read_npy_header(fin):
+    """Return the dtype of a .npy file and the offset of its values"""
+    version = np.lib.format.read_magic(fin)
+    if version == (1, 0):
+        read_header = np.lib.format.read_array_header_1_0
+    elif version == (2, 0):
+        read_header = np.lib.format.read_array_header_2_0
+    else:
+        raise ValueError("Unsupported .npy version: {}".format(version))
+
+    with _NPY_LOAD_LOCK:
+        (_, _, dtype) = read_header(fin)
+    return (dtype, fin.tell())
+
+class CsvCacheFormat(object):
+    """Keep each event in a CSV file
+
+    This is the format of the caches written by older versions of
+    trappy.  The dtypes of the columns are guessed when reading the
+    file back.
+    """
+
+    name = "csv"
+    version = 1
+    extension = ".csv"
+
+    def write(self, trace_class, path):
+        trace_class.write_csv(path)
+
+    def read(self, trace_class, path, length=None):
+        trace_class.read_csv(path)
+
+    def append(self, trace_class, path, length):
+        """CSV files are read whole, rows are never appended to them"""
+        return False
+
+class NpyCacheFormat(object):
+    """Keep each event in a directory with a .npy file per column
+
+    The index and the numeric columns are saved as they are, so
+    timestamps and dtypes are exactly the ones of the parsed trace.
+    Categorical columns are saved as their codes and their categories,
+    and so are columns of strings, which are turned back into strings
+    when they are read.  Any other column is saved as a JSON list.  A
+    schema.json file describes the columns.
+
+    Rows can be appended to the files of an event, the number of rows
+    that are part of the cache is recorded in its metadata.
+    """
+
+    name = "npy"
+    version = 3
+    extension = ""
+
+    mmap_mode = None
+    """How the arrays are loaded, see :func:`numpy.load`"""
+
+    def write(self, trace_class, path):
+        dfr = trace_class.data_frame
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.mkdir(path)
+
+        schema = {
+            "index": self.__write_column(path, "index", dfr.index),
+            "columns": [self.__write_column(path, str(idx), dfr[col])
+                        for (idx, col) in enumerate(dfr.columns)],
+        }
+        schema["index"]["name"] = dfr.index.name
+        for (desc, col) in zip(schema["columns"], dfr.columns):
+            desc["name"] = col
+
+        with open(os.path.join(path, "schema.json"), "w") as fout:
+            json.dump(schema, fout)
+
+    def read(self, trace_class, path, length=None):
+        """Read the event cached at path
+
+        :param length: Only read the first length rows of the event
+        """
+        with open(os.path.join(path, "schema.json")) as fin:
+            schema = json.load(fin)
+
+        index = pd.Index(self.__read_column(path, schema["index"], length),
+                         name=schema["index"]["name"])
+        columns = OrderedDict((desc["name"],
+                               self.__read_column(path, desc, length))
+                              for desc in schema["columns"])
+
+        trace_class.data_frame = pd.DataFrame(columns, index=index, copy=False)
+
+    def append(self, trace_class, path, length):
+        """Write the rows of the DataFrame that follow its first length rows
+
+        The values are written after the first length ones of each
+        column, and the new strings after the ones that are already
+        cached, so the first length rows can still be read while the
+        rows are appended.
+
+        :returns: False if the rows can't be appended to the event
+            cached at path, because its columns or their types changed
+        """
+        with open(os.path.join(path, "schema.json")) as fin:
+            schema = json.load(fin)
+
+        dfr = trace_class.data_frame
+        if [desc["name"] for desc in schema["columns"]] != list(dfr.columns):
+            return False
+        if len(dfr) == length:
+            return True
+
+        columns = [(schema["index"], dfr.index[length:])]
+        columns += [(desc, dfr.iloc[length:, idx])
+                    for (idx, desc) in enumerate(schema["columns"])]
+        return all(self.__append_column(path, desc, values, length)
+                   for (desc, values) in columns)
+
+    def __write_column(self, path, name, values):
+        """Save the values of a column and return its description"""
+        if pd.api.types.is_categorical_dtype(values.dtype):
+            codes = np.asarray(values.cat.codes if isinstance(values, pd.Series)
+                               else values.codes)
+            np.save(os.path.join(path, name + ".codes.npy"), codes,
+                    allow_pickle=False)
+            return {
+                "type": "categorical",
+                "file": name + ".codes.npy",
+                "ordered": bool(values.dtype.ordered),
+                "categories": self.__write_column(
+                    path, name + ".categories", values.dtype.categories),
+            }
+
+        values = np.asarray(values)
+        if values.dtype.kind in "biufcmM":
+            np.save(os.path.join(path, name + ".npy"), values,
+                    allow_pickle=False)
+            return {"type": "array", "file": name + ".npy"}
+
+        if pd.api.types.infer_dtype(values, skipna=False) == "string":
+            (codes, strings) = pd.factorize(values)
+            np.save(os.path.join(path, name + ".codes.npy"), codes,
+                    allow_pickle=False)
+            with open(os.path.join(path, name + ".strings.json"), "w") as fout:
+                json.dump(strings.tolist(), fout)
+            return {"type": "strings", "file": name + ".codes.npy",
+                    "strings": name + ".strings.json"}
+
+        with open(os.path.join(path, name + ".json"), "w") as fout:
+            json.dump(values.tolist(), fout, default=_to_json)
+        return {"type": "object", "file": name + ".json"}
+
+    def __read_column(self, path, desc, length=None):
+        """Load the values of a column saved by :meth:`__write_column`"""
+        fname = os.path.join(path, desc["file"])
+
+        if desc["type"] == "categorical":
+            categories = self.__read_column(path, desc["categories"])
+            return pd.Categorical.from_codes(_load_npy(fname, length=length),
+                                             categories,
+                                             ordered=desc["ordered"])
+
+        if desc["type"] == "array":
+            return _load_npy(fname, self.mmap_mode, length)
+
+        if desc["type"] == "strings":
+            with open(os.path.join(path, desc["strings"])) as fin:
+                strings = pd.Series(json.load(fin), dtype=object).to_numpy()
+            return strings[_load_npy(fname, length=length)]
+
+        with open(fname) as fin:
+            return pd.Series(json.load(fin)[:length], dtype=object).to_numpy()
+
+    def __append_column(self, path, desc, values, length):
+        """Write values after the first length ones of a column
+
+        :returns: False if the values can't be saved like the column was
+        """
+        fname = os.path.join(path, desc["file"])
+
+        if desc["type"] == "array":
+            return _append_npy(fname, np.asarray(values), length)
+
+        if desc["type"] != "strings" or \
+           pd.api.types.infer_dtype(values, skipna=False) != "string":
+            return False
+
+        strings_fname = os.path.join(path, desc["strings"])
+        with open(strings_fname) as fin:
+            strings = json.load(fin)
+
+        codes = pd.Index(strings).get_indexer(values)
+        (new_codes, new_strings) = pd.factorize(np.asarray(values)[codes < 0])
+        codes[codes < 0] = new_codes + len(strings)
+
+        if not _append_npy(fname, codes, length):
+            return False
+
+        if len(new_strings):
+            tmp_fname = os.path.join(path, "." + desc["strings"])
+            with open(tmp_fname, "w") as fout:
+                json.dump(strings + new_strings.tolist(), fout)
+            os.rename(tmp_fname, strings_fname)
+
+        return True
+
+def _append_npy(fname, values, length):
+    """Write values after the first length ones of a .npy file
+
+    Anything after the first length values, like the rows of an append
+    that didn't complete, is overwritten.
+
+    :returns: False if the file holds values of another dtype
+    """
+    with open(fname, "r+b") as fout:
+        (dtype, offset) = _read_npy_header(fout)
+        if values.dtype != dtype:
+            return False
+
+        fout.seek(offset + length * dtype.itemsize)
+        fout.truncate()
+        fout.write(values.tobytes())
+
+    return True
+
+class MmapCacheFormat(NpyCacheFormat):
+    """Keep each event like :class:`NpyCacheFormat` and map it in memory
+
+    The numeric columns of the DataFrames are views of the files of the
+    cache, so opening a trace only reads the parts of the cache that are
+    used, and the processes that open the same trace share the pages of
+    its cache.  The arrays are mapped copy-on-write, a DataFrame that is
+    modified in place gets a private copy of the modified pages and the
+    cache is left untouched.
+
+    The index is only a view of the cache if the time of the trace isn't
+    normalized, as normalizing it builds a new index.  Columns of strings
+    are built from their codes when they are loaded, like with
+    :class:`NpyCacheFormat`, so that they have the dtype of a parsed
+    trace.
+    """
+
+    name = "mmap"
+    version = 2
+
+    mmap_mode = "c"
+
+def _to_json(value):
+    """Convert the numpy scalars that end up in object columns"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{!r} can't be cached".format(value))
+
+CACHE_FORMATS = {cache_format.name: cache_format
+                 for cache_format in (CsvCacheFormat(), NpyCacheFormat(),
+                                      MmapCacheFormat())}
+"""The formats that can be chosen with
+:attr:`trappy.ftrace.GenericFTrace.cache_format`"""
+
+# How much of the trace sampled_md5() reads: the beginning and the end
+# of the file plus a number of blocks evenly spread in between
+SAMPLE_EDGE_SIZE = 1 << 20
+SAMPLE_BLOCK_SIZE = 1 << 16
+SAMPLE_BLOCKS = 16
+
+CACHE_VALIDATIONS = ("stat", "sampled", "full")
+"""The policies that can be chosen with
+:attr:`trappy.ftrace.GenericFTrace.cache_validation`, from the cheapest
+to the most thorough"""
+
+def file_stat(path):
+    """Return the size, modification time and inode of a file"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "inode": stat.st_ino}
+
+def file_md5(path, size=None):
+    """Return the md5sum of a file, read one block at a time
+
+    :param size: Only hash the first size bytes of the file
+    """
+    return update_md5(hashlib.md5(), path, end=size).hexdigest()
+
+def update_md5(md5, path, begin=0, end=None, block_size=1 << 20):
+    """Add the bytes of a file from offset begin to offset end to a hash
+
+    :returns: md5
+    """
+    with open(path, "rb") as fin:
+        fin.seek(begin)
+        remaining = None if end is None else end - begin
+        while remaining is None or remaining > 0:
+            block = fin.read(block_size if remaining is None
+                             else min(block_size, remaining))
+            if not block:
+                break
+            md5.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+
+    return md5
+
+def sampled_md5(path, size=None):
+    """Return the md5sum of the size of a file and some blocks of it
+
+    The blocks are the first and last :data:`SAMPLE_EDGE_SIZE` bytes of
+    the file and :data:`SAMPLE_BLOCKS` blocks spread evenly between
+    them.  Small files are hashed whole.
+
+    :param size: Hash the file as if it had been truncated to size
+        bytes, to check that a file only grew since it was hashed
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    md5 = hashlib.md5("{}\n".format(size).encode("ascii"))
+
+    middle = size - 2 * SAMPLE_EDGE_SIZE - SAMPLE_BLOCK_SIZE
+    with open(path, "rb") as fin:
+        if middle <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE:
+            md5.update(fin.read(size))
+            return md5.hexdigest()
+
+        blocks = [(0, SAMPLE_EDGE_SIZE)]
+        blocks += [(SAMPLE_EDGE_SIZE + middle * idx // (SAMPLE_BLOCKS - 1),
+                    SAMPLE_BLOCK_SIZE) for idx in range(SAMPLE_BLOCKS)]
+        blocks.append((size - SAMPLE_EDGE_SIZE, SAMPLE_EDGE_SIZE))
+
+        for (offset, length) in blocks:
+            fin.seek(offset)
+            md5.update(fin.read(length))
+
+    return md5.hexdigest()
+
+def read_last_line(path, size, max_length=4096):
+    """Return the line of a file that ends at byte offset size
+
+    Only the last max_length bytes of the line are returned.  Returns
+    None if there is no newline at the end of the first size bytes of
+    the file, as the line may not be complete.
+    """
+    begin = max(size - max_length - 1, 0)
+    with open(path, "rb") as fin:
+        fin.seek(begin)
+        block = fin.read(size - begin)
+
+    if not block.endswith(b"\n"):
+        return None
+
+    line = block[:-1].rsplit(b"\n", 1)[-1][-max_length:]
+    return line.decode("utf-8", "replace")
+
+def trace_md5(path, cache_dir):
+    """Return the md5sum of a trace, which names its entry in the central cache
+
+    The whole trace is only hashed the first time it is read from a
+    path: its md5sum is remembered in cache_dir with the stat of the
+    file, and used again until the file is modified.
+    """
+    path = os.path.realpath(path)
+    stat = file_stat(path)
+    keys_dir = os.path.join(cache_dir, ".keys")
+    key_path = os.path.join(
+        keys_dir, hashlib.md5(path.encode("utf-8")).hexdigest() + ".json")
+
+    try:
+        with open(key_path) as fin:
+            key = json.load(fin)
+        if key["stat"] == stat:
+            return key["md5sum"]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+
+    md5sum = file_md5(path)
+    try:
+        if not os.path.isdir(keys_dir):
+            os.makedirs(keys_dir)
+        tmp_path = "{}.{}".format(key_path, os.getpid())
+        with open(tmp_path, "w") as fout:
+            json.dump({"stat": stat, "md5sum": md5sum}, fout)
+        os.rename(tmp_path, key_path)
+    except OSError:
+        # The trace is hashed again next time
+        pass
+
+    return md5sum
+
+CACHE_DIR_ENV = "TRAPPY_CACHE_DIR"
+"""Environment variable with the directory of the central cache, see
+:attr:`trappy.ftrace.GenericFTrace.cache_size_limit`"""
+
+def get_dir_size(path):
+    """Return the total size of the files in a directory"""
+    size = 0
+    for (dirpath, _, filenames) in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                # Removed while walking the directory
+                pass
+
+    return size
+
+def evict_cache_entries(cache_dir, size_limit, keep=None):
+    """Remove the least recently used entries of the central cache
+
+    Each entry is a directory in cache_dir, whose modification time is
+    the last time it was used.  Directories whose name starts with a
+    dot are being written and are not taken into account.
+
+    :param size_limit: Size in bytes that all the entries have to fit in
+    :param keep: Path of an entry that is never removed
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.stat(path).st_mtime, path, get_dir_size(path)))
+        except OSError:
+            pass
+
+    total_size = sum(size for (_, _, size) in entries)
+    for (_, path, size) in sorted(entries):
+        if total_size <= size_limit:
+            break
+        if keep and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+@contextlib.contextmanager
+def lock_cache_dir(path):
+    """Hold an exclusive lock on a cache directory
+
+    Processes that add events to the same cache or replace it take
+    turns.  The lock is advisory, and it is not taken where :mod:`fcntl`
+    is not available.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    while True:
+        dir_fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.flock(dir_fd, fcntl.LOCK_EX)
+            # The cache may have been replaced while waiting for the lock
+            dir_stat = os.fstat(dir_fd)
+            path_stat = os.stat(path)
+            if (dir_stat.st_dev, dir_stat.st_ino) == \
+               (path_stat.st_dev, path_stat.st_ino):
+                yield
+                return
+        finally:
+            os.close(dir_fd)
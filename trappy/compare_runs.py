@@ -75,9 +75,10 @@ def compare_runs(actor_order, map_label, runs, **kwords):
     if "height" not in kwords:
         kwords["height"] = 5
 
-    run_data = []
-    for name, path in runs:
-        run_data.append(trappy.FTrace(name=name, path=path, scope="thermal"))
+    run_data = trappy.ftrace.load_traces([path for (_, path) in runs],
+                                         scope="thermal")
+    for (name, path), trace in zip(runs, run_data):
+        trace.name = name
         trappy.wa.SysfsExtractor(path).pretty_print_in_ipython()
 
     trappy.plot_utils.plot_temperature(run_data, **kwords)
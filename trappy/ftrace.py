@@ -20,25 +20,32 @@ from __future__ import division
 from __future__ import unicode_literals
 
 from builtins import zip
-from builtins import next
 from builtins import str
+from array import array
+from collections import OrderedDict
+import contextlib
+import hashlib
+import heapq
 import io
 import itertools
 import json
 import os
 import re
 import pandas as pd
-import hashlib
 import shutil
 import warnings
 import math
 
-from tempfile import NamedTemporaryFile
+from tempfile import mkdtemp, NamedTemporaryFile, TemporaryFile
 import numpy as np
 
 from trappy.bare_trace import BareTrace
+from trappy.cache import CACHE_DIR_ENV, CACHE_FORMATS, CACHE_VALIDATIONS, \
+    evict_cache_entries, file_md5, file_stat, lock_cache_dir, read_last_line, \
+    sampled_md5, trace_md5, update_md5
 from trappy.exception import TrappyParseError
-from trappy.utils import listify
+from trappy.tracedat import TraceDat, EVENT_DATA_RE, PRINT_EVENTS
+from trappy.utils import listify, SymbolTable
 
 class FTraceParseError(TrappyParseError):
     pass
@@ -67,6 +74,659 @@ SPECIAL_FIELDS_RE = re.compile(
                         r"(?P<timestamp>[0-9]+(?P<us>\.[0-9]+)?): (\w+:\s+)+(?P<data>.+)"
 )
 
+def _get_timestamp(fields_match):
+    """Return the timestamp of a line matched by SPECIAL_FIELDS_RE in seconds
+
+    The timestamp, depending on the trace_clock configuration, can be
+    reported either in [s].[us] or [ns] format. Let's ensure that we
+    always generate DF which have the index expressed in:
+       [s].[decimals]
+    """
+    timestamp = float(fields_match.group('timestamp'))
+    if not fields_match.group('us'):
+        timestamp /= 1e9
+
+    return timestamp
+
+class EventDispatcher(object):
+    """Find the parser that should consume a line of the trace
+
+    All the unique words are compiled in a single regular expression so
+    that a line is scanned once no matter how many parsers are
+    registered.  The semantics are the same as checking every unique
+    word in turn: a line goes to the parser whose unique word it
+    contains, and to a fallback parser only if no other parser matched.
+
+    :param cls_for_unique_word: A dictionary mapping unique words to
+        the parser instance that handles them
+    :type cls_for_unique_word: dict
+    """
+
+    def __init__(self, cls_for_unique_word):
+        self.cls_for_unique_word = cls_for_unique_word
+
+        if cls_for_unique_word:
+            # Longest words first so that the leftmost match is also the
+            # most specific one
+            words = sorted(cls_for_unique_word, key=len, reverse=True)
+            regexp = re.compile("|".join(re.escape(word) for word in words))
+            self._search = regexp.search
+            self._finditer = regexp.finditer
+        else:
+            self._search = lambda line: None
+
+    def __call__(self, line):
+        """Return the parser for line or None if no parser wants it"""
+        match = self._search(line)
+        if not match:
+            return None
+
+        trace_class = self.cls_for_unique_word[match.group()]
+        if not trace_class.fallback:
+            return trace_class
+
+        # Keep looking for a more specific parser further in the line
+        for match in self._finditer(line, match.end()):
+            cls = self.cls_for_unique_word[match.group()]
+            if not cls.fallback:
+                return cls
+
+        return trace_class
+
+def _make_timestamps_unique(timestamps, previous=0.0):
+    """Make a sequence of timestamps strictly increasing
+
+    Each timestamp that is not bigger than the one before it is replaced
+    by the next representable float after the previous one, the same as
+    doing, in order:
+    ::
+
+        timestamp = max(timestamp, np.nextafter(previous, math.inf))
+
+    This is done with a cumulative maximum on the integer representation
+    of the floats, which is ordered like the floats themselves for
+    positive values and where np.nextafter() toward +inf is just a +1.
+
+    :param timestamps: The timestamps, in trace order
+    :type timestamps: :mod:`numpy.ndarray`
+
+    :param previous: The timestamp that precedes the first one
+    :type previous: float
+    """
+    bits = np.asarray(timestamps, dtype=np.float64).view(np.int64)
+    steps = np.arange(len(bits), dtype=np.int64)
+    first = np.array(previous, dtype=np.float64).view(np.int64) + 1
+
+    unique = np.maximum.accumulate(np.maximum(bits - steps, first)) + steps
+    return unique.view(np.float64)
+
+def _make_event_timestamps_unique(trace_classes, previous):
+    """Make the timestamps of the events appended to parsers unique
+
+    The timestamps are made unique across all the parsers with
+    :func:`_make_timestamps_unique`, in the order of the lines of the
+    events.
+
+    :param trace_classes: The parsers, they must have some events
+    :param previous: The unique timestamp that precedes the events
+
+    :returns: The unique timestamp of the last event
+    """
+    lines = np.concatenate([c.line_array for c in trace_classes])
+    times = np.concatenate([c.time_array for c in trace_classes])
+
+    order = np.argsort(lines, kind="mergesort")
+    times[order] = _make_timestamps_unique(times[order], previous)
+
+    begin = 0
+    for trace_class in trace_classes:
+        end = begin + len(trace_class.time_array)
+        trace_class.time_array = array("d", times[begin:end].tobytes())
+        begin = end
+
+    return times[order[-1]]
+
+class TraceEvent(object):
+    """An event of a trace, as yielded by :meth:`GenericFTrace.iter_events`
+
+    :ivar name: Name of the event, which is also the name of the
+        attribute of the event in the trace
+    :ivar time: Timestamp of the event, normalized if the trace is
+    :ivar comm: Name of the task that the event happened in
+    :ivar pid: PID of the task
+    :ivar cpu: CPU on which the event happened
+    :ivar line: Line of the event in the trace
+    :ivar fields: Dictionary of the fields of the event, the columns of
+        the :mod:`pandas.DataFrame` of the event
+    """
+
+    __slots__ = ("name", "time", "comm", "pid", "cpu", "line", "fields")
+
+    def __init__(self, name, time, comm, pid, cpu, line, fields):
+        self.name = name
+        self.time = time
+        self.comm = comm
+        self.pid = pid
+        self.cpu = cpu
+        self.line = line
+        self.fields = fields
+
+    def __repr__(self):
+        return "TraceEvent({!r}, time={!r}, comm={!r}, pid={!r}, cpu={!r}, line={!r}, fields={!r})".format(
+            self.name, self.time, self.comm, self.pid, self.cpu, self.line,
+            self.fields)
+
+# Number of lines of the trace parsed at a time by
+# GenericFTrace.iter_events()
+ITER_BATCH_LINES = 1 << 14
+
+class _EventFields(object):
+    """The fields of the events of a parser in :meth:`GenericFTrace.iter_events`
+
+    They are kept for the whole iteration, so that the events get the
+    same fields, and arrays of the same length, whichever batch of the
+    trace they are parsed in.
+
+    :param trace_class: The parser of the events
+    """
+
+    def __init__(self, trace_class):
+        self.trace_class = trace_class
+        # The fields as parsed, and the names of the columns of the
+        # DataFrame that finalize_object() renames them to
+        self.names = []
+        self.columns = []
+        self.array_lengths = {}
+        self.__renames = []
+
+    def update(self, events):
+        """Add the fields of events that are not known yet
+
+        :param events: The events returned by
+            :meth:`trappy.base.Base.parse_fields`
+        """
+        known = set(self.names)
+        new_names = []
+        for event in events:
+            for name in event[-1]:
+                if name not in known:
+                    known.add(name)
+                    new_names.append(name)
+
+        if new_names:
+            self.names.extend(new_names)
+            self.columns = self.__get_columns()
+            self.__renames = list(zip(self.names, self.columns))
+
+    def __get_columns(self):
+        """Return the names of the columns of the fields in the DataFrame"""
+        meta_columns = ["__comm", "__pid", "__cpu", "__line"]
+        parser = type(self.trace_class)()
+        parser.tracer = self.trace_class.tracer
+        parser.data_frame = pd.DataFrame(columns=meta_columns + self.names)
+        parser.finalize_object()
+
+        columns = [col for col in parser.data_frame.columns
+                   if col not in meta_columns]
+        if len(columns) != len(self.names):
+            return list(self.names)
+        return columns
+
+    def get_fields(self, fields):
+        """Return the fields of an event, under the names of the columns
+
+        The fields that the event doesn't have are NaN, as in the
+        DataFrame.
+        """
+        return {column: fields.get(name, np.nan)
+                for (name, column) in self.__renames}
+
+class _ParserState(object):
+    """Where the parsing of a trace stands
+
+    :param line: Number of the next line in the trace
+    :param basetime: Timestamp of the first line of the trace or None
+        if it hasn't been found yet
+    :param timestamp: Unique timestamp of the last event of the trace
+    :param window_end: Timestamp past which the trace doesn't need to be
+        parsed, or None to parse it until the end
+    """
+
+    def __init__(self, line=0, basetime=None, timestamp=0.0, window_end=None):
+        self.line = line
+        self.basetime = basetime
+        self.timestamp = timestamp
+        self.last_skipped = None
+        self.window_end = window_end
+        # Byte offset of the trace file where parsing starts, if it
+        # doesn't start at the beginning of the trace
+        self.offset = 0
+        # Whether parsing stopped at window_end, and the line at which it
+        # did
+        self.truncated = False
+        self.stop_line = None
+        # Lines of the trace that were not parsed because of the window,
+        # before and after the lines that were, see _sample_lines()
+        self.samples_before = []
+        self.samples_after = []
+
+def _populate_events(lines, dispatch, state):
+    """Append the events found in lines to the parsers that consume them
+
+    The timestamps appended are the ones found in the trace, they are made
+    unique afterwards by the caller with :func:`_make_timestamps_unique`.
+    The timestamps of lines that no parser consumes aren't parsed, see
+    :meth:`GenericFTrace._finalize_timestamps`.
+
+    :param lines: An iterable of lines of the trace
+    :param dispatch: A callable that returns the parser for a line, like
+        :class:`EventDispatcher`
+    :param state: The :class:`_ParserState` to start from, updated as the
+        lines are parsed
+    """
+    line_number = state.line
+    basetime = state.basetime
+    skipped_line = None
+
+    for line in lines:
+        trace_class = dispatch(line)
+        if not trace_class and basetime is not None:
+            # Only remember the line to compute the end time of the trace
+            skipped_line = line
+            line_number += 1
+            continue
+
+        skipped_line = None
+        line = line.rstrip()
+
+        fields_match = SPECIAL_FIELDS_RE.match(line)
+        if fields_match:
+            timestamp = _get_timestamp(fields_match)
+
+            if basetime is None:
+                basetime = timestamp
+                if not trace_class:
+                    state.timestamp = max(timestamp,
+                                          np.nextafter(state.timestamp, math.inf))
+
+            if trace_class:
+                # The unique timestamps are never smaller than the ones in
+                # the trace, so none of the events that follow can be in
+                # the window.  window_end may be set by lines as they are
+                # read, so it's not cached.
+                if state.window_end is not None and \
+                   timestamp > state.window_end:
+                    state.truncated = True
+                    state.stop_line = line
+                    break
+
+                comm = fields_match.group('comm')
+                pid = int(fields_match.group('pid'))
+                cpu = int(fields_match.group('cpu'))
+                data_str = fields_match.group('data')
+
+                # Remove empty arrays from the trace
+                if "={}" in data_str:
+                    data_str = re.sub(r"[A-Za-z0-9_]+=\{\} ", r"", data_str)
+
+                trace_class.append_data(timestamp, comm, pid, cpu, line_number, data_str)
+
+        line_number += 1
+
+    if skipped_line is not None:
+        fields_match = SPECIAL_FIELDS_RE.match(skipped_line.rstrip())
+        if fields_match:
+            state.last_skipped = _get_timestamp(fields_match)
+
+    state.line = line_number
+    state.basetime = basetime
+
+# Digits in the lines of a trace, which are ignored to tell apart the
+# shapes of its events
+_DIGITS_TABLE = str.maketrans("", "", "0123456789")
+
+def _sample_lines(lines, size=None):
+    """Return the first line of each shape of event in lines
+
+    Lines that only differ by their digits (timestamp, pid, numeric
+    fields...) are assumed to have the same fields with the same types,
+    so a few of them are enough to know the columns that the events of
+    lines have.  The lines are reduced to their shape a batch at a time,
+    which is much faster than doing it line by line.
+
+    :param lines: An iterable of the lines of the trace, each one ending
+        with a newline except maybe the last one
+    :param size: Stop once about size characters have been read from
+        lines, or read all of them if None
+
+    :returns: The list of the lines, in the order of the trace
+    """
+    samples = OrderedDict()
+    lines = iter(lines)
+    while size is None or size > 0:
+        batch = list(itertools.islice(lines, ITER_BATCH_LINES))
+        if not batch:
+            break
+
+        text = "".join(batch)
+        if size is not None:
+            size -= len(text)
+        shapes = text.translate(_DIGITS_TABLE).split("\n")
+        for (shape, line) in zip(shapes, batch):
+            if shape not in samples:
+                samples[shape] = line
+
+    return list(samples.values())
+
+# How much of the lines outside of the window of a parse are sampled by
+# _sample_trace(): blocks of WINDOW_SAMPLE_SIZE bytes at both ends of the
+# lines that were not parsed and WINDOW_SAMPLE_BLOCKS more evenly spaced
+# between them
+WINDOW_SAMPLE_SIZE = 1 << 18
+WINDOW_SAMPLE_BLOCKS = 8
+
+def _sample_trace(trace_file, begin, end, hasnt_finished):
+    """Sample the lines of a text trace between two byte offsets
+
+    Only some blocks of lines are read if there are more lines than
+    :data:`WINDOW_SAMPLE_SIZE` and :data:`WINDOW_SAMPLE_BLOCKS` allow,
+    so the fields of events that only appear in the lines that are not
+    read are missed.
+
+    :param begin: Byte offset of a line of the trace
+    :param end: Byte offset at which the lines to sample end, or None
+        for the end of the file
+    :param hasnt_finished: Predicate that is False for the first line
+        after the end of the trace, see
+        :meth:`GenericFTrace.trace_hasnt_finished`
+
+    :returns: The lines returned by :func:`_sample_lines`
+    """
+    with io.open(trace_file, 'rb') as fin:
+        if end is None:
+            end = fin.seek(0, io.SEEK_END)
+
+        num_blocks = WINDOW_SAMPLE_BLOCKS + 2
+        if end - begin <= num_blocks * WINDOW_SAMPLE_SIZE:
+            blocks = [begin]
+        else:
+            span = end - begin - WINDOW_SAMPLE_SIZE
+            blocks = [begin + span * idx // (num_blocks - 1)
+                      for idx in range(num_blocks)]
+        size = max(WINDOW_SAMPLE_SIZE, end - begin) if len(blocks) == 1 \
+               else WINDOW_SAMPLE_SIZE
+
+        def read_lines():
+            for offset in blocks:
+                fin.seek(offset)
+                if offset != begin:
+                    # Skip the end of the line the block starts in
+                    offset += len(fin.readline())
+                block = fin.read(max(min(offset + size, end) - offset, 0))
+                if offset + len(block) < end:
+                    block += fin.readline()
+
+                text = io.StringIO(block.decode('utf-8', 'replace'),
+                                   newline=None)
+                for line in text:
+                    if not hasnt_finished(line):
+                        return
+                    yield line
+
+        return _sample_lines(read_lines())
+
+def _populate_dat_events(trace_dat, cls_for_unique_word, raw_events, state):
+    """Append the events of a trace.dat to the parsers that consume them
+
+    This is the counterpart of :func:`_populate_events` for
+    :class:`trappy.tracedat.TraceDat`.  Parsers are matched with the
+    events by name, and get typed columns if they support it (see
+    :meth:`trappy.base.Base.supports_columns`) or the text that
+    "trace-cmd report" would print otherwise.  Parsers whose unique_word
+    is not the name of an event are matched against the text of the
+    events written by the user (trace_printk(), trace_marker...), like
+    :class:`EventDispatcher` does with the lines of a text trace.
+
+    :param raw_events: Names of the events that have to be decoded raw,
+        as "trace-cmd report -r" would
+    """
+    records = trace_dat.read_records()
+    num_records = len(records["ts"])
+    if not num_records:
+        return
+
+    times = records["ts"] / 1e9
+    lines = np.arange(num_records) + state.line
+    dispatched = np.zeros(num_records, dtype=bool)
+
+    comms = {}
+    def get_comms(pids):
+        for pid in set(pids):
+            if pid not in comms:
+                comms[pid] = trace_dat.comm(pid)
+        return [comms[pid] for pid in pids]
+
+    def select(sel):
+        pids = records["pid"][sel].tolist()
+        return (times[sel].tolist(), get_comms(pids), pids,
+                records["cpu"][sel].tolist(), lines[sel].tolist())
+
+    formats = {event_format.name: event_format
+               for event_format in trace_dat.formats.values()}
+    text_parsers = {}
+
+    for unique_word, trace_class in cls_for_unique_word.items():
+        event_format = formats.get(unique_word.rstrip(":"))
+        if event_format is None or event_format.name in PRINT_EVENTS:
+            text_parsers[unique_word] = trace_class
+            continue
+
+        sel = np.flatnonzero(records["id"] == event_format.id)
+        if not len(sel):
+            continue
+        dispatched[sel] = True
+
+        event_records = {key: values[sel] for (key, values) in records.items()}
+        columns, data = trace_dat.decode_event(
+            event_format, event_records, raw=event_format.name in raw_events,
+            columns=trace_class.supports_columns())
+
+        if columns is not None:
+            trace_class.append_columns(*(select(sel) + (columns,)))
+        else:
+            data = [re.sub(r"[A-Za-z0-9_]+=\{\} ", r"", data_str)
+                    if "={}" in data_str else data_str
+                    for data_str in data]
+            trace_class.extend_data(*(select(sel) + (data,)))
+
+    if text_parsers:
+        dispatch = EventDispatcher(text_parsers)
+        for name in PRINT_EVENTS:
+            event_format = formats.get(name)
+            if event_format is None:
+                continue
+
+            sel = np.flatnonzero(records["id"] == event_format.id)
+            if not len(sel):
+                continue
+
+            event_records = {key: values[sel] for (key, values) in records.items()}
+            texts = trace_dat.print_texts(event_format, event_records)
+            for (idx, text) in zip(sel, texts):
+                line = "{}: {}".format(name, text)
+                trace_class = dispatch(line)
+                fields_match = EVENT_DATA_RE.match(line)
+                if not trace_class or not fields_match:
+                    continue
+
+                dispatched[idx] = True
+                (time, comm, pid, cpu, line_number) = [
+                    values[0] for values in select([idx])]
+                trace_class.append_data(time, comm, pid, cpu, line_number,
+                                        fields_match.group("data"))
+
+    if state.basetime is None:
+        state.basetime = times[0]
+        if not dispatched[0]:
+            state.timestamp = max(times[0],
+                                  np.nextafter(state.timestamp, math.inf))
+
+    if not dispatched[-1]:
+        state.last_skipped = times[-1]
+
+    state.line += num_records
+
+class _EventCollector(object):
+    """Stand-in for a parser in a worker process of a parallel parse
+
+    It only keeps what :meth:`trappy.base.Base.append_data` receives so
+    that it can be sent back to the parser in the main process.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.time_array = []
+        self.comm_array = []
+        self.pid_array = []
+        self.cpu_array = []
+        self.line_array = []
+        self.data_array = []
+
+    def append_data(self, time, comm, pid, cpu, line, data):
+        self.time_array.append(time)
+        self.comm_array.append(comm)
+        self.pid_array.append(pid)
+        self.cpu_array.append(cpu)
+        self.line_array.append(line)
+        self.data_array.append(data)
+
+    def get_arrays(self):
+        return (self.time_array, self.comm_array, self.pid_array,
+                self.cpu_array, self.line_array, self.data_array)
+
+# Parameters of the parallel parse, set in the worker processes by
+# _init_chunk_worker().  They are inherited through fork() instead of
+# being pickled, as the trace_hasnt_finished() predicate can be a lambda.
+_chunk_job = {}
+
+def _init_chunk_worker(trace_file, fallback_for_unique_word, hasnt_finished,
+                       window_end):
+    _chunk_job["trace_file"] = trace_file
+    _chunk_job["fallback_for_unique_word"] = fallback_for_unique_word
+    _chunk_job["hasnt_finished"] = hasnt_finished
+    _chunk_job["window_end"] = window_end
+
+def _parse_chunk(chunk):
+    """Parse the lines of the trace between two byte offsets
+
+    Runs in a worker process.  Line numbers in the result start at 0 for
+    the first line of the chunk.
+
+    :param chunk: A tuple (start, end, first) with the byte offsets of the
+        chunk and whether it's the chunk at the beginning of the trace
+    """
+    start, end, first = chunk
+
+    with io.open(_chunk_job["trace_file"], 'rb') as fin:
+        fin.seek(start)
+        text = fin.read(end - start).decode('utf-8')
+
+    collectors = {unique_word: _EventCollector(fallback)
+                  for unique_word, fallback in
+                  _chunk_job["fallback_for_unique_word"].items()}
+
+    # The line at which the trace finishes is part of this chunk
+    finished = [False]
+    def hasnt_finished(line):
+        if _chunk_job["hasnt_finished"](line):
+            return True
+        finished[0] = True
+        return False
+
+    lines = itertools.takewhile(hasnt_finished, io.StringIO(text, newline=None))
+    # Every chunk but the first one starts after the basetime has been found
+    state = _ParserState(basetime=None if first else 0.0,
+                         window_end=_chunk_job["window_end"])
+    _populate_events(lines, EventDispatcher(collectors), state)
+
+    events = {unique_word: collector.get_arrays()
+              for unique_word, collector in collectors.items()
+              if collector.time_array}
+
+    return (events, state.line, state.basetime, state.timestamp,
+            state.last_skipped, finished[0], state.truncated)
+
+# Approximate number of bytes of trace between the entries of the index
+# built by _build_time_index()
+TIME_INDEX_INTERVAL = 1 << 20
+
+def _build_time_index(trace_file, start, interval):
+    """Build a sparse index of the timestamps of a text trace
+
+    Returns a list of [timestamp, offset, line] entries, one every
+    interval bytes or so, with the byte offset of a line of the trace,
+    its timestamp and its line number, counted from the line at the
+    start offset.  Only newlines are counted, no line is parsed but the
+    ones in the index, so this is much cheaper than parsing the trace.
+
+    """
+    index = []
+    line = 0
+
+    with io.open(trace_file, 'rb') as fin:
+        fin.seek(start)
+        offset = start
+
+        while True:
+            block = fin.read(interval)
+            if not block:
+                break
+            # Finish the last line of the block
+            block += fin.readline()
+
+            line_start = 0
+            for line_in_block in range(min(block.count(b"\n"), 16)):
+                line_end = block.index(b"\n", line_start)
+                text = block[line_start:line_end].decode('utf-8', 'replace')
+                fields_match = SPECIAL_FIELDS_RE.match(text.rstrip())
+                if fields_match:
+                    index.append([_get_timestamp(fields_match),
+                                  offset + line_start, line + line_in_block])
+                    break
+                line_start = line_end + 1
+
+            line += block.count(b"\n")
+            offset += len(block)
+
+    return index
+
+def _find_last_timestamp(trace_file, block_size=1 << 16):
+    """Return the timestamp of the last line of a text trace or None"""
+    with io.open(trace_file, 'rb') as fin:
+        end = fin.seek(0, io.SEEK_END)
+
+        while end > 0:
+            begin = max(end - block_size, 0)
+            fin.seek(begin)
+            block = fin.read(end - begin)
+
+            lines = block.split(b"\n")
+            if begin > 0:
+                # The first line may be incomplete, read it again with the
+                # previous block
+                end = begin + len(lines[0])
+                lines = lines[1:]
+            else:
+                end = 0
+
+            for line in reversed(lines):
+                fields_match = SPECIAL_FIELDS_RE.match(
+                    line.decode('utf-8', 'replace').rstrip())
+                if fields_match:
+                    return _get_timestamp(fields_match)
+
+    return None
+
 class GenericFTrace(BareTrace):
     """Generic class to parse output of FTrace.  This class is meant to be
 subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
@@ -79,10 +739,39 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
 
     disable_cache = False
 
+    # Name of the format of the event files in the cache, one of
+    # trappy.cache.CACHE_FORMATS
+    cache_format = "mmap"
+
+    # How to check that the cache matches the trace, one of
+    # trappy.cache.CACHE_VALIDATIONS:
+    #  - "stat": the size, modification time and inode of the trace
+    #  - "sampled": as "stat", and if the trace has been touched or
+    #    copied, the md5sum of some blocks of it
+    #  - "full": the md5sum of the whole trace, which is only recorded
+    #    in the caches written with this policy
+    cache_validation = "sampled"
+
+    # Size in bytes of all the traces in the central cache (see the
+    # cache_dir parameter of FTrace).  The least recently used ones are
+    # removed when it is exceeded.
+    cache_size_limit = 10 << 30
+
+    # Number of threads that read and write the events in the cache
+    cache_io_threads = min(8, os.cpu_count() or 1)
+
+    # Whether lines appended to the trace after it was cached can be
+    # parsed on their own and appended to the cached events
+    _cache_extensible = True
+
     def __init__(self, name="", normalize_time=True, scope="all",
-                 events=[], window=(0, None), abs_window=(0, None)):
+                 events=[], window=(0, None), abs_window=(0, None),
+                 parallel=None, cache_dir=None, lazy=False):
         super(GenericFTrace, self).__init__(name)
 
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+        self._cache_key = None
+
         self.__add_events(listify(events))
 
         if scope == "thermal":
@@ -103,8 +792,13 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
                 raise RuntimeError('Events unique words must not be a substring of the unique word of another event: "{cls1.unique_word}" {cls1} and "{cls2.unique_word}" {cls2}'.format(
                     cls1=cls1, cls2=cls2))
 
+        # Task names are shared by the parsers of the trace
+        self.comm_symbols = SymbolTable()
         for attr, class_def in self.class_definitions.items():
             trace_class = class_def()
+            trace_class.comm_symbols = self.comm_symbols
+            # Chunks of events can be parsed before the end of the parse
+            trace_class.tracer = self
             setattr(self, attr, trace_class)
             self.trace_classes.append(trace_class)
 
@@ -113,6 +807,24 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
         self.window = window
         self.abs_window = abs_window
         self.max_window = (0, None)
+        self.parallel = parallel
+        self.lazy = lazy
+        self._time_index = None
+        # Timelines of events that have been created, by events
+        self._timelines = {}
+        self._parsed_partially = False
+        # Metadata of the cache being extended with the end of the trace
+        self._cache_extension = None
+        self.__cached_frames = {}
+        # Number of rows of each event read from the cache being extended
+        self.__cached_lengths = {}
+        # md5 of the part of the trace that was cached, for the "full"
+        # cache validation
+        self.__cached_md5 = None
+        # Parsers whose DataFrame is created when it is first accessed
+        self.__deferred_classes = set()
+        # Lines of events outside of the window that was parsed, by parser
+        self.__window_samples = {}
 
         self._do_parse()
 
@@ -155,17 +867,23 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
                 if cobject == obj:
                     del scope_classes[name]
 
-    def _calc_max_window(self):
+    def _calc_max_window(self, basetime=None):
         """
         Compute the maximum window of the 'window' & 'abs_window' intersection
+
+        :param basetime: The basetime of the trace, if self.basetime
+            is not known yet
         """
+        if basetime is None:
+            basetime = self.basetime
+
         max_window = [0, None]
-        max_window[0] = max(self.window[0] + self.basetime, self.abs_window[0])
+        max_window[0] = max(self.window[0] + basetime, self.abs_window[0])
 
         if (self.window[1] is not None) and (self.abs_window[1] is not None):
-            max_window[1] = max(self.window[1] + self.basetime, self.abs_window[1])
+            max_window[1] = max(self.window[1] + basetime, self.abs_window[1])
         elif self.window[1] is not None:
-            max_window[1] = self.window[1] + self.basetime
+            max_window[1] = self.window[1] + basetime
         elif self.abs_window[1] is not None:
             max_window[1] = self.abs_window[1]
 
@@ -190,14 +908,31 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
 
     def _trace_cache_path(self):
         trace_file = self.trace_path
+
+        # In the central cache, the same trace shares its cache wherever
+        # it is read from.  The md5sum of the whole trace is used, traces
+        # that only differ in places that a sampled hash doesn't read
+        # must not share a cache.
+        if self.cache_dir:
+            if not self._cache_key:
+                self._cache_key = trace_md5(trace_file, self.cache_dir)
+            return os.path.join(self.cache_dir, self._cache_key)
+
         cache_dir  = '.' +  os.path.basename(trace_file) + '.cache'
         tracefile_dir = os.path.dirname(os.path.abspath(trace_file))
         cache_path = os.path.join(tracefile_dir, cache_dir)
         return cache_path
 
-    def _get_csv_path(self, trace_class):
-        path = self._trace_cache_path()
-        return os.path.join(path, trace_class.__class__.__name__ + '.csv')
+    def _get_cache_format(self):
+        try:
+            return CACHE_FORMATS[self.cache_format]
+        except KeyError:
+            raise ValueError("Unknown cache format: {}".format(self.cache_format))
+
+    def _get_class_cache_path(self, trace_class, cache_path=None):
+        path = cache_path or self._trace_cache_path()
+        return os.path.join(path, trace_class.__class__.__name__ +
+                            self._get_cache_format().extension)
 
     def _get_cache_metadata(self):
         cache_path = self._trace_cache_path()
@@ -210,91 +945,465 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
         return metadata
 
     def _is_cache_valid(self, cache_metadata):
-        for key in ["md5sum", "basetime", "endtime"]:
+        for key in ["basetime", "endtime"]:
             if key not in cache_metadata.keys():
                 warnstr = "Cache metadata is erroneous, invalidating cache"
                 warnings.warn(warnstr)
                 return False
 
-        with open(self.trace_path, 'rb') as f:
-            trace_md5sum = hashlib.md5(f.read()).hexdigest()
+        if not self.__is_cache_format_current(cache_metadata):
+            return False
 
-        if cache_metadata["md5sum"] != trace_md5sum:
+        if not self.__is_cache_from_trace(cache_metadata):
             warnstr = "Cached data is from another trace, invalidating cache."
             warnings.warn(warnstr)
             return False
 
         return True
 
+    def __is_cache_format_current(self, cache_metadata):
+        """Check that the cache is in the format being used
+
+        Caches written before the format was recorded are CSV ones.  A
+        cache in another format is simply written again.
+        """
+        cache_format = self._get_cache_format()
+        return cache_metadata.get("format", "csv") == cache_format.name and \
+            cache_metadata.get("format_version", 1) == cache_format.version
+
+    def __is_trace_extended(self, cache_metadata):
+        """Check that lines were only appended to the trace since it was cached
+
+        The part of the trace that was cached must still end with the
+        same line and have the same hash, with the :attr:`cache_validation`
+        policy ("stat" uses a sampled hash, as the stat of the trace
+        changed when it grew).
+        """
+        if not self._cache_extensible or \
+           not cache_metadata.get("last_line") or \
+           "lines" not in cache_metadata or \
+           not self.__is_cache_format_current(cache_metadata):
+            return False
+
+        size = cache_metadata["size"]
+        if os.path.getsize(self.trace_path) <= size:
+            return False
+
+        if read_last_line(self.trace_path, size) != cache_metadata["last_line"]:
+            return False
+
+        if self.cache_validation == "full":
+            md5 = update_md5(hashlib.md5(), self.trace_path, end=size)
+            if md5.hexdigest() != cache_metadata.get("md5sum"):
+                return False
+
+            # Only the new lines are hashed when the cache is updated
+            self.__cached_md5 = md5
+            return True
+
+        return sampled_md5(self.trace_path, size) == cache_metadata["sampled_md5"]
+
+    def __is_cache_from_trace(self, cache_metadata):
+        """Check that the cache was created from the trace file
+
+        The checks go from the cheapest to the most expensive one, until
+        the one of the :attr:`cache_validation` policy.  Caches created
+        before the trace was described in the metadata only have the
+        md5sum of the whole trace.
+        """
+        if self.cache_validation not in CACHE_VALIDATIONS:
+            raise ValueError("Unknown cache validation: {}".format(
+                self.cache_validation))
+
+        if "validation" in cache_metadata:
+            stat = file_stat(self.trace_path)
+            if stat["size"] != cache_metadata["size"]:
+                return False
+
+            if self.cache_validation != "full" and \
+               all(cache_metadata[key] == val for key, val in stat.items()):
+                return True
+
+            if self.cache_validation == "stat":
+                return False
+
+            if sampled_md5(self.trace_path) != cache_metadata["sampled_md5"]:
+                return False
+
+            if self.cache_validation == "sampled":
+                return True
+
+        return file_md5(self.trace_path) == cache_metadata.get("md5sum")
+
     def _prepare_cache_dir(self):
+        """Create the directory in which a new cache is written
+
+        The cache is written in a temporary directory next to the final
+        one, which :meth:`_commit_cache_dir` renames once it is complete,
+        so that a cache is never seen half written.
+        """
         cache_path = self._trace_cache_path()
+        parent_dir = os.path.dirname(cache_path)
+        if not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir)
 
-        if os.path.exists(cache_path):
-            shutil.rmtree(cache_path)
-        os.mkdir(cache_path)
+        tmp_path = mkdtemp(prefix="." + os.path.basename(cache_path) + ".",
+                           dir=parent_dir)
+        os.chmod(tmp_path, 0o755)
+        return tmp_path
+
+    def _commit_cache_dir(self, tmp_path):
+        """Replace the cache with the one written in tmp_path
+
+        The old cache is moved aside while holding its lock, so a process
+        that is adding events to it finishes first, and it is only
+        removed once it isn't the cache of the trace anymore.
+        """
+        cache_path = self._trace_cache_path()
+        old_path = tmp_path + ".old"
 
-    def _update_cache(self):
         try:
-            # Recreate basic cache directories only if nothing cached
-            if not any([c.cached for c in self.trace_classes]):
-                self._prepare_cache_dir()
+            with lock_cache_dir(cache_path):
+                os.rename(cache_path, old_path)
+        except OSError:
+            # There is no cache to replace
+            pass
 
-                # Write cache metadata
-                metadata_path = os.path.join(self._trace_cache_path(), 'metadata.json')
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # Another process has just written the cache of the same trace
+            shutil.rmtree(tmp_path, ignore_errors=True)
 
-                metadata = self._get_metadata_to_cache()
+        shutil.rmtree(old_path, ignore_errors=True)
 
-                with open(metadata_path, 'w') as f:
-                    json.dump(metadata, f)
+    def _update_cache(self, trace_classes=None):
+        """Write the events that were parsed in the cache
 
-            # Cache trace data
-            for trace_class in self.trace_classes:
-                # Write out only events that weren't cached before
-                if trace_class.cached:
-                    continue
+        :param trace_classes: The parsers whose events are added to the
+            cache of the trace.  By default, all the ones that were not read
+            from the cache, which is created if none was.
+        :type trace_classes: list
+        """
+        if trace_classes is not None and \
+           not os.path.exists(self._trace_cache_path()):
+            return
+
+        tmp_path = None
+        try:
+            # Only write the events of the lines appended to the trace if
+            # the cache is extended, recreate basic cache directories
+            # only if nothing cached
+            if trace_classes is None and self._cache_extension and \
+               self.__extend_cache():
+                pass
+            elif trace_classes is None and \
+               not any([c.cached for c in self.trace_classes]):
+                tmp_path = self._prepare_cache_dir()
+                metadata = self._get_metadata_to_cache()
+                metadata["events"] = {}
+                self.__write_cache(tmp_path, metadata, True, trace_classes)
 
-                csv_file = self._get_csv_path(trace_class)
-                trace_class.write_csv(csv_file)
+                self._commit_cache_dir(tmp_path)
+                tmp_path = None
+            else:
+                cache_path = self._trace_cache_path()
+                with lock_cache_dir(cache_path):
+                    # Read the metadata again, another process may have
+                    # added events to the cache since it was loaded
+                    metadata = self._get_cache_metadata()
+                    self.__write_cache(cache_path, metadata, False,
+                                       trace_classes)
+
+            if self.cache_dir:
+                evict_cache_entries(self.cache_dir, self.cache_size_limit,
+                                    keep=self._trace_cache_path())
         except OSError as err:
             warnings.warn(
                 "TRAPpy: Cache not created due to OS error: {0}".format(err))
+        finally:
+            if tmp_path:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def __extend_cache(self):
+        """Append the events of the lines added to the trace to its cache
+
+        Only the new rows of the events are written, unless the columns
+        of an event changed, in which case it is written again entirely.
+
+        :returns: False if another process updated the cache since it
+            was read, and a new cache has to be written
+        """
+        cache_path = self._trace_cache_path()
+        cache_format = self._get_cache_format()
+
+        with lock_cache_dir(cache_path):
+            cached_metadata = self._get_cache_metadata()
+            if any(cached_metadata.get(key) != self._cache_extension.get(key)
+                   for key in ["size", "sampled_md5", "format_version"]):
+                return False
+
+            metadata = self._get_metadata_to_cache()
+            metadata["events"] = cached_metadata["events"]
+            metadata["rows"] = cached_metadata.get("rows", {})
+
+            rewritten = []
+            for (trace_class, length) in self.__cached_lengths.items():
+                path = self._get_class_cache_path(trace_class, cache_path)
+                try:
+                    appended = cache_format.append(trace_class, path, length)
+                except (IOError, OSError, ValueError, KeyError, TypeError):
+                    appended = False
+
+                if appended:
+                    metadata["rows"][trace_class.__class__.__name__] = \
+                        len(trace_class.data_frame)
+                else:
+                    rewritten.append(trace_class)
+
+            self.__write_cache(cache_path, metadata, False, rewritten)
+
+        return True
+
+    def __write_cache(self, cache_path, metadata, new_cache,
+                      trace_classes=None):
+        """Write the events that weren't cached before and the metadata
+
+        The metadata is written last, so the cache only refers to events
+        that have been written entirely.  The events whose DataFrame
+        hasn't been created yet are written when it is.
+        """
+        if trace_classes is None:
+            trace_classes = [c for c in self.trace_classes
+                             if not c.cached and
+                             c not in self.__deferred_classes]
+        paths = [self._get_class_cache_path(c, cache_path)
+                 for c in trace_classes]
+
+        self._map_cache_io(
+            lambda args: self.__write_cache_entry(*args, new_cache=new_cache),
+            list(zip(trace_classes, paths)))
+
+        rows = metadata.setdefault("rows", {})
+        for (trace_class, path) in zip(trace_classes, paths):
+            name = trace_class.__class__.__name__
+            if os.path.exists(path):
+                metadata["events"][name] = trace_class.cache_fingerprint()
+                rows[name] = len(trace_class.data_frame)
+            else:
+                metadata["events"].pop(name, None)
+                rows.pop(name, None)
+
+        metadata_path = os.path.join(cache_path, 'metadata.json')
+        with NamedTemporaryFile('w', dir=cache_path, delete=False) as f:
+            json.dump(metadata, f)
+        os.chmod(f.name, 0o644)
+        os.rename(f.name, metadata_path)
+
+    def _map_cache_io(self, func, items):
+        """Call func on each of items, in a pool of threads if there are many
+
+        :returns: The list of the results of func
+        """
+        threads = min(self.cache_io_threads, len(items))
+        if threads <= 1:
+            return [func(item) for item in items]
+
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(threads)
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.terminate()
+
+    def __write_cache_entry(self, trace_class, path, new_cache):
+        """Write the DataFrame of an event in the cache
+
+        Events added to an existing cache are written next to their
+        final path and renamed, so that a cache that is being read never
+        has half written events.  If the event can't be cached, nothing
+        is left at path.
+        """
+        name = trace_class.__class__.__name__
+        tmp_path = path if new_cache else \
+                   os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+
+        for old_path in set([tmp_path, path]):
+            if os.path.isdir(old_path):
+                shutil.rmtree(old_path)
+            elif os.path.exists(old_path):
+                os.remove(old_path)
+
+        try:
+            self._get_cache_format().write(trace_class, tmp_path)
+        except (TypeError, ValueError) as err:
+            # The event is parsed again next time
+            warnings.warn("TRAPpy: {} not cached: {}".format(name, err))
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if tmp_path != path:
+            os.rename(tmp_path, path)
 
     def _get_metadata_to_cache(self):
         # By default, some amount of metadata is saved in metadata.json
         # Additionnal metadata can be saved by overriding this method
         metadata = {}
 
-        metadata["md5sum"] = hashlib.md5(
-            open(self.trace_path, 'rb').read()
-        ).hexdigest()
+        # Describe the trace file so that the cache can be validated.
+        # Hashing the whole trace is as long as reading it, it's only
+        # done for the "full" policy.
+        metadata["validation"] = self.cache_validation
+        metadata.update(file_stat(self.trace_path))
+        metadata["sampled_md5"] = sampled_md5(self.trace_path)
+        if self.cache_validation == "full":
+            metadata["md5sum"] = self.__get_trace_md5(metadata["size"])
         metadata["basetime"] = self.basetime
         metadata["endtime"] = self.endtime
+        metadata["format"] = self._get_cache_format().name
+        metadata["format_version"] = self._get_cache_format().version
+
+        # Index the trace to be able to seek to the window of later
+        # parses, if it's the text file that is parsed
+        if self._parses_trace_text():
+            metadata["time_index"] = self._get_time_index(
+                self.trace_path, self.__find_trace_start(self.trace_path))
+
+            # Remember where the parse stopped, to only parse the lines
+            # appended to the trace later on
+            if self._cache_extensible:
+                metadata["lines"] = self.lines
+                metadata["last_line"] = read_last_line(self.trace_path,
+                                                       metadata["size"])
+
         return metadata
 
+    def __get_trace_md5(self, size):
+        """Return the md5sum of the first size bytes of the trace
+
+        If the cache is being extended, only the lines appended to the
+        trace are hashed.
+        """
+        if self.__cached_md5 is None or not self._cache_extension:
+            return file_md5(self.trace_path, size)
+
+        md5 = self.__cached_md5.copy()
+        return update_md5(md5, self.trace_path, self._cache_extension["size"],
+                          size).hexdigest()
+
+    def _parses_trace_text(self):
+        """Whether the file parsed is the trace itself, as text"""
+        return self.file_to_parse == self.trace_path
+
     def _load_cache(self):
         cache_path = self._trace_cache_path()
         if not os.path.exists(cache_path):
             return
 
-        metadata = self._get_cache_metadata()
-
-        if not self._is_cache_valid(metadata):
-            shutil.rmtree(cache_path)
+        try:
+            metadata = self._get_cache_metadata()
+        except (IOError, OSError, ValueError):
+            warnings.warn("Cache metadata is erroneous, invalidating cache")
+            metadata = {}
+
+        extended = bool(metadata) and self.__is_trace_extended(metadata)
+        if not metadata or \
+           not (extended or self._is_cache_valid(metadata)):
+            shutil.rmtree(cache_path, ignore_errors=True)
             return
 
+        # The modification time of the cache is when it was last used
+        if self.cache_dir:
+            try:
+                os.utime(cache_path, None)
+            except OSError:
+                pass
+
         # Load metadata
         self._load_metadata_from_cache(metadata)
         self.max_window = self._calc_max_window()
 
-        # Load trace data
+        # Load trace data, except for the events that were cached by a
+        # parser that has changed since
+        fingerprints = metadata.get("events", {})
+        trace_classes = [c for c in self.trace_classes
+                         if fingerprints.get(c.__class__.__name__) ==
+                         c.cache_fingerprint()]
+
+        # Parsing the lines appended to the trace is only enough if all
+        # the events are cached
+        if extended and len(trace_classes) != len(self.trace_classes):
+            shutil.rmtree(cache_path, ignore_errors=True)
+            self._time_index = None
+            return
+
+        rows = metadata.get("rows", {})
+        self._map_cache_io(
+            lambda c: self.__read_cache_entry(
+                c, rows.get(c.__class__.__name__)),
+            trace_classes)
+
+        if extended:
+            self.__start_cache_extension(metadata)
+
+    def __start_cache_extension(self, metadata):
+        """Set up the parse of the lines appended to the trace
+
+        The events read from the cache are put aside, to be joined with
+        the events of the new lines by :meth:`__finish_cache_extension`
+        """
+        if not all(c.cached for c in self.trace_classes):
+            # Some events couldn't be read, parse the whole trace again
+            for trace_class in self.trace_classes:
+                trace_class.cached = False
+                trace_class.data_frame = pd.DataFrame()
+            self._time_index = None
+            return
+
+        self._cache_extension = metadata
         for trace_class in self.trace_classes:
-            try:
-                csv_file = self._get_csv_path(trace_class)
-                trace_class.read_csv(csv_file)
-                trace_class.cached = True
-            except:
-                warnstr = "TRAPpy: Couldn't read {} from cache, reading it from trace".format(trace_class)
-                warnings.warn(warnstr)
+            self.__cached_frames[trace_class] = trace_class.data_frame
+            trace_class.data_frame = pd.DataFrame()
+            trace_class.cached = False
+
+    def __finish_cache_extension(self):
+        """Add the events read from the cache before the new ones"""
+        for (trace_class, cached_dfr) in self.__cached_frames.items():
+            self.__cached_lengths[trace_class] = len(cached_dfr)
+            if not len(trace_class.data_frame):
+                trace_class.data_frame = cached_dfr
+            elif len(cached_dfr):
+                trace_class.data_frame = pd.concat(
+                    [cached_dfr, trace_class.data_frame])
+        self.__cached_frames = {}
+
+        # Index the new lines as well
+        if self._time_index is not None:
+            size = self._cache_extension["size"]
+            lines = self._cache_extension["lines"]
+            self._time_index = self._time_index + [
+                [timestamp, offset, line + lines] for (timestamp, offset, line)
+                in _build_time_index(self.trace_path, size, TIME_INDEX_INTERVAL)]
+
+    def __read_cache_entry(self, trace_class, length=None):
+        """Read the DataFrame of an event from the cache
+
+        If it can't be read, the event is parsed from the trace instead.
+
+        :param length: The number of rows of the event in the cache
+        """
+        try:
+            self._get_cache_format().read(
+                trace_class, self._get_class_cache_path(trace_class), length)
+            trace_class.cached = True
+        except (IOError, OSError, ValueError, KeyError, EOFError) as err:
+            warnstr = "TRAPpy: Couldn't read {} from cache, reading it from trace: {}".format(
+                trace_class.__class__.__name__, err)
+            warnings.warn(warnstr)
 
     def _load_metadata_from_cache(self, metadata):
         # By default, some amount of metadata is loaded from metadata.json
@@ -302,6 +1411,7 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
         # providing it has been saved by overriding _get_extra_data_to_cache
         self.basetime = metadata["basetime"]
         self.endtime = metadata["endtime"]
+        self._time_index = metadata.get("time_index")
 
     def _apply_user_parameters(self):
         # Traces are read without any window consideration, so we apply
@@ -324,16 +1434,53 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
         self._parsing_setup()
 
         self.__parse_trace_file(self.file_to_parse)
-        self.finalize_objects()
+        # The events read from the cache when it's extended with the end
+        # of the trace are joined with the new ones straight away
+        if self.lazy and not self._cache_extension:
+            self.__deferred_classes = set(c for c in self.trace_classes
+                                          if not c.cached)
+        else:
+            for trace_class in self.trace_classes:
+                self.__add_window_samples(trace_class)
+            self.finalize_objects()
+            for trace_class in self.trace_classes:
+                self.__drop_window_samples(trace_class)
+        if self._cache_extension:
+            self.__finish_cache_extension()
 
-        # Update (or create) cache directory
-        if not self.__class__.disable_cache:
+        # Update (or create) cache directory, unless only part of the
+        # trace was parsed because of the window
+        if not self.__class__.disable_cache and not self._parsed_partially:
             self._update_cache()
 
         self._apply_user_parameters()
 
         self._parsing_teardown()
 
+        for trace_class in self.__deferred_classes:
+            trace_class.tracer = self
+            trace_class.defer_dataframe(self.__create_deferred_dataframe)
+
+    def __create_deferred_dataframe(self, trace_class):
+        """Create the DataFrame of an event of a lazy parse
+
+        This does what the parse of the trace does for the other events:
+        the event is added to the cache, and the window and time
+        normalization are applied to it.
+        """
+        self.__deferred_classes.discard(trace_class)
+        self.__add_window_samples(trace_class)
+        trace_class.create_dataframe()
+        trace_class.finalize_object()
+        self.__drop_window_samples(trace_class)
+
+        if not self.__class__.disable_cache and not self._parsed_partially:
+            self._update_cache([trace_class])
+
+        self._windowify_class(trace_class, self.max_window)
+        if self.normalized_time:
+            trace_class.normalize_time(self.basetime)
+
     def _parsing_setup(self):
         # By default, the file pointed by trace_path is parsed. However, an
         # intermediate file could be required. Subclasses can override this
@@ -350,6 +1497,13 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
         class definitions list.  Otherwise, register a class to parse
         that event
 
+        """
+        self.class_definitions.update(self.__get_event_classes(events))
+
+    def __get_event_classes(self, events):
+        """Return the classes that parse events, indexed by their name
+
+        Events unknown to trappy get a new class to parse them.
         """
 
         from trappy.dynamic import DynamicTypeFactory, default_init
@@ -360,12 +1514,13 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
                       self.dynamic_classes]
         known_events = {k: v for sc in all_scopes for k, v in sc.items()}
 
+        event_classes = OrderedDict()
         for event_name in events:
             for cls in known_events.values():
                 if (event_name == cls.unique_word) or \
                    (event_name + ":" == cls.unique_word) or \
                    (event_name == cls.name):
-                    self.class_definitions[cls.name] = cls
+                    event_classes[cls.name] = cls
                     break
             else:
                 kwords = {
@@ -374,76 +1529,235 @@ subclassed by FTrace (for parsing FTrace coming from trace-cmd) and SysTrace."""
                     "name": event_name,
                 }
                 trace_class = DynamicTypeFactory(event_name, (Base,), kwords)
-                self.class_definitions[event_name] = trace_class
-
-    def __get_trace_class(self, line, cls_word):
-        trace_class = None
-        for unique_word, cls in cls_word.items():
-            if unique_word in line:
-                trace_class = cls
-                if not cls.fallback:
-                    return trace_class
-        return trace_class
+                event_classes[event_name] = trace_class
 
-    def __populate_data(self, fin, cls_for_unique_word):
+        return event_classes
+
+    def __populate_data(self, fin, dispatch, state):
         """Append to trace data from a txt trace"""
+        _populate_events(self.__get_trace_lines(fin, state), dispatch, state)
+
+    def __get_trace_lines(self, fin, state):
+        """Return an iterator on the lines of fin that are part of the trace"""
+        actual_trace = fin
+        # The trace has already started if we seeked into it
+        if not state.offset:
+            actual_trace = itertools.dropwhile(self.trace_hasnt_started(), fin)
+        return itertools.takewhile(self.trace_hasnt_finished(), actual_trace)
+
+    def __find_trace_start(self, trace_file):
+        """Return the byte offset of the first line of the trace"""
+        hasnt_started = self.trace_hasnt_started()
+
+        with io.open(trace_file, 'rb') as fin:
+            offset = 0
+            for line in iter(fin.readline, b""):
+                if not hasnt_started(line.decode('utf-8')):
+                    return offset
+                offset += len(line)
+
+        return offset
+
+    def __get_first_timestamp(self, trace_file, start):
+        """Return the timestamp of the first line of the trace or None"""
+        with io.open(trace_file, 'rb') as fin:
+            fin.seek(start)
+            for line in iter(fin.readline, b""):
+                fields_match = SPECIAL_FIELDS_RE.match(
+                    line.decode('utf-8').rstrip())
+                if fields_match:
+                    return _get_timestamp(fields_match)
+
+        return None
+
+    def _get_time_index(self, trace_file, start):
+        """Return the sparse timestamp index of a text trace
+
+        The index is the one loaded from the cache if trace_file is
+        the trace, otherwise it's built (see :func:`_build_time_index`).
 
-        actual_trace = itertools.dropwhile(self.trace_hasnt_started(), fin)
-        actual_trace = itertools.takewhile(self.trace_hasnt_finished(),
-                                           actual_trace)
+        """
+        if trace_file != self.trace_path or self._time_index is None:
+            self._time_index = _build_time_index(trace_file, start,
+                                                 TIME_INDEX_INTERVAL)
 
-        timestamp = 0
-        for line in actual_trace:
-            trace_class = self.__get_trace_class(line, cls_for_unique_word)
-            line = line.rstrip()
+        return self._time_index
 
-            fields_match = SPECIAL_FIELDS_RE.match(line)
-            if fields_match:
-                comm = fields_match.group('comm')
-                pid = int(fields_match.group('pid'))
-                cpu = int(fields_match.group('cpu'))
+    def __seek_window(self, trace_file, state, window=None):
+        """Set up state to only parse the window of the trace
 
-                # The timestamp, depending on the trace_clock configuration, can be
-                # reported either in [s].[us] or [ns] format. Let's ensure that we
-                # always generate DF which have the index expressed in:
-                #    [s].[decimals]
-                _timestamp = float(fields_match.group('timestamp'))
-                if not fields_match.group('us'):
-                    _timestamp /= 1e9
-
-                # Make sure that each event has a unique timestamp in the trace, so
-                # that the ordering of events is preserved when dispatching them in
-                # different dataframes, and joining the dataframes back.
-                if _timestamp > timestamp:
-                    timestamp = _timestamp
-                else:
-                    # nextafter will pick the next representable float value toward
-                    # +inf, so that the increment is kept as small as possibly can,
-                    # while ensuring correct ordering. The increment is done at
-                    # around the 16th least significant digit, so as long as the
-                    # timestamps are under 10e7 seconds (~115 days),
-                    # nanosecond-based computation should not really see any
-                    # difference. Normalized timestamps can help keeping the
-                    # absolute value down.
-                    timestamp = np.nextafter(timestamp, math.inf)
-
-                if not self.basetime:
-                    self.basetime = timestamp
-                    # Now that we know the basetime, we can derive max_window
-                    self.max_window = self._calc_max_window()
+        Sets the timestamp at which parsing can stop and, if the window
+        doesn't start at the beginning of the trace, the byte offset of
+        a line shortly before the window start, found with the sparse
+        timestamp index.  Parsing from there gives the same events in
+        the window as parsing from the beginning, as long as the trace is
+        roughly sorted.
 
-                if trace_class:
-                    data_str = fields_match.group('data')
+        :param window: A window relative to the beginning of the trace
+            to use instead of the window and abs_window of the trace
 
-                    # Remove empty arrays from the trace
-                    if "={}" in data_str:
-                        data_str = re.sub(r"[A-Za-z0-9_]+=\{\} ", r"", data_str)
+        """
+        if window is None:
+            no_window = self.window == (0, None) and \
+                        self.abs_window == (0, None)
+            calc_window = self._calc_max_window
+        else:
+            no_window = tuple(window) == (0, None)
+            calc_window = lambda basetime: [
+                basetime + window[0],
+                None if window[1] is None else basetime + window[1]]
+
+        # Lines appended to a cached trace are all parsed, so that they
+        # can be cached
+        if state.offset or no_window:
+            return
 
-                    trace_class.append_data(timestamp, comm, pid, cpu, self.lines, data_str)
+        start = self.__find_trace_start(trace_file)
+        basetime = state.basetime
+        if basetime is None:
+            basetime = self.__get_first_timestamp(trace_file, start)
+            if basetime is None:
+                return
+
+        window_start, window_end = calc_window(basetime)
+        # Like _windowify_class(), a window end of 0 means no end
+        state.window_end = window_end or None
 
-            self.lines += 1
+        if window_start <= basetime:
+            return
 
-        self.endtime = timestamp
+        index = self._get_time_index(trace_file, start)
+        before_start = [i for i, (timestamp, _, _) in enumerate(index)
+                        if timestamp < window_start]
+        # Leave an entry of margin for events slightly out of order
+        if len(before_start) < 2:
+            return
+        _, offset, line = index[before_start[-1] - 1]
+
+        state.basetime = basetime
+        state.offset = offset
+        state.line = line
+
+    def __split_trace_file(self, trace_file, num_chunks, start=None):
+        """Split the trace in chunks of whole lines
+
+        Returns a list of (start, end, first) tuples as expected by
+        _parse_chunk().  The trace starts at the byte offset start, or is
+        looked for from the beginning of the file if it's None.
+
+        """
+        first_chunk = start is None
+        if first_chunk:
+            start = self.__find_trace_start(trace_file)
+        size = os.path.getsize(trace_file)
+        chunk_size = max((size - start) // num_chunks, 1)
+
+        offsets = [start]
+        with io.open(trace_file, 'rb') as fin:
+            while offsets[-1] + chunk_size < size:
+                fin.seek(offsets[-1] + chunk_size)
+                # Move to the beginning of the next line
+                fin.readline()
+                offsets.append(fin.tell())
+        offsets.append(size)
+
+        # The last line may end exactly at the end of the file
+        offsets = sorted(set(offsets))
+        return [(begin, end, first_chunk and begin == start)
+                for begin, end in zip(offsets[:-1], offsets[1:])]
+
+    def __populate_data_parallel(self, trace_file, cls_for_unique_word, state):
+        """Append to trace data from a txt trace using a pool of processes
+
+        The trace is split in chunks of lines that are parsed independently
+        and then appended in order to the parsers, with line numbers shifted
+        by the number of lines in the chunks before them.
+
+        """
+        import multiprocessing
+
+        # Give the workers a few chunks each to even out the load
+        chunks = self.__split_trace_file(trace_file, self.parallel * 4,
+                                         state.offset or None)
+        fallback_for_unique_word = {unique_word: trace_class.fallback
+                                    for unique_word, trace_class in
+                                    cls_for_unique_word.items()}
+        initargs = (trace_file, fallback_for_unique_word,
+                    self.trace_hasnt_finished(), state.window_end)
+
+        pool = multiprocessing.get_context("fork").Pool(
+            self.parallel, _init_chunk_worker, initargs)
+        try:
+            results = pool.imap(_parse_chunk, chunks)
+
+            for (events, num_lines, basetime, timestamp, last_skipped,
+                 finished, truncated) in results:
+                if state.basetime is None:
+                    state.basetime = basetime
+                    state.timestamp = timestamp
+
+                for unique_word, arrays in events.items():
+                    times, comms, pids, cpus, lines, data = arrays
+                    lines = [line + state.line for line in lines]
+                    cls_for_unique_word[unique_word].extend_data(
+                        times, comms, pids, cpus, lines, data)
+
+                # Only the skipped lines after the last event matter
+                if events or last_skipped is not None:
+                    state.last_skipped = last_skipped
+
+                state.line += num_lines
+                if truncated:
+                    state.truncated = True
+                if finished or truncated:
+                    break
+        finally:
+            pool.terminate()
+
+    def _finalize_timestamps(self, state, trace_classes):
+        """Make the timestamps of the parsed events unique
+
+        Make sure that each event has a unique timestamp in the trace, so
+        that the ordering of events is preserved when dispatching them in
+        different dataframes, and joining the dataframes back.  This is done
+        across all the events, in the order they appear in the trace.
+
+        The increment is done with np.nextafter() (see
+        _make_timestamps_unique()), at around the 16th least significant
+        digit, so as long as the timestamps are under 10e7 seconds (~115
+        days), nanosecond-based computation should not really see any
+        difference.  Normalized timestamps can help keeping the absolute
+        value down.
+
+        Lines that no parser consumes are not part of the sequence, except
+        for the first line of the trace and the lines after the last event,
+        which count for the endtime.  Older versions of trappy made the
+        timestamps of all the lines unique, so an event that follows such
+        a line with the same timestamp, or a later one out of order, can
+        get a timestamp one ulp smaller than it used to.  The order of the
+        events is the same.
+
+        It also sets the basetime and endtime of the trace.
+
+        """
+        trace_classes = [c for c in trace_classes if c.time_array]
+
+        if trace_classes:
+            state.timestamp = _make_event_timestamps_unique(trace_classes,
+                                                            state.timestamp)
+
+        if state.last_skipped is not None:
+            state.timestamp = max(state.last_skipped,
+                                  np.nextafter(state.timestamp, math.inf))
+            state.last_skipped = None
+
+        if not self.basetime and state.basetime is not None:
+            self.basetime = state.basetime
+            # Now that we know the basetime, we can derive max_window
+            self.max_window = self._calc_max_window()
+
+        self.endtime = state.timestamp
+        self.lines = state.line
 
     def trace_hasnt_started(self):
         """Return a function that accepts a line and returns true if this line
@@ -476,6 +1790,288 @@ is part of the trace.
         """
         return lambda x: True
 
+    def _populate_trace_data(self, trace_file, cls_for_unique_word, state):
+        """Append the events of trace_file to the parsers that consume them
+
+        :param cls_for_unique_word: The parsers to populate, indexed by
+            their unique_word
+        :type cls_for_unique_word: dict
+
+        :param state: The :class:`_ParserState` of the parse, updated
+            with the number of lines of the trace, its basetime and the
+            timestamp of the last lines that were not dispatched
+
+        Subclasses of GenericFTrace may override this to read traces
+        that are not text files.  If only the window of the trace is
+        parsed, they should fill the samples_before and samples_after of
+        state with the lines that were not parsed (see
+        :func:`_sample_lines`).
+
+        """
+        resume_offset = state.offset
+        self.__seek_window(trace_file, state)
+
+        if self.parallel and self.parallel > 1:
+            self.__populate_data_parallel(trace_file, cls_for_unique_word,
+                                          state)
+        else:
+            with io.open(trace_file, 'rb') as fin:
+                fin.seek(state.offset)
+                with io.TextIOWrapper(fin, encoding='utf-8') as text:
+                    self._populate_lines(text, cls_for_unique_word, state)
+
+        # Sample the lines before and after the window that was parsed.
+        # The lines after the window are sampled from its beginning, the
+        # events of the window that are sampled as well don't matter.
+        start = self.__find_trace_start(trace_file)
+        if state.offset != resume_offset:
+            state.samples_before = _sample_trace(
+                trace_file, start, state.offset, self.trace_hasnt_finished())
+        if state.truncated:
+            state.samples_after = _sample_trace(
+                trace_file, max(start, state.offset), None,
+                self.trace_hasnt_finished())
+
+    def _populate_lines(self, lines, cls_for_unique_word, state):
+        """Append the events found in lines to the parsers that consume them
+
+        :param lines: An iterable of the lines of the trace, e.g. a file
+            or a pipe
+
+        See :meth:`_populate_trace_data` for the other parameters.
+        """
+        self.__populate_data(lines, EventDispatcher(cls_for_unique_word), state)
+
+    def _populate_trace_batches(self, trace_file, cls_for_unique_word, state,
+                                window=(0, None)):
+        """Append the events of trace_file to the parsers a batch at a time
+
+        A generator that yields each time a batch of lines of the trace
+        has been parsed, see :meth:`_populate_trace_data` for the
+        parameters.
+
+        :param window: Window of the trace that is needed, relative to its
+            beginning.  Events outside of it may be parsed as well.
+
+        Subclasses of GenericFTrace that override
+        :meth:`_populate_trace_data` should override this too.
+        """
+        self.__seek_window(trace_file, state, window)
+
+        with io.open(trace_file, 'rb') as fin:
+            fin.seek(state.offset)
+            with io.TextIOWrapper(fin, encoding='utf-8') as text:
+                for batch in self._populate_line_batches(
+                        text, cls_for_unique_word, state):
+                    yield batch
+
+    def _populate_line_batches(self, lines, cls_for_unique_word, state):
+        """Append the events found in lines to the parsers a batch at a time
+
+        See :meth:`_populate_trace_batches`.
+        """
+        dispatch = EventDispatcher(cls_for_unique_word)
+        lines = self.__get_trace_lines(lines, state)
+
+        while not state.truncated:
+            batch = list(itertools.islice(lines, ITER_BATCH_LINES))
+            if not batch:
+                break
+
+            _populate_events(batch, dispatch, state)
+            yield
+
+    def iter_events(self, events=None, window=(0, None)):
+        """Iterate over the events of the trace, in the order of the trace
+
+        The trace is read again, a few thousand lines at a time, and the
+        events are yielded as :class:`TraceEvent` objects, so the memory
+        used doesn't grow with the size of the trace.  Their fields are
+        parsed without creating a :mod:`pandas.DataFrame`, but they are
+        named like its columns, the fields that an event doesn't have are
+        NaN and arrays are padded with zeros to the same length for all
+        the events.  These are found in a sample of the trace when it's a
+        text file, fields or longer arrays that only appear outside of it
+        are added from the batch of lines where they are found.  The
+        values are the ones parsed, they aren't changed by
+        :meth:`~trappy.base.Base.finalize_object`.  trace.dat files read
+        with the "native" dat_reader are read in one go, the other ones
+        are streamed.
+
+        :param events: The events to iterate over, as in the events
+            parameter of :class:`FTrace`.  It defaults to the events of
+            the trace.
+        :param window: Only yield the events in this window, given as a
+            tuple of the start and end times relative to the beginning of
+            the trace.  The end can be None to go until the end of the
+            trace.
+
+        :type events: list
+        :type window: tuple
+        """
+        if events is None:
+            event_classes = self.class_definitions
+        else:
+            event_classes = self.__get_event_classes(listify(events))
+
+        comm_symbols = SymbolTable()
+        trace_classes = OrderedDict()
+        for (name, event_class) in event_classes.items():
+            trace_class = event_class()
+            trace_class.comm_symbols = comm_symbols
+            trace_class.tracer = self
+            trace_classes[name] = trace_class
+
+        cls_for_unique_word = {c.unique_word: c for c in trace_classes.values()}
+        state = _ParserState(basetime=self.basetime or None)
+        if window[1] is not None and state.basetime is not None:
+            state.window_end = state.basetime + window[1]
+
+        self._parsing_setup()
+        try:
+            event_fields = self.__sample_event_fields(cls_for_unique_word)
+            batches = self._populate_trace_batches(
+                self.file_to_parse, cls_for_unique_word, state, window)
+            for _ in batches:
+                for event in self.__get_batch_events(trace_classes, state,
+                                                     window, event_fields):
+                    yield event
+        finally:
+            self._parsing_teardown()
+
+    def __sample_event_fields(self, cls_for_unique_word):
+        """Return the :class:`_EventFields` of the parsers for iter_events()
+
+        If the trace is a text file, the fields of the events and the
+        lengths of their arrays are found in the lines sampled by
+        :func:`_sample_trace`, so that the events of the first batches
+        get the fields that events later in the trace have.  Otherwise,
+        the fields are only found as the batches are parsed.
+        """
+        event_fields = {}
+        for trace_class in cls_for_unique_word.values():
+            # The events of a batch are all parsed when it's done
+            trace_class.chunk_size = None
+            event_fields[trace_class] = _EventFields(trace_class)
+
+        if not self._parses_trace_text():
+            return event_fields
+
+        dispatch = EventDispatcher(cls_for_unique_word)
+        samples = OrderedDict()
+        for line in _sample_trace(self.file_to_parse,
+                                  self.__find_trace_start(self.file_to_parse),
+                                  None, self.trace_hasnt_finished()):
+            trace_class = dispatch(line)
+            if trace_class:
+                samples.setdefault(trace_class, []).append(line)
+
+        for (trace_class, lines) in samples.items():
+            sample_class = type(trace_class)()
+            sample_class.chunk_size = None
+            sample_class.tracer = self
+            _populate_events(lines, lambda line: sample_class, _ParserState())
+
+            fields = event_fields[trace_class]
+            fields.update(sample_class.parse_fields(fields.array_lengths))
+
+        return event_fields
+
+    def __get_batch_events(self, trace_classes, state, window, event_fields):
+        """Turn the events appended to the parsers into :class:`TraceEvent`"""
+        parsed = [c for c in trace_classes.values() if c.time_array]
+        if not parsed:
+            return []
+        state.timestamp = _make_event_timestamps_unique(parsed,
+                                                        state.timestamp)
+
+        basetime = state.basetime
+        start = basetime + window[0]
+        end = None if window[1] is None else basetime + window[1]
+        offset = basetime if self.normalize_time else 0
+
+        event_lists = []
+        for (name, trace_class) in trace_classes.items():
+            if not trace_class.time_array:
+                continue
+
+            fields = event_fields[trace_class]
+            events = trace_class.parse_fields(fields.array_lengths)
+            fields.update(events)
+
+            event_lists.append([
+                TraceEvent(name, time - offset, comm, pid, cpu, line,
+                           fields.get_fields(data))
+                for (time, comm, pid, cpu, line, data) in events
+                if time >= start and (end is None or time <= end)])
+
+        return heapq.merge(*event_lists, key=lambda event: event.line)
+
+    def timeline(self, events=None):
+        """Return the events of the trace in a single DataFrame
+
+        The rows of the DataFrames of the events are merged in the order
+        of the trace (their :code:`__line`).  The :code:`__event` column
+        is a categorical with the name of the event of each row, and the
+        columns of the data of the events are the union of the columns of
+        all of them, NaN for the events that don't have them.  This is
+        useful for analyses that follow several events at once, like
+        sched_switch, cpu_frequency and cpu_idle:
+        ::
+
+            timeline = trace.timeline(["sched_switch", "cpu_frequency"])
+            for row in timeline.itertuples():
+                ...
+
+        The timeline is only created the first time it is requested, so
+        it must not be modified.
+
+        :param events: The names of the events of the trace to merge.
+            It defaults to all of them.
+        :type events: list
+
+        :raises ValueError: if one of the events is not in the trace, or
+            has no :code:`__line` column
+        """
+        if events is None:
+            events = list(self.class_definitions)
+        else:
+            events = listify(events)
+
+        key = tuple(events)
+        if key not in self._timelines:
+            self._timelines[key] = self.__create_timeline(events)
+        return self._timelines[key]
+
+    def __create_timeline(self, events):
+        """Merge the DataFrames of events for :meth:`timeline`"""
+        for name in events:
+            if name not in self.class_definitions:
+                raise ValueError("{} is not an event of the trace".format(name))
+
+        dfrs = [getattr(self, name).data_frame for name in events]
+        codes = np.repeat(np.arange(len(events)), [len(dfr) for dfr in dfrs])
+        dfrs = [dfr for dfr in dfrs if len(dfr)]
+        if not dfrs:
+            return pd.DataFrame(
+                {"__event": pd.Categorical([], categories=events)},
+                index=pd.Index([], name="Time"))
+
+        for dfr in dfrs:
+            if "__line" not in dfr.columns:
+                raise ValueError("Events with no __line column can't be "
+                                 "merged in a timeline")
+
+        # The frames are sorted, so the stable sort only has to merge
+        # their runs of lines
+        timeline = pd.concat(dfrs, sort=False)
+        order = np.argsort(timeline["__line"].to_numpy(), kind="stable")
+        timeline = timeline.iloc[order]
+        timeline.insert(0, "__event", pd.Categorical.from_codes(
+            codes[order], categories=events))
+
+        return timeline
+
     def __parse_trace_file(self, trace_file):
         """parse the trace and create a pandas DataFrame"""
 
@@ -495,15 +2091,102 @@ is part of the trace.
                                            cls_for_unique_word[unique_word]))
             cls_for_unique_word[unique_word] = trace_class
 
+        state = _ParserState(basetime=self.basetime or None)
+
+        # Carry on from where the parse of the cached trace stopped
+        resume_offset = 0
+        if self._cache_extension:
+            resume_offset = self._cache_extension["size"]
+            state.offset = resume_offset
+            state.line = self._cache_extension["lines"]
+            state.timestamp = self._cache_extension["endtime"]
+
         try:
-            with io.open(trace_file, 'r', encoding='utf-8') as fin:
-                self.lines = 0
-                self.__populate_data(
-                    fin, cls_for_unique_word)
+            self._populate_trace_data(trace_file, cls_for_unique_word, state)
         except FTraceParseError as e:
             raise ValueError('Failed to parse ftrace file {}:\n{}'.format(
                 trace_file, str(e)))
 
+        self._finalize_timestamps(state, cls_for_unique_word.values())
+
+        self._parsed_partially = state.truncated or \
+                                 state.offset != resume_offset
+        if self._parsed_partially:
+            self.__window_samples = self.__get_window_samples(
+                state, cls_for_unique_word)
+        if state.truncated and os.path.isfile(trace_file):
+            # The rest of the trace was not parsed, get the end of the
+            # trace from its last line
+            last_timestamp = _find_last_timestamp(trace_file)
+            if last_timestamp is not None:
+                self.endtime = max(self.endtime, last_timestamp)
+
+    @staticmethod
+    def __get_window_samples(state, cls_for_unique_word):
+        """Return the sampled lines outside of the window, by parser
+
+        :returns: A dictionary of tuples of the lines before and after
+            the window
+        """
+        dispatch = EventDispatcher(cls_for_unique_word)
+        samples = {}
+        for (idx, lines) in enumerate([state.samples_before,
+                                       state.samples_after]):
+            for line in lines:
+                trace_class = dispatch(line)
+                if trace_class:
+                    samples.setdefault(trace_class, ([], []))[idx].append(line)
+
+        return samples
+
+    def __add_window_samples(self, trace_class):
+        """Append the events sampled outside of the window to a parser
+
+        They are parsed with the events of the window, so that its
+        DataFrame gets the columns, and their types, that it has when the
+        whole trace is parsed, even if some events outside of the window
+        have fields that the ones in the window don't.  Only the fields
+        of the events in the lines sampled by :func:`_sample_trace` are
+        found in large traces.  They are removed
+        by :meth:`__drop_window_samples` once the DataFrame is created.
+        """
+        samples = self.__window_samples.get(trace_class)
+        if not samples:
+            return
+
+        num_events = len(trace_class.time_array)
+        last_timestamp = trace_class.time_array[-1] if num_events else 0.0
+        _populate_events(samples[0] + samples[1], lambda line: trace_class,
+                         _ParserState())
+
+        # Keep the timestamps of the events of the window unique
+        times = trace_class.time_array[num_events:]
+        trace_class.time_array[num_events:] = array(
+            "d", _make_timestamps_unique(times, last_timestamp).tobytes())
+
+    def __drop_window_samples(self, trace_class):
+        """Remove the events added by :meth:`__add_window_samples`"""
+        samples = self.__window_samples.pop(trace_class, None)
+        if not samples:
+            return
+
+        (before, after) = samples
+        dfr = trace_class.data_frame
+        dfr = dfr.iloc[:len(dfr) - len(before) - len(after)]
+
+        # The columns of the events before the window come first, as
+        # they do when the whole trace is parsed
+        if before:
+            sample_class = type(trace_class)()
+            sample_class.tracer = self
+            _populate_events(before, lambda line: sample_class, _ParserState())
+            sample_class.create_dataframe()
+            sample_class.finalize_object()
+            first = list(sample_class.data_frame.columns)
+            dfr = dfr[first + [col for col in dfr.columns if col not in first]]
+
+        trace_class.data_frame = dfr
+
     def __getattr__(self, attr):
         """Raises useful exception when trying to access deprecated
         attributes."""
@@ -568,7 +2251,7 @@ is part of the trace.
 
         return ret
 
-    def apply_callbacks(self, fn_map):
+    def apply_callbacks(self, fn_map, batch=False):
         """
         Apply callback functions to trace events in chronological order.
 
@@ -584,38 +2267,63 @@ is part of the trace.
             "sched_switch": callback_fn1,
             "sched_wakeup": callback_fn2
         })
+
+        :param batch: If True, the functions are called once for each run
+            of consecutive events of the same type instead of once per
+            event.  The dictionary they are passed maps 'Index' and the
+            column names to :mod:`numpy` arrays with the values of the
+            events of the run.
+        :type batch: bool
         """
         dfs = {event: getattr(self, event).data_frame for event in fn_map.keys()}
         events = [event for event in fn_map.keys() if not dfs[event].empty]
-        iters = {event: dfs[event].itertuples() for event in events}
-        next_rows = {event: next(iterator) for event,iterator in iters.items()}
-
-        # Column names beginning with underscore will not be preserved in tuples
-        # due to constraints on namedtuple field names, so store mappings from
-        # column name to column number for each trace event.
-        col_idxs = {event: {
-            name: idx for idx, name in enumerate(
-                ['Index'] + dfs[event].columns.tolist()
-            )
-        } for event in events}
-
-        def getLine(event):
-            line_col_idx = col_idxs[event]['__line']
-            return next_rows[event][line_col_idx]
-
-        while events:
-            event_name = min(events, key=getLine)
-            event_tuple = next_rows[event_name]
-
-            event_dict = {
-                col: event_tuple[idx] for col, idx in col_idxs[event_name].items()
-            }
-            fn_map[event_name](event_dict)
-            event_row = next(iters[event_name], None)
-            if event_row:
-                next_rows[event_name] = event_row
-            else:
-                events.remove(event_name)
+        if not events:
+            return
+
+        (run_codes, run_lengths) = self.__get_event_runs(
+            [dfs[event]["__line"].to_numpy() for event in events])
+        fns = [fn_map[event] for event in events]
+        keys = [['Index'] + dfs[event].columns.tolist() for event in events]
+
+        if batch:
+            arrays = [[dfs[event].index.to_numpy()] +
+                      [dfs[event][col].to_numpy() for col in dfs[event].columns]
+                      for event in events]
+            starts = [0] * len(events)
+            for (code, length) in zip(run_codes.tolist(), run_lengths.tolist()):
+                (start, end) = (starts[code], starts[code] + length)
+                fns[code]({key: values[start:end] for (key, values)
+                           in zip(keys[code], arrays[code])})
+                starts[code] = end
+            return
+
+        rows = [dfs[event].itertuples(name=None) for event in events]
+        for (code, length) in zip(run_codes.tolist(), run_lengths.tolist()):
+            (fn, event_keys) = (fns[code], keys[code])
+            for row in itertools.islice(rows[code], length):
+                fn(dict(zip(event_keys, row)))
+
+    @staticmethod
+    def __get_event_runs(lines):
+        """Merge the events in the order of their lines
+
+        The rows of each event keep the order they have in its DataFrame:
+        a row that has a smaller line than the previous one comes right
+        after it.  Consecutive events of the same type are grouped in runs.
+
+        :param lines: The :code:`__line` column of each event
+        :type lines: list of :mod:`numpy.ndarray`
+
+        :returns: A tuple of two arrays, the index in lines of the event
+            of each run and the number of events in the run.
+        """
+        codes = np.repeat(np.arange(len(lines)), [len(col) for col in lines])
+        keys = np.concatenate([np.maximum.accumulate(col) for col in lines])
+        codes = codes[np.argsort(keys, kind="stable")]
+
+        run_starts = np.flatnonzero(np.diff(codes)) + 1
+        run_lengths = np.diff(np.concatenate([[0], run_starts, [len(codes)]]))
+        return (codes[np.concatenate([[0], run_starts])], run_lengths)
 
     def plot_freq_hists(self, map_label, ax):
         """Plot histograms for each actor input and output frequency
@@ -780,6 +2488,25 @@ class FTrace(GenericFTrace):
         represent timestamps that are not normalized, (i.e. the ones
         you find in the trace file). The window is inclusive.
 
+    :param parallel: Number of processes used to parse the trace.  If
+        it is bigger than 1, the trace is split in chunks of lines that
+        are parsed in a pool of processes.  The result is the same as
+        parsing the trace in this process.
+
+    :param lazy: If True, the lines of each event are only collected
+        when the trace is parsed, and the :mod:`pandas.DataFrame` of an
+        event is created, and cached, the first time it is accessed.
+        Events that were cached are read from the cache as usual.
+
+    :param dat_reader: How trace.dat files are read.  "trace-cmd" (the
+        default) converts them to text with "trace-cmd report" and
+        parses the resulting file.  "pipe" parses the output of
+        "trace-cmd report" as it is produced, without storing it in
+        memory or in a temporary file, but can't be combined with
+        parallel.  "native" decodes the binary file directly, which
+        doesn't need trace-cmd installed and avoids going through the
+        text of the trace.  It only supports the version 6 of the
+        trace.dat format.
 
     :type path: str
     :type name: str
@@ -788,6 +2515,17 @@ class FTrace(GenericFTrace):
     :type events: list
     :type window: tuple
     :type abs_window: tuple
+    :param cache_dir: Directory of a cache shared by all the traces, in
+        which the cache of this trace is kept instead of next to it.  It
+        defaults to the TRAPPY_CACHE_DIR environment variable.  The cache
+        of a trace is found by the contents of the trace, not its path,
+        and the least recently used traces are removed from it when it
+        grows over :attr:`GenericFTrace.cache_size_limit`.
+
+    :type parallel: int
+    :type lazy: bool
+    :type dat_reader: str
+    :type cache_dir: str
 
     This is a simple example:
     ::
@@ -798,17 +2536,39 @@ class FTrace(GenericFTrace):
     """
 
     def __init__(self, path=".", name="", normalize_time=True, scope="all",
-                 events=[], window=(0, None), abs_window=(0, None)):
+                 events=[], window=(0, None), abs_window=(0, None),
+                 parallel=None, dat_reader="trace-cmd", cache_dir=None,
+                 lazy=False):
+
+        if dat_reader not in ("trace-cmd", "pipe", "native"):
+            raise ValueError("Unknown dat_reader: {}".format(dat_reader))
+        if dat_reader == "pipe" and parallel and parallel > 1:
+            raise ValueError("A trace can't be read from a pipe in parallel")
 
         self.raw_events = []
+        self.dat_reader = dat_reader
         self.trace_path = self.__process_path(path)
 
         super(FTrace, self).__init__(name, normalize_time, scope, events,
-                                     window, abs_window)
+                                     window, abs_window, parallel, cache_dir,
+                                     lazy)
 
     def _parsing_setup(self):
         super(FTrace, self)._parsing_setup()
 
+        if self.__reads_dat_natively():
+            with TraceDat(self.trace_path) as trace_dat:
+                metadata = {"version": trace_dat.version,
+                            "cpus": str(trace_dat.cpus)}
+            self.__populate_trace_metadata(metadata)
+            return
+
+        if self.__pipes_report():
+            # The metadata is read from the header of the report while
+            # parsing it
+            self.__populate_trace_metadata({})
+            return
+
         if self.read_from_dat:
             self.file_to_parse = self.__generate_trace_txt(self.trace_path)
 
@@ -821,9 +2581,56 @@ class FTrace(GenericFTrace):
         super(FTrace, self)._parsing_teardown()
 
         # Remove the .txt trace if it was generated from a .dat
-        if self.read_from_dat:
+        if self.read_from_dat and self.dat_reader == "trace-cmd":
             os.remove(self.file_to_parse)
 
+    def _populate_trace_data(self, trace_file, cls_for_unique_word, state):
+        if self.__reads_dat_natively():
+            self.__get_raw_event_list()
+            with TraceDat(trace_file) as trace_dat:
+                _populate_dat_events(trace_dat, cls_for_unique_word,
+                                     self.raw_events, state)
+        elif self.__pipes_report():
+            with self.__open_report_pipe(trace_file) as fin:
+                lines = self.__scan_trace_metadata(fin, state)
+                self._populate_lines(lines, cls_for_unique_word, state)
+                if state.truncated:
+                    # The report can't be sought, only sample its next lines
+                    state.samples_after = _sample_lines(
+                        itertools.chain([state.stop_line + "\n"], lines),
+                        (WINDOW_SAMPLE_BLOCKS + 2) * WINDOW_SAMPLE_SIZE)
+        else:
+            super(FTrace, self)._populate_trace_data(trace_file,
+                                                     cls_for_unique_word, state)
+
+    def _populate_trace_batches(self, trace_file, cls_for_unique_word, state,
+                                window=(0, None)):
+        if self.__reads_dat_natively():
+            self._populate_trace_data(trace_file, cls_for_unique_word, state)
+            yield
+        elif self.__pipes_report():
+            with self.__open_report_pipe(trace_file) as fin:
+                lines = self.__scan_trace_metadata(fin, state)
+                for batch in self._populate_line_batches(
+                        lines, cls_for_unique_word, state):
+                    yield batch
+        else:
+            batches = super(FTrace, self)._populate_trace_batches(
+                trace_file, cls_for_unique_word, state, window)
+            for batch in batches:
+                yield batch
+
+    def _parses_trace_text(self):
+        # A trace.dat read natively is parsed straight from trace_path
+        return not self.read_from_dat and \
+            super(FTrace, self)._parses_trace_text()
+
+    def __reads_dat_natively(self):
+        return self.read_from_dat and self.dat_reader == "native"
+
+    def __pipes_report(self):
+        return self.read_from_dat and self.dat_reader == "pipe"
+
     def _load_metadata_from_cache(self, metadata):
         super(FTrace, self)._load_metadata_from_cache(metadata)
 
@@ -886,17 +2693,7 @@ class FTrace(GenericFTrace):
         """
         from subprocess import run
 
-        cmd = ["trace-cmd", "report", '-t']
-
-        if not os.path.isfile(trace_dat):
-            raise IOError("No such file or directory: {}".format(trace_dat))
-
-        # Ask for the raw event list and request them unformatted
-        self.__get_raw_event_list()
-        for raw_event in self.raw_events:
-            cmd.extend([ '-r', raw_event ])
-
-        cmd.append(trace_dat)
+        cmd = self.__get_report_cmd(trace_dat)
 
         with NamedTemporaryFile(delete=False) as fout:
             try:
@@ -911,6 +2708,62 @@ class FTrace(GenericFTrace):
 
         return fout.name
 
+    @contextlib.contextmanager
+    def __open_report_pipe(self, trace_dat):
+        """Run "trace-cmd report" on trace_dat and read its output as it goes
+
+        Yield a text file object reading the standard output of
+        trace-cmd.  A :exc:`subprocess.CalledProcessError` is raised when
+        leaving the context if trace-cmd failed.  If the report was not
+        read until the end, trace-cmd is killed.
+
+        """
+        from subprocess import Popen, PIPE, CalledProcessError
+
+        cmd = self.__get_report_cmd(trace_dat)
+
+        with TemporaryFile() as ferr:
+            try:
+                proc = Popen(cmd, stdout=PIPE, stderr=ferr)
+            except OSError as exc:
+                if exc.errno == 2 and not exc.filename:
+                    raise OSError(2, "trace-cmd not found in PATH, is it installed?")
+                else:
+                    raise
+
+            try:
+                with io.TextIOWrapper(proc.stdout, encoding='utf-8') as fin:
+                    yield fin
+                    finished = not fin.read(1)
+                    if not finished:
+                        proc.kill()
+            except:
+                proc.kill()
+                raise
+            finally:
+                proc.wait()
+
+            if finished and proc.returncode:
+                ferr.seek(0)
+                raise CalledProcessError(proc.returncode, cmd,
+                                         stderr=ferr.read())
+
+    def __get_report_cmd(self, trace_dat):
+        """Return the "trace-cmd report [ -r raw_event ]* trace_dat" command"""
+        cmd = ["trace-cmd", "report", '-t']
+
+        if not os.path.isfile(trace_dat):
+            raise IOError("No such file or directory: {}".format(trace_dat))
+
+        # Ask for the raw event list and request them unformatted
+        self.__get_raw_event_list()
+        for raw_event in self.raw_events:
+            cmd.extend([ '-r', raw_event ])
+
+        cmd.append(trace_dat)
+
+        return cmd
+
     def __get_raw_event_list(self):
         self.raw_events = []
         # Generate list of events which need to be parsed in raw format
@@ -923,18 +2776,34 @@ class FTrace(GenericFTrace):
                         self.raw_events.append(name)
 
     def __get_trace_metadata(self):
+        res = {}
+
+        with io.open(self.file_to_parse, 'r', encoding='utf-8') as fin:
+            for _ in self.__read_metadata_lines(fin, res):
+                pass
+
+        return res
+
+    def __read_metadata_lines(self, lines, res):
+        """Read the metadata in the header of the trace
+
+        Yield the lines of the header and store the metadata found in
+        them in the res dict.  The generator stops at the first line of
+        the trace, which is not yielded but returned.
+
+        """
         # Meta Data as expected to be found in the parsed trace header
         metadata_keys = ["version", "cpus"]
-        res = {}
 
         for key in metadata_keys:
             setattr(self, "_" + key, None)
 
-        with io.open(self.file_to_parse, 'r', encoding='utf-8') as fin:
-            for line in fin:
-                if not metadata_keys:
-                    return res
+        for line in lines:
+            if SPECIAL_FIELDS_RE.match(line):
+                # Reached a valid trace line, abort metadata population
+                return line
 
+            if metadata_keys:
                 metadata_pattern = r"^\b(" + "|".join(metadata_keys) + \
                                    r")\b\s*=\s*([0-9]+)"
                 match = re.search(metadata_pattern, line)
@@ -942,14 +2811,97 @@ class FTrace(GenericFTrace):
                     res[match.group(1)] = match.group(2)
                     metadata_keys.remove(match.group(1))
 
-                if SPECIAL_FIELDS_RE.match(line):
-                    # Reached a valid trace line, abort metadata population
-                    return res
+            yield line
 
-        return res
+    def __scan_trace_metadata(self, lines, state):
+        """Yield lines, populating the metadata from the header of the trace
+
+        The end of the window is set in state once the first line of the
+        trace gives the basetime.
+
+        """
+        res = {}
+
+        first_trace_line = yield from self.__read_metadata_lines(lines, res)
+
+        self.__populate_trace_metadata(res)
+
+        if first_trace_line is not None:
+            basetime = state.basetime
+            if basetime is None:
+                basetime = _get_timestamp(
+                    SPECIAL_FIELDS_RE.match(first_trace_line.rstrip()))
+            # Like _windowify_class(), a window end of 0 means no end
+            state.window_end = self._calc_max_window(basetime)[1] or None
+
+            yield first_trace_line
+            # Not "yield from", it would close lines if the parser
+            # stops early
+            for line in lines:
+                yield line
 
     def __populate_trace_metadata(self, metadata):
         self.metadata = metadata
 
         for key, value in metadata.items():
             setattr(self, "_" + key, value)
+
+def _cache_trace(job):
+    """Parse a trace to create its cache, in a worker of :func:`load_traces`"""
+    (path, kwargs) = job
+    kwargs = dict(kwargs)
+
+    # The whole trace is cached, the window is applied when the trace is
+    # read from the cache.  A worker of the pool can't have a pool of
+    # its own.
+    for key in ("window", "abs_window", "parallel", "lazy"):
+        kwargs.pop(key, None)
+
+    FTrace(path, **kwargs)
+
+def load_traces(paths, workers=None, **kwargs):
+    """Create the :class:`FTrace` of several traces using a pool of processes
+
+    Each trace is parsed by a worker process, which only writes its
+    cache.  The traces are then read from their cache in this process,
+    which avoids sending their DataFrames from the workers.  Traces that
+    are already cached are not parsed again, and when the cache is
+    disabled the traces are parsed one after the other in this process.
+
+    :param paths: The paths of the traces, as the path parameter of
+        :class:`FTrace`
+    :param workers: Number of processes that parse the traces.  It
+        defaults to the number of CPUs.
+    :param kwargs: The other parameters of :class:`FTrace`, used for all
+        the traces
+
+    :type paths: list
+    :type workers: int
+
+    :returns: A list with the :class:`FTrace` of each path, in the same
+        order as paths
+
+    For example:
+    ::
+
+        traces = trappy.load_traces(["run1", "run2", "run3"], scope="sched")
+    """
+    import multiprocessing
+
+    paths = listify(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # The same trace is only parsed once
+    unique_paths = list(OrderedDict.fromkeys(paths))
+    workers = min(workers, len(unique_paths))
+    if workers > 1 and not FTrace.disable_cache:
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            jobs = [(path, kwargs) for path in unique_paths]
+            for _ in pool.imap_unordered(_cache_trace, jobs):
+                pass
+        finally:
+            pool.terminate()
+
+    return [FTrace(path, **kwargs) for path in paths]
@@ -0,0 +1,221 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Parse a trace while it is being captured"""
+
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import errno
+import io
+import os
+import time
+
+import pandas as pd
+
+from trappy.ftrace import GenericFTrace, EventDispatcher, _ParserState, \
+    _populate_events
+
+# Size of the reads of the trace
+READ_SIZE = 1 << 20
+
+class LiveTrace(GenericFTrace):
+    """A trace that is parsed as it is being written
+
+    The lines written to the trace are parsed by :meth:`poll`, and their
+    events appended to the :mod:`pandas.DataFrame` of each event.  Only
+    the lines written since the previous poll are parsed, a line that is
+    not complete yet is parsed by the poll after it is.  The events of
+    each poll are kept in a separate DataFrame until the one of the event
+    is accessed, so that a poll doesn't copy the events of the previous
+    ones.  The trace is polled once when the object is created.
+
+    Iterating over a LiveTrace polls it forever:
+    ::
+
+        for events in trappy.LiveTrace("trace.txt", retention=10):
+            print(events["sched_switch"])
+
+    The trace is never cached.  It receives the same parameters as
+    :class:`trappy.ftrace.FTrace`, except for the ones below.
+
+    :param path: Path of a text trace that is being written, or of a
+        trace_pipe of ftrace
+    :param retention: Only keep the events in the last retention seconds
+        of the trace, or all the events if None
+    :param poll_interval: Seconds to wait before polling the trace again
+        when iterating, if the last poll didn't find any event
+
+    :type path: str
+    :type retention: float
+    :type poll_interval: float
+    """
+
+    def __init__(self, path, name="", normalize_time=True, scope="all",
+                 events=[], retention=None, poll_interval=1.0):
+        self.trace_path = path
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.offset = 0
+        self.__fd = None
+        self.__pending = b""
+        self.__hasnt_started = self.trace_hasnt_started()
+        self.__started = False
+        self.__state = _ParserState()
+        # The DataFrames of the events of each poll, by parser, that are
+        # merged when the data_frame of the parser is accessed
+        self.__chunks = {}
+
+        super(LiveTrace, self).__init__(name, normalize_time, scope, events)
+
+    def _do_parse(self):
+        self._parsing_setup()
+
+        self.__dispatch = EventDispatcher(
+            {c.unique_word: c for c in self.trace_classes})
+        # A trace_pipe blocks reads until there is something to read
+        self.__fd = os.open(self.file_to_parse, os.O_RDONLY | os.O_NONBLOCK)
+        self.normalized_time = self.normalize_time
+
+        self.poll()
+
+    def __read_lines(self):
+        """Read the trace and return the lines that were completed
+
+        The bytes of the last line are kept for the next call if it's
+        not complete.
+
+        :returns: A tuple of the number of bytes read and the lines
+        """
+        try:
+            data = os.read(self.__fd, READ_SIZE)
+        except OSError as err:
+            if err.errno != errno.EAGAIN:
+                raise
+            data = b""
+
+        buf = self.__pending + data
+        end = buf.rfind(b"\n") + 1
+        self.__pending = buf[end:]
+        self.offset += end
+
+        text = buf[:end].decode("utf-8")
+        lines = list(io.StringIO(text, newline=None))
+
+        # Like the parse of a whole trace, drop the lines before the
+        # beginning of the trace
+        if not self.__started:
+            for (idx, line) in enumerate(lines):
+                if not self.__hasnt_started(line):
+                    self.__started = True
+                    return (len(data), lines[idx:])
+            return (len(data), [])
+
+        return (len(data), lines)
+
+    def poll(self):
+        """Parse the lines written to the trace since the last poll
+
+        :returns: A dictionary of the :mod:`pandas.DataFrame` of the
+            events that were appended to the trace, indexed by the name
+            of the attribute of the event in the trace.  Events that
+            didn't appear in the new lines are not in the dictionary.
+        """
+        state = self.__state
+        while True:
+            (size, lines) = self.__read_lines()
+            if lines:
+                _populate_events(lines, self.__dispatch, state)
+            if not size:
+                break
+
+        self._finalize_timestamps(state, self.trace_classes)
+
+        new_events = {}
+        for (name, trace_class) in self.__get_trace_classes():
+            if not trace_class.time_array:
+                continue
+
+            trace_class.data_frame = pd.DataFrame()
+            trace_class.tracer = self
+            trace_class.create_dataframe()
+            trace_class.finalize_object()
+            if self.normalize_time:
+                trace_class.normalize_time(self.basetime)
+
+            new_events[name] = trace_class.data_frame
+            self.__chunks.setdefault(trace_class, []).append(
+                trace_class.data_frame)
+            trace_class.defer_dataframe(self.__merge_chunks)
+
+        if self.retention is not None:
+            self.__drop_old_events()
+
+        if new_events:
+            self._timelines = {}
+
+        return new_events
+
+    def __get_trace_classes(self):
+        return [(name, getattr(self, name)) for name in self.class_definitions]
+
+    def __merge_chunks(self, trace_class):
+        """Set the data_frame of trace_class from the DataFrames of the polls"""
+        chunks = self.__chunks[trace_class]
+        dfr = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+        self.__chunks[trace_class] = [dfr]
+        trace_class.data_frame = dfr
+
+    def __drop_old_events(self):
+        """Drop the events older than the retention window"""
+        start = self.endtime - self.retention
+        if self.normalize_time:
+            start -= self.basetime
+
+        for (trace_class, chunks) in self.__chunks.items():
+            while len(chunks) > 1 and (not len(chunks[0]) or
+                                       chunks[0].index[-1] < start):
+                del chunks[0]
+
+            dfr = chunks[0]
+            if len(dfr) and dfr.index[0] < start:
+                chunks[0] = dfr[dfr.index >= start]
+                trace_class.defer_dataframe(self.__merge_chunks)
+
+    def __iter__(self):
+        """Poll the trace forever
+
+        Yields the dictionary of new events of each poll that found some,
+        see :meth:`poll`.
+        """
+        while True:
+            new_events = self.poll()
+            if new_events:
+                yield new_events
+            else:
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        """Stop reading the trace"""
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -34,6 +34,7 @@ from trappy.plotter.AbstractDataPlotter import AbstractDataPlotter
 from trappy.plotter import IPythonConf
 from collections import defaultdict
 from copy import deepcopy
+import numpy as np
 
 if not IPythonConf.check_ipython():
     raise ImportError("Ipython Environment not Found")
@@ -66,6 +67,11 @@ class EventPlot(AbstractDataPlotter):
                              ],
                 }
 
+        The events of a name can also be a :mod:`numpy` array with one
+        row per event and the columns event_start, event_end and lane,
+        for instance built from the intervals of
+        :meth:`trappy.sched.SchedSwitch.task_intervals`.
+
         :param data: Input Data
         :type data: dict
 
@@ -129,7 +135,10 @@ class EventPlot(AbstractDataPlotter):
         self._html = []
         self._fig_name = self._generate_fig_name()
         # Function to get the average duration of each event
-        avgFunc = lambda x: sum([(evt[1] - evt[0]) for evt in x]) / float(len(x) + 1)
+        def avgFunc(x):
+            if isinstance(x, np.ndarray):
+                return (x[:, 1] - x[:, 0]).sum() / float(len(x) + 1)
+            return sum([(evt[1] - evt[0]) for evt in x]) / float(len(x) + 1)
         avg = {k: avgFunc(v) for k, v in data.items()}
         # Filter keys with zero average time
         keys = [x for x in avg if avg[x] != 0]
@@ -156,6 +165,11 @@ class EventPlot(AbstractDataPlotter):
         lane_data = {}
         for key, value in data.items():
             lane_data[key] = defaultdict(list)
+            if isinstance(value, np.ndarray):
+                for lane in np.unique(value[:, 2]):
+                    events = value[value[:, 2] == lane, :2]
+                    lane_data[key][int(lane)] = events.tolist()
+                continue
             for tsinfo in value:
                 lane_data[key][tsinfo[2]].append(tsinfo[:2])
         return lane_data
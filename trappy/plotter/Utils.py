@@ -21,8 +21,6 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
-import warnings
-from trappy.utils import listify
 
 
 def normalize_list(val, lst):
@@ -47,55 +45,27 @@ def get_trace_event_data(trace, execnames=None, pids=None):
     """Create a list of objects that can be consumed by EventPlot to plot
     task residency like kernelshark
 
+    The intervals are computed by :func:`trappy.sched.get_task_intervals`.
     """
 
-    if execnames:
-        execnames = listify(execnames)
-
-    if pids:
-        pids = listify(pids)
-
-    data = collections.defaultdict(list)
-    pmap = {}
+    from trappy.sched import get_task_intervals
 
     data_frame = trace.sched_switch.data_frame
     start_idx = data_frame.index.values[0]
     end_idx = data_frame.index.values[-1]
 
-    procs = set()
-
-    for index, row in data_frame.iterrows():
-        prev_pid = row["prev_pid"]
-        next_pid = row["next_pid"]
-        next_comm = row["next_comm"]
-
-        if prev_pid in pmap:
-            name = pmap[prev_pid]
-            data[name][-1][1] = index
-            del pmap[prev_pid]
-
-        name = "{}-{}".format(next_comm, next_pid)
-
-        if next_pid in pmap:
-            # Corrupted trace probably due to dropped events.  We
-            # don't know when the pid in pmap finished.  We just
-            # ignore it and don't plot it
-            warn_str = "Corrupted trace (dropped events) for PID {} at time {}". \
-                       format(next_pid, index)
-            warnings.warn(warn_str)
-            del pmap[next_pid]
-            del data[name][-1]
-
-        if next_pid != 0 and not next_comm.startswith("migration"):
-
-            if execnames and next_comm not in execnames:
-                continue
-
-            if pids and next_pid not in pids:
-                continue
-
-            data[name].append([index, end_idx, row["__cpu"]])
-            pmap[next_pid] = name
-            procs.add(name)
+    intervals = get_task_intervals(data_frame, execnames, pids)
+    names = (intervals["comm"] + "-" + intervals["pid"].astype(str)).tolist()
+    procs = set(names)
+
+    # Tasks whose intervals were all dropped are still in data
+    data = collections.defaultdict(list, ((name, []) for name in procs))
+    known_end = intervals["end"].notnull().to_numpy()
+    for (name, start, end, cpu) in zip(
+            [name for (name, known) in zip(names, known_end) if known],
+            intervals["start"][known_end].tolist(),
+            intervals["end"][known_end].tolist(),
+            intervals["cpu"][known_end].tolist()):
+        data[name].append([start, end, cpu])
 
     return data, procs, [start_idx, end_idx]
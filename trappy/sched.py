@@ -19,8 +19,14 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import print_function
 
+import warnings
+
+import numpy as np
+import pandas as pd
+
 from trappy.base import Base
 from trappy.dynamic import register_ftrace_parser, register_dynamic_ftrace
+from trappy.utils import listify
 
 class SchedLoadAvgSchedGroup(Base):
     """Corresponds to Linux kernel trace event sched_load_avg_sched_group"""
@@ -118,8 +124,97 @@ class SchedSwitch(Base):
 
         super(SchedSwitch, self).create_dataframe()
 
+    def task_intervals(self, execnames=None, pids=None):
+        """Return the intervals during which each task ran
+
+        See :func:`get_task_intervals`.  The intervals of each task can
+        be plotted with :class:`trappy.plotter.EventPlot.EventPlot`:
+        ::
+
+            intervals = trace.sched_switch.task_intervals().dropna()
+            data = {comm: dfr[["start", "end", "cpu"]].to_numpy()
+                    for (comm, dfr) in intervals.groupby("comm")}
+        """
+        return get_task_intervals(self.data_frame, execnames, pids)
+
 register_ftrace_parser(SchedSwitch, "sched")
 
+def get_task_intervals(sched_switch, execnames=None, pids=None):
+    """Return the intervals during which each task ran on a CPU
+
+    A task runs from the sched_switch to it until the next sched_switch
+    from it, or until the last sched_switch of the trace.  The idle task
+    and the migration threads are left out.  If a task is switched to
+    again before it was switched from, the events in between were
+    dropped: its interval is kept with an unknown end and a warning is
+    raised.
+
+    The intervals are computed for all the tasks at once, by sorting the
+    switches from and to each pid.
+
+    :param sched_switch: The :mod:`pandas.DataFrame` of the sched_switch
+        events of a trace
+    :param execnames: Only keep the tasks with these names
+    :param pids: Only keep the tasks with these pids
+
+    :type sched_switch: :mod:`pandas.DataFrame`
+    :type execnames: list or str
+    :type pids: list or int
+
+    :returns: A :mod:`pandas.DataFrame` with one interval per row, in
+        the order in which they start, and the columns "start", "end"
+        (NaN if unknown), "cpu", "pid" and "comm"
+    """
+    times = sched_switch.index.to_numpy()
+    prev_pids = sched_switch["prev_pid"].to_numpy()
+    next_pids = sched_switch["next_pid"].to_numpy()
+    next_comms = sched_switch["next_comm"].astype(str)
+    num_switches = len(times)
+
+    runs_task = (next_pids != 0) & \
+                ~next_comms.str.startswith("migration").to_numpy()
+    if execnames:
+        runs_task &= next_comms.isin(listify(execnames)).to_numpy()
+    if pids:
+        runs_task &= np.isin(next_pids, listify(pids))
+
+    # All the switches from and to each pid, in the order of the trace.
+    # In the same sched_switch, the switch from a pid comes first.
+    switch_pids = np.concatenate([prev_pids, next_pids])
+    switch_rows = np.tile(np.arange(num_switches), 2)
+    switch_to = np.repeat([False, True], num_switches)
+    order = np.lexsort((switch_to, switch_rows, switch_pids))
+    (switch_pids, switch_rows, switch_to) = (switch_pids[order],
+                                             switch_rows[order],
+                                             switch_to[order])
+
+    # Each interval ends with the next switch of its pid
+    starts = np.flatnonzero(switch_to & runs_task[switch_rows])
+    starts = starts[np.argsort(switch_rows[starts], kind="stable")]
+    following = np.minimum(starts + 1, len(switch_pids) - 1)
+    has_following = (starts + 1 < len(switch_pids)) & \
+                    (switch_pids[following] == switch_pids[starts])
+    ended = has_following & ~switch_to[following]
+    dropped = has_following & switch_to[following]
+
+    ends = np.full(len(starts), times[-1] if num_switches else np.nan,
+                   dtype=float)
+    ends[ended] = times[switch_rows[following[ended]]]
+    ends[dropped] = np.nan
+
+    for row in np.sort(switch_rows[following[dropped]]):
+        warnings.warn("Corrupted trace (dropped events) for PID {} at time {}"
+                      .format(next_pids[row], times[row]))
+
+    rows = switch_rows[starts]
+    return pd.DataFrame({
+        "start": times[rows],
+        "end": ends,
+        "cpu": sched_switch["__cpu"].to_numpy()[rows],
+        "pid": next_pids[rows],
+        "comm": next_comms.to_numpy()[rows],
+    }, columns=["start", "end", "cpu", "pid", "comm"])
+
 class SchedCpuFrequency(Base):
     """Corresponds to Linux kernel trace event power/cpu_frequency"""
 
@@ -59,17 +59,23 @@ class SysTrace(GenericFTrace):
 
     """
 
+    # The trace is embedded in an html file, which doesn't grow by
+    # appending lines to the trace
+    _cache_extensible = False
+
     def __init__(self, path=".", name="", normalize_time=True, scope="all",
-                 events=[], window=(0, None), abs_window=(0, None)):
+                 events=[], window=(0, None), abs_window=(0, None),
+                 parallel=None, cache_dir=None, lazy=False):
 
         self.trace_path = path
 
         super(SysTrace, self).__init__(name, normalize_time, scope, events,
-                                       window, abs_window)
+                                       window, abs_window, parallel, cache_dir,
+                                       lazy)
 
         try:
             self._cpus = 1 + self.sched_switch.data_frame["__cpu"].max()
-        except AttributeError:
+        except (AttributeError, KeyError):
             pass
 
     def trace_hasnt_started(self):
@@ -0,0 +1,229 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A collection of traces that are loaded when they are used"""
+
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+from past.builtins import basestring
+import os
+
+import pandas as pd
+
+from trappy.ftrace import FTrace, _cache_trace
+
+# Parameters of the reductions of a TraceSet, set in the worker
+# processes by _init_reduce_worker().  They are inherited through fork()
+# so that the function can be a lambda.
+_reduce_job = {}
+
+def _init_reduce_worker(func, kwargs):
+    _reduce_job["func"] = func
+    _reduce_job["kwargs"] = kwargs
+
+def _reduce_trace(job):
+    """Load a trace and apply the function of the reduction to it"""
+    (name, path) = job
+    kwargs = dict(_reduce_job["kwargs"])
+    # A worker of the pool can't have a pool of its own
+    kwargs.pop("parallel", None)
+
+    trace = FTrace(path, name=name, **kwargs)
+    return _reduce_job["func"](trace)
+
+class TraceSet(object):
+    """A collection of traces, each one loaded the first time it is used
+
+    The traces are :class:`trappy.ftrace.FTrace` objects, created with
+    the same parameters.  They can be accessed by name, and operations on
+    all the traces go through the cache of each trace, so that they don't
+    all have to be in memory at the same time:
+    ::
+
+        traces = trappy.TraceSet({"base": "run1", "new": "run2"},
+                                 scope="sched")
+        freqs = traces.concat("cpu_frequency")
+        num_switches = traces.map(lambda t: len(t.sched_switch.data_frame))
+
+    :param traces: The paths of the traces.  It can be a dictionary of
+        paths indexed by the name of the traces, a list of (name, path)
+        tuples, or a list of paths, which are then the names of the
+        traces.
+    :param workers: Number of processes used to parse the traces and in
+        :meth:`map`.  It defaults to the number of CPUs.
+    :param max_loaded: Maximum number of traces that are kept in memory.
+        The least recently used trace is dropped when another one is
+        loaded, it's read from its cache if it's used again.  If None,
+        the default, all the traces accessed by name are kept.  Whatever
+        its value, :meth:`concat` and :meth:`map` drop the traces they
+        load once they have used them, only the traces that were already
+        loaded stay in memory.
+    :param kwargs: The parameters of :class:`trappy.ftrace.FTrace` for
+        all the traces
+
+    :type traces: dict or list
+    :type workers: int
+    :type max_loaded: int
+    """
+
+    def __init__(self, traces, workers=None, max_loaded=None, **kwargs):
+        if isinstance(traces, dict):
+            traces = list(traces.items())
+
+        self.paths = OrderedDict()
+        for trace in traces:
+            (name, path) = (trace, trace) if isinstance(trace, basestring) \
+                           else trace
+            if name in self.paths:
+                raise ValueError("Two traces are named {}".format(name))
+            self.paths[name] = path
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_loaded = max_loaded
+        self.ftrace_kwargs = kwargs
+        self.__loaded = OrderedDict()
+
+    @property
+    def names(self):
+        """The names of the traces, in order"""
+        return list(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        """Iterate over the traces, loading each one in turn"""
+        for name in self.paths:
+            yield self[name]
+
+    def __getitem__(self, name):
+        """Return a trace, loading it if needed
+
+        :raises KeyError: if there is no trace called name
+        """
+        if name in self.__loaded:
+            self.__loaded.move_to_end(name)
+            return self.__loaded[name]
+
+        trace = FTrace(self.paths[name], name=name, **self.ftrace_kwargs)
+        self.__loaded[name] = trace
+        if self.max_loaded is not None:
+            while len(self.__loaded) > self.max_loaded:
+                self.__loaded.popitem(last=False)
+
+        return trace
+
+    def __use_traces(self):
+        """Iterate over the traces, dropping the ones it loads after use"""
+        for name in self.paths:
+            loaded = self.is_loaded(name)
+            yield self[name]
+            if not loaded:
+                self.__loaded.pop(name, None)
+
+    def is_loaded(self, name):
+        """Whether the trace called name is in memory"""
+        return name in self.__loaded
+
+    def __get_pool(self, num_jobs, initializer=None, initargs=()):
+        """Return a pool of processes for num_jobs jobs, or None"""
+        import multiprocessing
+
+        workers = min(self.workers, num_jobs)
+        if workers <= 1:
+            return None
+        return multiprocessing.get_context("fork").Pool(
+            workers, initializer, initargs)
+
+    def cache(self):
+        """Create the cache of the traces that are not loaded
+
+        The traces are parsed in a pool of processes, so that loading
+        them afterwards only has to read their cache.
+        """
+        if FTrace.disable_cache:
+            return
+
+        jobs = [(path, self.ftrace_kwargs) for (name, path)
+                in self.paths.items() if name not in self.__loaded]
+        pool = self.__get_pool(len(jobs))
+        if pool is None:
+            return
+        try:
+            for _ in pool.imap_unordered(_cache_trace, jobs):
+                pass
+        finally:
+            pool.terminate()
+
+    def concat(self, event, columns=None):
+        """Return the events of all the traces in a single DataFrame
+
+        :param event: The name of the event, e.g. "cpu_frequency"
+        :param columns: Only keep these columns of the events, or all of
+            them if None
+
+        :type event: str
+        :type columns: list
+
+        :returns: A :mod:`pandas.DataFrame` indexed by the name of the
+            trace and the time of the events.  Traces without any of
+            these events are not in it.
+        """
+        self.cache()
+
+        (names, dfrs) = ([], [])
+        for trace in self.__use_traces():
+            dfr = getattr(trace, event).data_frame
+            if dfr.empty:
+                continue
+            if columns is not None:
+                dfr = dfr[columns]
+            names.append(trace.name)
+            dfrs.append(dfr)
+
+        if not dfrs:
+            return pd.DataFrame(columns=columns, index=pd.MultiIndex.from_arrays(
+                [[], []], names=["trace", "Time"]))
+
+        return pd.concat(dfrs, keys=names, names=["trace", "Time"], sort=False)
+
+    def map(self, func):
+        """Apply a function to each trace in a pool of processes
+
+        Each worker loads the trace, from its cache if it has one, and
+        calls func with it, so only the results are sent back.  They
+        must be picklable, func doesn't have to.
+
+        :param func: Function that receives a trace
+        :type func: callable
+
+        :returns: A dictionary of the results indexed by the name of the
+            traces, in the order of the traces
+        """
+        pool = self.__get_pool(len(self), _init_reduce_worker,
+                               (func, self.ftrace_kwargs))
+        if pool is None:
+            return OrderedDict((trace.name, func(trace))
+                               for trace in self.__use_traces())
+
+        try:
+            results = pool.map(_reduce_trace, list(self.paths.items()))
+        finally:
+            pool.terminate()
+
+        return OrderedDict(zip(self.paths, results))
@@ -0,0 +1,964 @@
+#    Copyright 2017 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Read the binary trace.dat files recorded by trace-cmd
+
+:class:`TraceDat` decodes the ring buffer pages of a trace.dat file
+without running "trace-cmd report".  The fields of the events are
+decoded with numpy, one event type at a time, and handed to the trappy
+parsers either as columns (for the events whose print format is a
+list of "key=value" pairs, or that are parsed raw) or as the text
+that "trace-cmd report" would have printed.
+
+Only the "flyrecord" layout of version 6 of the file format is
+supported.
+"""
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+from builtins import object
+from builtins import range
+import bisect
+import collections
+import heapq
+import io
+import mmap
+import re
+import struct
+
+import numpy as np
+
+from trappy.exception import TrappyParseError
+
+TRACE_DAT_MAGIC = b"\x17\x08\x44tracing"
+
+# Special values of type_len in the header of the ring buffer events
+_TYPE_PADDING = 29
+_TYPE_TIME_EXTEND = 30
+_TYPE_TIME_STAMP = 31
+
+_TS_SHIFT = 27
+
+# Events whose text is written by the user (trace_printk(), trace_marker...)
+PRINT_EVENTS = ("print", "bprint", "bputs")
+
+FIELD_RE = re.compile(r"\s*field:(?P<decl>[^;]+);\s*offset:(?P<offset>\d+);"
+                      r"\s*size:(?P<size>\d+);(?:\s*signed:(?P<signed>\d+);)?")
+PRINT_FMT_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+CONVERSION_RE = re.compile(r"%(?P<flags>[-+ #0]*)(?P<width>\d+|\*)?"
+                           r"(?:\.(?P<prec>\d+|\*))?"
+                           r"(?P<length>hh|h|ll|l|L|q|j|z|Z|t)?"
+                           r"(?P<conv>p[a-zA-Z]*|[diouxXcs%])")
+CAST_RE = re.compile(r"^\(\s*(?:(?:unsigned|signed|const|struct|enum)\s+)*"
+                     r"\w+(?:\s+\w+)*\s*\**\s*\)\s*")
+# The data of a line of text, after the name of the event and the prefix
+# added by trace_printk() or the trace_marker
+EVENT_DATA_RE = re.compile(r"(\w+:\s+)+(?P<data>.+)")
+
+_C_ESCAPES = {"n": "\n", "t": "\t", '"': '"', "\\": "\\", "'": "'"}
+
+class TraceDatError(TrappyParseError):
+    pass
+
+def _unescape(text):
+    return re.sub(r"\\(.)", lambda m: _C_ESCAPES.get(m.group(1), m.group(1)),
+                  text)
+
+def _split_args(text):
+    """Split the arguments of a print fmt at the commas that are not nested"""
+    args = []
+    depth = 0
+    current = ""
+    in_string = False
+    for char in text:
+        if in_string:
+            current += char
+            if char == '"' and not current.endswith('\\"'):
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            args.append(current.strip())
+            current = ""
+            continue
+        current += char
+
+    if current.strip():
+        args.append(current.strip())
+
+    return args
+
+def _strip_expression(expr):
+    """Remove the casts and the parenthesis around an argument"""
+    while True:
+        stripped = CAST_RE.sub("", expr.strip())
+        if stripped.startswith("(") and stripped.endswith(")") and \
+           len(_split_args(stripped[1:-1])) == 1 and \
+           stripped.count("(") == 1:
+            stripped = stripped[1:-1]
+        if stripped == expr:
+            return expr
+        expr = stripped
+
+class Field(object):
+    """A field of an event, as described in its format file"""
+
+    def __init__(self, decl, offset, size, signed):
+        self.offset = offset
+        self.size = size
+        self.signed = signed
+        self.data_loc = decl.startswith("__data_loc")
+
+        if self.data_loc:
+            decl = decl[len("__data_loc"):].strip()
+
+        match = re.match(r"(?P<type>.*?)\s*(?P<name>\w+)\s*(?:\[(?P<len>\w*)\])?$",
+                         decl)
+        self.type = match.group("type").replace("[]", "").strip()
+        self.name = match.group("name")
+        self.is_array = self.data_loc or match.group("len") is not None or \
+                        size == 0
+        self.is_string = self.is_array and self.type in ("char",
+                                                         "unsigned char",
+                                                         "const char")
+        self.is_pointer = "*" in self.type
+
+    def elem_size(self, long_size):
+        """Size of the elements of an array field"""
+        type_sizes = [("long long", 8), ("long", long_size), ("short", 2),
+                      ("char", 1), ("64", 8), ("32", 4), ("16", 2), ("8", 1)]
+        for type_name, size in type_sizes:
+            if type_name in self.type:
+                return size
+        return 4
+
+class EventFormat(object):
+    """The format of an event, as found in the trace.dat
+
+    :param text: The content of the format file of the event
+    :type text: str
+    """
+
+    def __init__(self, text, system=""):
+        self.system = system
+        self.name = re.search(r"^name:\s*(\S+)", text, re.MULTILINE).group(1)
+        self.id = int(re.search(r"^ID:\s*(\d+)", text, re.MULTILINE).group(1))
+        self.fields = []
+        self.common_fields = []
+
+        for match in FIELD_RE.finditer(text):
+            signed = match.group("signed")
+            field = Field(match.group("decl").strip(),
+                          int(match.group("offset")),
+                          int(match.group("size")),
+                          signed == "1")
+            if field.name.startswith("common_"):
+                self.common_fields.append(field)
+            else:
+                self.fields.append(field)
+
+        self.print_fmt = None
+        self.print_args = []
+
+        match = re.search(r"^print fmt:\s*(.*)$", text, re.MULTILINE)
+        if match:
+            fmt_and_args = match.group(1).strip()
+            strings = []
+            pos = 0
+            while True:
+                str_match = PRINT_FMT_RE.match(fmt_and_args, pos)
+                if not str_match:
+                    break
+                strings.append(_unescape(str_match.group(1)))
+                pos = str_match.end()
+                while pos < len(fmt_and_args) and fmt_and_args[pos] == " ":
+                    pos += 1
+
+            if strings:
+                self.print_fmt = "".join(strings)
+                args = fmt_and_args[pos:].lstrip(",")
+                self.print_args = _split_args(args)
+
+    def get_field(self, name):
+        """Return the :class:`Field` called name or None"""
+        for field in self.fields + self.common_fields:
+            if field.name == name:
+                return field
+        return None
+
+class _Conversion(object):
+    """A printf conversion of a print fmt and the argument it prints"""
+
+    def __init__(self, match, arg):
+        self.spec = match.group(0)
+        self.flags = match.group("flags") or ""
+        self.width = match.group("width")
+        self.prec = match.group("prec")
+        self.length = match.group("length") or ""
+        self.conv = match.group("conv")
+        self.arg = arg
+
+    def int_bits(self, long_size):
+        if self.length in ("ll", "L", "q", "j"):
+            return 64
+        if self.length in ("l", "z", "Z", "t"):
+            return long_size * 8
+        if self.length == "h":
+            return 16
+        if self.length == "hh":
+            return 8
+        return 32
+
+    def python_spec(self):
+        """printf spec that python's % operator understands"""
+        conv = self.conv
+        if conv in ("i", "u"):
+            conv = "d"
+        elif conv.startswith("p"):
+            conv = "s"
+
+        spec = "%" + self.flags
+        if self.width and self.width != "*":
+            spec += self.width
+        if self.prec and self.prec != "*":
+            spec += "." + self.prec
+        return spec + conv
+
+class TraceDat(object):
+    """A trace.dat file recorded with trace-cmd
+
+    :param path: Path to the trace.dat file
+    :type path: str
+
+    The headers of the file are read when the object is created.  The
+    events are only read by :meth:`read_records`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = io.open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except ValueError:
+            raise TraceDatError("{} is empty".format(path))
+        self._buf = np.frombuffer(self._mmap, dtype=np.uint8)
+        self._pos = 0
+
+        self.formats = {}
+        self.cmdlines = {}
+        self.printk_formats = {}
+        self.cpu_data = []
+        self._kallsyms_addrs = []
+        self._kallsyms_names = []
+        self._records = None
+
+        self.__read_headers()
+
+    def close(self):
+        """Release the file mapping"""
+        self._buf = None
+        self._records = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __read(self, size):
+        data = self._mmap[self._pos:self._pos + size]
+        if len(data) < size:
+            raise TraceDatError("Truncated trace.dat: {}".format(self.path))
+        self._pos += size
+        return data
+
+    def __read_int(self, fmt):
+        fmt = self.endian + fmt
+        (value,) = struct.unpack_from(fmt, self._mmap, self._pos)
+        self._pos += struct.calcsize(fmt)
+        return value
+
+    def __read_cstring(self):
+        end = self._mmap.find(b"\0", self._pos)
+        if end < 0:
+            raise TraceDatError("Truncated trace.dat: {}".format(self.path))
+        string = self._mmap[self._pos:end].decode("utf-8", "replace")
+        self._pos = end + 1
+        return string
+
+    def __read_text(self, size_fmt):
+        size = self.__read_int(size_fmt)
+        return self.__read(size).decode("utf-8", "replace")
+
+    def __read_headers(self):
+        if self.__read(len(TRACE_DAT_MAGIC)) != TRACE_DAT_MAGIC:
+            raise TraceDatError("{} is not a trace.dat file".format(self.path))
+
+        self.endian = "<"
+        self.version = self.__read_cstring()
+        if self.version != "6":
+            raise TraceDatError("Unsupported trace.dat version {}".format(
+                self.version))
+
+        self.endian = ">" if ord(self.__read(1)) else "<"
+        self.long_size = ord(self.__read(1))
+        self.page_size = self.__read_int("I")
+
+        self.__read_header_page()
+        self.__read_header_event()
+
+        for _ in range(self.__read_int("I")):
+            self.__add_format(self.__read_text("Q"), "ftrace")
+
+        for _ in range(self.__read_int("I")):
+            system = self.__read_cstring()
+            for _ in range(self.__read_int("I")):
+                self.__add_format(self.__read_text("Q"), system)
+
+        self.__parse_kallsyms(self.__read_text("I"))
+        self.__parse_printk(self.__read_text("I"))
+        self.__parse_cmdlines(self.__read_text("Q"))
+
+        self.cpus = self.__read_int("I")
+
+        section = self.__read(10)
+        if section.startswith(b"options"):
+            while self.__read_int("H"):
+                size = self.__read_int("I")
+                self._pos += size
+            section = self.__read(10)
+
+        if not section.startswith(b"flyrecord"):
+            raise TraceDatError("Unsupported trace.dat section {!r}".format(
+                section.rstrip(b"\0")))
+
+        for _ in range(self.cpus):
+            offset = self.__read_int("Q")
+            size = self.__read_int("Q")
+            self.cpu_data.append((offset, size))
+
+    def __read_header_page(self):
+        if self.__read_cstring() != "header_page":
+            raise TraceDatError("Corrupted header_page in " + self.path)
+
+        fields = {}
+        for match in FIELD_RE.finditer(self.__read_text("Q")):
+            name = match.group("decl").split()[-1]
+            fields[name] = (int(match.group("offset")), int(match.group("size")))
+
+        self._commit_offset, self._commit_size = fields["commit"]
+        self._page_data_offset = fields["data"][0]
+
+    def __read_header_event(self):
+        if self.__read_cstring() != "header_event":
+            raise TraceDatError("Corrupted header_event in " + self.path)
+        self.__read_text("Q")
+
+    def __add_format(self, text, system):
+        try:
+            event_format = EventFormat(text, system)
+        except AttributeError:
+            # Not an event format (e.g. the header of the ftrace system)
+            return
+        self.formats[event_format.id] = event_format
+
+    def __parse_kallsyms(self, text):
+        symbols = []
+        for line in text.splitlines():
+            parts = line.split()
+            # Addresses are zeroed if kptr_restrict is set, ignore them
+            if len(parts) >= 3 and int(parts[0], 16):
+                symbols.append((int(parts[0], 16), parts[2]))
+
+        symbols.sort()
+        self._kallsyms_addrs = [addr for (addr, _) in symbols]
+        self._kallsyms_names = [name for (_, name) in symbols]
+
+    def __parse_printk(self, text):
+        for line in text.splitlines():
+            match = re.match(r'\s*0x([0-9a-fA-F]+)\s*:\s*"(.*)"\s*$', line)
+            if match:
+                self.printk_formats[int(match.group(1), 16)] = \
+                    _unescape(match.group(2))
+
+    def __parse_cmdlines(self, text):
+        for line in text.splitlines():
+            parts = line.split(None, 1)
+            if len(parts) == 2:
+                self.cmdlines[int(parts[0])] = parts[1]
+
+    def get_format(self, name):
+        """Return the :class:`EventFormat` of the event called name or None"""
+        for event_format in self.formats.values():
+            if event_format.name == name:
+                return event_format
+        return None
+
+    def comm(self, pid):
+        """The name of the task with the given pid, as trace-cmd prints it"""
+        if pid == 0:
+            return "<idle>"
+        return self.cmdlines.get(pid, "<...>")
+
+    def symbol(self, addr):
+        """The name of the kernel function that contains addr"""
+        idx = bisect.bisect_right(self._kallsyms_addrs, addr) - 1
+        if idx < 0:
+            return "0x{:x}".format(addr)
+        return self._kallsyms_names[idx]
+
+    def __read_cpu_records(self, cpu):
+        """Walk the ring buffer pages of a cpu
+
+        Return a tuple of lists with the timestamp (in nanoseconds), the
+        offset in the file of the data of each event and its length.
+
+        """
+        offset, size = self.cpu_data[cpu]
+        mem = self._mmap
+        endian = self.endian
+        u32 = struct.Struct(endian + "I")
+        u64 = struct.Struct(endian + "Q")
+        commit = struct.Struct(endian + ("Q" if self._commit_size == 8 else "I"))
+        little = endian == "<"
+        delta_mask = (1 << _TS_SHIFT) - 1
+
+        timestamps = []
+        offsets = []
+        lengths = []
+
+        for page in range(offset, offset + size, self.page_size):
+            (timestamp,) = u64.unpack_from(mem, page)
+            (page_size,) = commit.unpack_from(mem, page + self._commit_offset)
+            # The upper bits of commit are flags (missed events...)
+            page_size &= (1 << 27) - 1
+            pos = page + self._page_data_offset
+            end = pos + page_size
+
+            while pos < end:
+                (header,) = u32.unpack_from(mem, pos)
+                pos += 4
+                if little:
+                    type_len = header & 0x1f
+                    delta = header >> 5
+                else:
+                    type_len = header >> _TS_SHIFT
+                    delta = header & delta_mask
+
+                if type_len == _TYPE_PADDING:
+                    if not delta:
+                        break
+                    pos += u32.unpack_from(mem, pos)[0]
+                elif type_len == _TYPE_TIME_EXTEND:
+                    timestamp += (u32.unpack_from(mem, pos)[0] << _TS_SHIFT) + delta
+                    pos += 4
+                elif type_len == _TYPE_TIME_STAMP:
+                    timestamp = (u32.unpack_from(mem, pos)[0] << _TS_SHIFT) + delta
+                    pos += 4
+                elif type_len == 0:
+                    length = u32.unpack_from(mem, pos)[0] - 4
+                    length = (length + 3) & ~3
+                    timestamp += delta
+                    timestamps.append(timestamp)
+                    offsets.append(pos + 4)
+                    lengths.append(length)
+                    pos += 4 + length
+                else:
+                    length = type_len * 4
+                    timestamp += delta
+                    timestamps.append(timestamp)
+                    offsets.append(pos)
+                    lengths.append(length)
+                    pos += length
+
+        return timestamps, offsets, lengths
+
+    def read_records(self):
+        """Read the events of all the cpus, in the order trace-cmd reports them
+
+        Return a dict of numpy arrays: "ts" (the timestamp in
+        nanoseconds), "cpu", "offset" (the position in the file of the
+        data of the event), "length", "id" (the common_type of the
+        event) and "pid".
+
+        """
+        if self._records is not None:
+            return self._records
+
+        per_cpu = [self.__read_cpu_records(cpu) for cpu in range(self.cpus)]
+
+        timestamps = np.array([ts for (cpu_ts, _, _) in per_cpu for ts in cpu_ts],
+                              dtype=np.uint64)
+        offsets = np.array([off for (_, cpu_off, _) in per_cpu for off in cpu_off],
+                           dtype=np.int64)
+        lengths = np.array([l for (_, _, cpu_len) in per_cpu for l in cpu_len],
+                           dtype=np.int64)
+        cpus = np.repeat(np.arange(self.cpus),
+                         [len(cpu_ts) for (cpu_ts, _, _) in per_cpu])
+
+        # trace-cmd report merges the cpus picking the earliest event
+        # at the head of each cpu's buffer, ties going to the lowest
+        # cpu.  That's a stable sort if the buffers are sorted.
+        bounds = np.cumsum([0] + [len(cpu_ts) for (cpu_ts, _, _) in per_cpu])
+        if all((np.diff(timestamps[begin:end].astype(np.int64)) >= 0).all()
+               for begin, end in zip(bounds[:-1], bounds[1:])):
+            order = np.argsort(timestamps, kind="mergesort")
+        else:
+            streams = [zip(cpu_ts, [cpu] * len(cpu_ts),
+                           range(bounds[cpu], bounds[cpu + 1]))
+                       for cpu, (cpu_ts, _, _) in enumerate(per_cpu)]
+            order = np.array([idx for (_, _, idx) in heapq.merge(*streams)],
+                             dtype=np.int64)
+
+        records = {
+            "ts": timestamps[order],
+            "cpu": cpus[order],
+            "offset": offsets[order],
+            "length": lengths[order],
+        }
+        records["id"] = self.__gather_int(records["offset"], 0, 2, False)
+        pid_field = (self.get_format("sched_switch") or
+                     next(iter(self.formats.values()))).get_field("common_pid")
+        records["pid"] = self.__gather_int(records["offset"], pid_field.offset,
+                                           pid_field.size, True)
+
+        self._records = records
+        return records
+
+    def __gather_int(self, offsets, field_offset, size, signed):
+        """Read an integer at offsets + field_offset, vectorized"""
+        if not len(offsets):
+            return np.array([], dtype=np.int64)
+
+        if size not in (1, 2, 4, 8):
+            size = 8 if size > 8 else 4
+
+        idx = (offsets + field_offset)[:, None] + np.arange(size)
+        raw = np.ascontiguousarray(self._buf[idx])
+        dtype = np.dtype("{}{}{}".format(self.endian, "i" if signed else "u",
+                                         size))
+        values = raw.view(dtype).ravel()
+        if signed or size < 8:
+            return values.astype(np.int64)
+        return values.astype(np.uint64)
+
+    def __gather_bytes(self, offsets, lengths):
+        mem = self._mmap
+        return [mem[off:off + length] for off, length in zip(offsets, lengths)]
+
+    def __field_bytes(self, field, records):
+        """The raw bytes of a field (array or string) for each record"""
+        offsets = records["offset"]
+        if field.data_loc:
+            data_loc = self.__gather_int(offsets, field.offset, 4, False)
+            return self.__gather_bytes(offsets + (data_loc & 0xffff),
+                                       data_loc >> 16)
+        if field.size == 0:
+            starts = offsets + field.offset
+            return self.__gather_bytes(starts, records["length"] - field.offset)
+        return self.__gather_bytes(offsets + field.offset,
+                                   np.full(len(offsets), field.size))
+
+    def __field_strings(self, field, records):
+        return [data.split(b"\0", 1)[0].decode("utf-8", "replace")
+                for data in self.__field_bytes(field, records)]
+
+    def __field_arrays(self, field, records, elem_size=None):
+        elem_size = elem_size or field.elem_size(self.long_size)
+        fmt = "{}{}".format(self.endian, {1: "B", 2: "H", 4: "I", 8: "Q"}
+                            .get(elem_size, "B"))
+        return [list(np.frombuffer(data[:len(data) - len(data) % elem_size],
+                                   dtype=fmt))
+                for data in self.__field_bytes(field, records)]
+
+    def __field_bitmasks(self, field, records):
+        masks = []
+        for data in self.__field_bytes(field, records):
+            words = [struct.unpack_from(self.endian + ("Q" if self.long_size == 8
+                                                       else "I"), data, pos)[0]
+                     for pos in range(0, len(data) - self.long_size + 1,
+                                      self.long_size)]
+            value = sum(word << (8 * self.long_size * i)
+                        for (i, word) in enumerate(words))
+            digits = "{:0{}x}".format(value, 2 * len(data))
+            groups = [digits[max(end - 8, 0):end]
+                      for end in range(len(digits), 0, -8)]
+            masks.append(",".join(reversed(groups)))
+        return masks
+
+    def __evaluate(self, event_format, arg, records):
+        """Evaluate an argument of a print fmt for each record
+
+        Return a tuple (kind, values) where kind is "int", "str" or
+        "array", or None if the argument is not supported.
+
+        """
+        expr = _strip_expression(arg)
+
+        match = re.match(r"^REC->(\w+)$", expr)
+        if match:
+            field = event_format.get_field(match.group(1))
+            if field is None:
+                return None
+            if field.is_string:
+                return ("str", self.__field_strings(field, records))
+            if field.is_array:
+                return ("array", self.__field_arrays(field, records))
+            return ("int", self.__gather_int(records["offset"], field.offset,
+                                             field.size, field.signed))
+
+        match = re.match(r"^__get_str\((\w+)\)$", expr)
+        if match:
+            field = event_format.get_field(match.group(1))
+            if field is None:
+                return None
+            return ("str", self.__field_strings(field, records))
+
+        match = re.match(r"^__get_bitmask\((\w+)\)$", expr)
+        if match:
+            field = event_format.get_field(match.group(1))
+            if field is None:
+                return None
+            return ("str", self.__field_bitmasks(field, records))
+
+        match = re.match(r"^__print_array\(__get_dynamic_array\((\w+)\)\s*,"
+                         r"\s*(.+?)\s*,\s*(\d+)\s*\)$", expr)
+        if match:
+            field = event_format.get_field(match.group(1))
+            if field is None:
+                return None
+            arrays = self.__field_arrays(field, records, int(match.group(3)))
+            count = self.__evaluate(event_format, match.group(2), records)
+            if count and count[0] == "int":
+                arrays = [array[:num] for (array, num) in zip(arrays, count[1])]
+            return ("array", arrays)
+
+        return None
+
+    def __conversions(self, event_format, records):
+        """Parse the print fmt of an event and evaluate its arguments
+
+        Return a list of literal strings and :class:`_Conversion`
+        objects or None if the print fmt can't be evaluated.
+
+        """
+        if event_format.print_fmt is None:
+            return None
+
+        pieces = []
+        args = list(event_format.print_args)
+        pos = 0
+        for match in CONVERSION_RE.finditer(event_format.print_fmt):
+            pieces.append(event_format.print_fmt[pos:match.start()])
+            pos = match.end()
+            if match.group("conv") == "%":
+                pieces.append("%")
+                continue
+            if match.group("width") == "*" or match.group("prec") == "*" or \
+               not args:
+                return None
+            evaluated = self.__evaluate(event_format, args.pop(0), records)
+            if evaluated is None:
+                return None
+            pieces.append(_Conversion(match, evaluated))
+
+        pieces.append(event_format.print_fmt[pos:])
+        return [piece for piece in pieces if piece != ""]
+
+    def __convert_ints(self, conversion):
+        """Interpret the integer values of an argument like printf would"""
+        values = np.asarray(conversion.arg[1])
+        if conversion.conv in ("d", "i", "u", "x", "X", "o", "c"):
+            bits = conversion.int_bits(self.long_size)
+            kind = "int" if conversion.conv in ("d", "i") else "uint"
+            values = values.astype("{}{}".format(kind, bits))
+        return values
+
+    def __format_values(self, conversion):
+        """The text printed by a conversion for each record"""
+        kind, values = conversion.arg
+
+        if kind == "array":
+            return ["{{{}}}".format(" ".join(str(val) for val in array))
+                    for array in values]
+
+        spec = conversion.python_spec()
+        if kind == "str":
+            if spec[-1] != "s":
+                spec = "%s"
+            return [spec % val for val in values]
+
+        if conversion.conv in ("pf", "pF", "ps", "pS"):
+            return [spec % self.symbol(int(val)) for val in values]
+        if conversion.conv.startswith("p"):
+            return ["0x{:x}".format(int(val)) for val in values]
+        if conversion.conv == "s":
+            # A pointer to a string, look it up in the printk formats
+            return [spec % self.printk_formats.get(int(val), "")
+                    for val in values]
+
+        values = self.__convert_ints(conversion)
+        if conversion.conv == "c":
+            return [spec % chr(val & 0xff) for val in values.tolist()]
+        return [spec % val for val in values.tolist()]
+
+    def __raw_items(self, event_format, records):
+        """Key/value pairs of the fields of an event for each record"""
+        items = []
+        for field in event_format.fields:
+            if field.is_string:
+                items.append((field.name, ("str",
+                                           self.__field_strings(field, records))))
+            elif field.is_array:
+                items.append((field.name, ("array",
+                                           self.__field_arrays(field, records))))
+            else:
+                values = self.__gather_int(records["offset"], field.offset,
+                                           field.size, field.signed)
+                items.append((field.name, ("int", values)))
+        return items
+
+    def __keyval_items(self, pieces):
+        """Split the pieces of a print fmt of the form "k1=%d k2=%s ..."
+
+        Return a list of (key, conversion) tuples, or None if the print
+        fmt is not a list of key=value pairs.
+
+        """
+        items = []
+        key = None
+        for piece in pieces:
+            if isinstance(piece, _Conversion):
+                if key is None:
+                    return None
+                items.append((key, piece))
+                key = None
+                continue
+
+            text = piece
+            if items and key is None:
+                # Text that closes the previous value, e.g. the "}" of
+                # {%s} or the space separating the pairs
+                if text.startswith("}") and items[-1][1].arg[0] == "array":
+                    text = text[1:]
+                if text and not text[0].isspace():
+                    return None
+
+            tokens = text.split()
+            if not tokens:
+                continue
+            if len(tokens) > 1:
+                # Constant key=value text, e.g. the "type=0 " of
+                # "type=0 cpu=%d", is not supported
+                return None
+            last = tokens[-1]
+            if text[-1].isspace() or not (last.endswith("=") or
+                                          last.endswith("={")):
+                return None
+            key = last.rstrip("{").rstrip("=")
+            if not key or not re.match(r"^[\w.]+$", key):
+                return None
+
+        if key is not None or not items:
+            return None
+        return items
+
+    def __columns_from_items(self, items):
+        """Typed columns out of key/value pairs
+
+        Integers are stored as int64 numpy arrays, strings are
+        converted to int if they look like one (like trappy does when
+        parsing the text of the trace) and arrays are exploded in one
+        column per element.
+
+        """
+        from trappy.base import Base
+
+        columns = collections.OrderedDict()
+        for key, value in items:
+            if isinstance(value, _Conversion):
+                conversion = value
+                kind = conversion.arg[0]
+                if kind == "int" and conversion.conv in ("d", "i", "u"):
+                    values = self.__convert_ints(conversion)
+                else:
+                    kind = "str" if kind == "int" else kind
+                    values = conversion.arg[1] if kind == "array" else \
+                             self.__format_values(conversion)
+            else:
+                kind, values = value
+
+            if kind == "int":
+                values = np.asarray(values)
+                if values.dtype == np.uint64 and len(values) and \
+                   values.max() >= 2**63:
+                    values = np.array([int(val) for val in values], dtype=object)
+                else:
+                    values = values.astype(np.int64)
+                columns[key] = values
+            elif kind == "str":
+                cast = {string: Base.string_cast_int(string)
+                        for string in set(values)}
+                columns[key] = [cast[string] for string in values]
+            else:
+                max_len = max(len(array) for array in values) if values else 0
+                for idx in range(max_len):
+                    columns["{}{}".format(key, idx)] = np.array(
+                        [int(array[idx]) if idx < len(array) else 0
+                         for array in values], dtype=np.int64)
+
+        return columns
+
+    def decode_event(self, event_format, records, raw=False, columns=True):
+        """Decode the records of an event
+
+        :param event_format: The format of the events in records
+        :type event_format: :class:`EventFormat`
+
+        :param records: A dict of arrays like the one returned by
+            :meth:`read_records`, restricted to the records of the event
+        :type records: dict
+
+        :param raw: Use the fields of the event, like "trace-cmd report
+            -r" does, instead of its print fmt
+        :type raw: bool
+
+        :param columns: Try to decode the event into columns
+        :type columns: bool
+
+        Return a tuple (columns, data).  If the event could be split in
+        columns, columns is an ordered dict of column names and sequence
+        of values and data is None.  Otherwise columns is None and data
+        is a list of strings with the text of each event.
+
+        """
+        pieces = None if raw else self.__conversions(event_format, records)
+
+        if pieces is None:
+            items = self.__raw_items(event_format, records)
+            if columns:
+                return self.__columns_from_items(items), None
+            text_items = []
+            for key, (kind, values) in items:
+                if kind == "array":
+                    values = ["{{{}}}".format(" ".join(str(val) for val in array))
+                              for array in values]
+                elif kind == "int":
+                    values = values.tolist()
+                text_items.append(["{}={}".format(key, val) for val in values])
+            return None, [" ".join(fields) for fields in zip(*text_items)] \
+                if text_items else [""] * len(records["offset"])
+
+        if columns:
+            items = self.__keyval_items(pieces)
+            if items is not None:
+                return self.__columns_from_items(items), None
+
+        texts = []
+        for piece in pieces:
+            if isinstance(piece, _Conversion):
+                texts.append(self.__format_values(piece))
+            else:
+                texts.append([piece] * len(records["offset"]))
+        return None, ["".join(parts).strip() for parts in zip(*texts)]
+
+    def __format_bprint(self, fmt, data):
+        """Format the binary arguments of a trace_printk() like vbin_printf()"""
+        out = []
+        pos = 0
+        last = 0
+        for match in CONVERSION_RE.finditer(fmt):
+            out.append(fmt[last:match.start()])
+            last = match.end()
+            conversion = _Conversion(match, None)
+            conv = conversion.conv
+            if conv == "%":
+                out.append("%")
+                continue
+
+            if match.group("width") == "*" or match.group("prec") == "*":
+                # Skip the width argument, it's an int
+                pos = (pos + 3) & ~3
+                pos += 4
+
+            if conv == "s":
+                end = data.find(b"\0", pos)
+                end = len(data) if end < 0 else end
+                value = data[pos:end].decode("utf-8", "replace")
+                pos = (end + 1 + 3) & ~3
+                out.append(conversion.python_spec() % value)
+                continue
+
+            if conv.startswith("p"):
+                size = self.long_size
+            else:
+                size = conversion.int_bits(self.long_size) // 8
+                size = max(size, 4)
+
+            pos = (pos + size - 1) & ~(size - 1)
+            if pos + size > len(data):
+                break
+            signed = conv in ("d", "i")
+            fmt_char = {4: "i", 8: "q"}[size]
+            fmt_char = fmt_char if signed else fmt_char.upper()
+            (value,) = struct.unpack_from(self.endian + fmt_char, data, pos)
+            pos += size
+
+            if conv in ("pf", "pF", "ps", "pS"):
+                out.append(self.symbol(value))
+            elif conv.startswith("p"):
+                out.append("0x{:x}".format(value))
+            elif conv == "c":
+                out.append(chr(value & 0xff))
+            else:
+                out.append(conversion.python_spec() % value)
+
+        out.append(fmt[last:])
+        return "".join(out)
+
+    def print_texts(self, event_format, records):
+        """The text of print, bprint and bputs events as trace-cmd prints it
+
+        The ip of the event is resolved to a function name, so events
+        written to the trace_marker start with "tracing_mark_write: ".
+
+        """
+        ip_field = event_format.get_field("ip")
+        if event_format.name != "bprint" or ip_field is None:
+            _, texts = self.decode_event(event_format, records, columns=False)
+            return texts
+
+        fmt_field = event_format.get_field("fmt")
+        buf_field = event_format.get_field("buf")
+        ips = self.__gather_int(records["offset"], ip_field.offset,
+                                ip_field.size, False)
+        fmts = self.__gather_int(records["offset"], fmt_field.offset,
+                                 fmt_field.size, False)
+        bufs = self.__field_bytes(buf_field, records)
+
+        return ["{}: {}".format(self.symbol(int(ip)),
+                                self.__format_bprint(
+                                    self.printk_formats.get(int(fmt), ""),
+                                    buf)).strip()
+                for (ip, fmt, buf) in zip(ips, fmts, bufs)]
@@ -18,6 +18,10 @@
 from __future__ import division
 from __future__ import unicode_literals
 
+from builtins import object
+import numpy as np
+import pandas as pd
+
 def listify(to_select):
     """Utitlity function to handle both single and
     list inputs
@@ -28,6 +32,36 @@ def listify(to_select):
 
     return to_select
 
+class SymbolTable(object):
+    """Map strings that repeat a lot, like task names, to integer codes
+
+    A trace shares one table among its parsers so that each distinct
+    string is stored only once while the trace is parsed.
+    """
+
+    def __init__(self):
+        self.symbols = []
+        self.__codes = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def intern(self, symbol):
+        """Return the code of a string, adding it to the table if needed"""
+        try:
+            return self.__codes[symbol]
+        except KeyError:
+            code = len(self.symbols)
+            self.__codes[symbol] = code
+            self.symbols.append(symbol)
+            return code
+
+    def lookup(self, codes):
+        """Return a :mod:`numpy.ndarray` with the strings of a sequence of codes"""
+        symbols = np.empty(len(self.symbols), dtype=object)
+        symbols[:] = self.symbols
+        return symbols[np.asarray(codes, dtype=np.intp)]
+
 def handle_duplicate_index(data,
                            max_delta=0.000001):
     """Handle duplicate values in index
@@ -78,35 +112,31 @@ def handle_duplicate_index(data,
     if '__line' in data:
         data.sort_values(['Time', '__line'], inplace=True)
 
-    index = data.index
-    new_index = index.values
-
-    dups = index[index.duplicated()].unique()
-
-    for dup in dups:
-        # Leave one of the values intact
-        dup_index_left = index.searchsorted(dup, side="left")
-        dup_index_right = index.searchsorted(dup, side="right") - 1
-        num_dups = dup_index_right - dup_index_left + 1
-
-        # Calculate delta that needs to be added to each duplicate
-        # index
-        try:
-            delta = (index[dup_index_right + 1] - dup) / num_dups
-        except IndexError:
-            # dup_index_right + 1 is outside of the series (i.e. the
-            # dup is at the end of the series).
-            delta = max_delta
-
-        # Clamp the maximum delta added to max_delta
-        if delta > max_delta:
-            delta = max_delta
-
-        # Add a delta to the others
-        dup_index_left += 1
-        while dup_index_left <= dup_index_right:
-            new_index[dup_index_left] += delta
-            delta += delta
-            dup_index_left += 1
-
-    return data.reindex(new_index)
+    index = data.index.values
+
+    # Duplicates are the values equal to the previous one, the first
+    # value of each run of equal values is left intact
+    is_dup = np.zeros(len(index), dtype=bool)
+    is_dup[1:] = index[1:] == index[:-1]
+    if not is_dup.any():
+        return data
+
+    run_starts = np.flatnonzero(~is_dup)
+    run_ids = np.cumsum(~is_dup) - 1
+    run_lengths = np.diff(np.append(run_starts, len(index)))
+    ranks = np.arange(len(index)) - run_starts[run_ids]
+
+    # The duplicates of a run are spread in the gap up to the next value,
+    # with a delta that is clamped to max_delta
+    deltas = np.empty(len(run_starts))
+    deltas[:-1] = (index[run_starts[1:]] - index[run_starts[:-1]]) / \
+                  run_lengths[:-1]
+    deltas[-1] = max_delta
+    deltas = np.minimum(deltas, max_delta)
+
+    # The delta doubles for every duplicate after the first one
+    offsets = np.ldexp(deltas[run_ids], np.maximum(ranks - 1, 0))
+    new_index = np.where(is_dup, index + offsets, index)
+
+    return data.set_axis(pd.Index(new_index, name=data.index.name),
+                         axis=0)